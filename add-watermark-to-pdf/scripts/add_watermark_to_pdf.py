@@ -12,6 +12,7 @@ import logging
 import argparse
 import lazypdf as lz
 from datetime import datetime
+from functools import partial
 
 # Program name for log prefix
 PROGRAM_NAME = "PDF Background Watermark Adder"
@@ -24,6 +25,7 @@ input_foldername = 'input'
 output_foldername = 'output'
 log_foldername = 'logs'
 log_filename = f"{timestamp}_log.log"
+metrics_filename = f"{timestamp}_metrics.jsonl"
 
 # Define paths
 path_script = os.path.realpath(__file__)
@@ -32,54 +34,78 @@ path_input = os.path.join(path_project, input_foldername)
 path_output = os.path.join(path_project, output_foldername)
 path_log_folder = os.path.join(path_project, log_foldername)
 path_log = os.path.join(path_log_folder, log_filename)
+path_metrics = os.path.join(path_log_folder, metrics_filename)
 
-# Set up logging with program name as prefix in each log entry
-os.makedirs(path_log_folder, exist_ok=True)
-log_format = f"{PROGRAM_NAME}: %(message)s"
-logging.basicConfig(level=logging.DEBUG, format=log_format)
-
-# Configure file handler with the same format
-file_handler = logging.FileHandler(path_log)
-file_handler.setFormatter(logging.Formatter(log_format))
-logging.getLogger().addHandler(file_handler)
-
-# Argument parser setup
-parser = argparse.ArgumentParser(description="Add an image watermark to the background of each page in PDF files.")
-parser.add_argument("--watermark-path", type=str, required=True, help="Path to the image watermark file.")
-parser.add_argument("--watermark-transparency", type=float, default=0.5, help="Transparency level of the watermark (0.0 to 1.0). Default is 0.5.")
-args = parser.parse_args()
-
-# Verify watermark file
-watermark_path = args.watermark_path
-if not os.path.exists(watermark_path):
-    logging.error(f"Watermark file not found: {watermark_path}")
-    sys.exit()
-
-# Process each PDF in the input folder
-input_pdf_files = [f for f in os.listdir(path_input) if f.endswith(".pdf")]
-logging.info(f"Found {len(input_pdf_files)} PDF file(s) to process.")
-
-if not input_pdf_files:
-    logging.warning("No PDF files found in the input folder. Exiting.")
-    sys.exit()
-
-# Apply the watermark as a background
-for pdf_file in input_pdf_files:
-    pdf_path = os.path.join(path_input, pdf_file)
-    logging.info(f"Processing file: {pdf_file}")
-
-    try:
-        os.makedirs(path_output, exist_ok=True)
-        output_filename = f"{timestamp}_{pdf_file.split('.')[0]}_watermarked.pdf"
-        output_path = os.path.join(path_output, output_filename)
+# Make the shared modules in the repository root importable
+sys.path.insert(0, os.path.dirname(path_project))
+from common import metrics
+from common.batch_runner import add_batch_arguments, run_batch
+from common.discovery import add_discovery_arguments, discover_files, input_filter_from_args, output_folder_for
+from common.logging_setup import setup_logging
+from common.page_windows import add_window_arguments, process_in_windows
 
-        lz.read(pdf_path).add_image_watermark(
-            watermark_path, opacity=args.watermark_transparency, overlay=False
-        ).to_pdf(output_path)
-        logging.info(f"Watermarked PDF saved to {output_filename}")
 
-    except Exception as e:
-        logging.error(f"Failed to process {pdf_file} - {e}")
+# Apply the watermark as a background to a single PDF file (runs inside a worker process when --workers > 1)
+def watermark_pdf_file(pdf_file, timestamp, watermark_path, watermark_transparency, window_pages):
+    pdf_path = os.path.join(path_input, pdf_file)
+    logging.info(f"Processing file: {pdf_file}")
 
-logging.info("PDF Background Watermark Addition Process Completed Successfully")
-logging.info(f"Total PDF files processed: {len(input_pdf_files)}")
+    output_folder = output_folder_for(path_output, pdf_file)
+    output_filename = f"{timestamp}_{os.path.basename(pdf_file).split('.')[0]}_watermarked.pdf"
+    output_path = os.path.join(output_folder, output_filename)
+
+    if window_pages:
+        # Page-independent operation applied to one window of pages at a time
+        process_in_windows(pdf_path, output_path,
+                           lambda pdf, first_page: pdf.add_image_watermark(
+                               watermark_path, opacity=watermark_transparency, overlay=False),
+                           window_pages)
+    else:
+        with metrics.stage("read"):
+            pdf = lz.read(pdf_path)
+        metrics.record(pages=pdf.page_count)
+        with metrics.stage("operation"):
+            pdf = pdf.add_image_watermark(watermark_path, opacity=watermark_transparency, overlay=False)
+        with metrics.stage("write"):
+            pdf.to_pdf(output_path)
+    logging.info(f"Watermarked PDF saved to {output_filename}")
+    return output_path
+
+
+if __name__ == "__main__":
+    # Argument parser setup
+    parser = argparse.ArgumentParser(description="Add an image watermark to the background of each page in PDF files.")
+    parser.add_argument("--watermark-path", type=str, required=True, help="Path to the image watermark file.")
+    parser.add_argument("--watermark-transparency", type=float, default=0.5, help="Transparency level of the watermark (0.0 to 1.0). Default is 0.5.")
+    add_window_arguments(parser)
+    add_discovery_arguments(parser, ["*.pdf"])
+    add_batch_arguments(parser)
+    args = parser.parse_args()
+
+    # Set up queued console and rotating file logging with program name as prefix in each log entry
+    setup_logging(f"{PROGRAM_NAME}: %(message)s", path_log, args)
+
+    # Verify watermark file
+    watermark_path = os.path.abspath(args.watermark_path)
+    if not os.path.exists(watermark_path):
+        logging.error(f"Watermark file not found: {watermark_path}")
+        sys.exit()
+
+    # Stream the matching files, processing starts while the input folder is still being scanned
+    input_filter = input_filter_from_args(args)
+    input_pdf_files = discover_files(path_input, input_filter, recursive=args.recursive)
+
+    # Apply the watermark as a background
+    summary = run_batch(partial(watermark_pdf_file, timestamp=timestamp, watermark_path=watermark_path,
+                                watermark_transparency=args.watermark_transparency,
+                                window_pages=args.window_pages),
+                        input_pdf_files, args, path_input, path_output,
+                        path_metrics=path_metrics, file_filter=input_filter)
+
+    # Check if there were any PDF files to process
+    if not summary.results and not args.watch:
+        logging.warning("No PDF files found in the input folder. Exiting.")
+        sys.exit()
+
+    logging.info("PDF Background Watermark Addition Process Completed Successfully")
+    logging.info(f"Total PDF files processed: {len(summary.results)}")
@@ -0,0 +1,9 @@
+call activate sandbox
+python scripts/generate_corpus.py
+python scripts/run_benchmarks.py
+:: Use the options below to generate the full corpus (10,000-page document) or to compare settings:
+::python scripts/generate_corpus.py --scale full
+::python scripts/run_benchmarks.py --tools compress-pdf --compression-level 9 --img-quality 60
+::python scripts/run_benchmarks.py --tools flatten-pdf --dpi 150
+::python scripts/first_page_benchmark.py --latency-ms 200 --bandwidth-kb 125
+PAUSE
\ No newline at end of file
@@ -0,0 +1,363 @@
+# -*- coding: utf-8 -*-
+
+# ==============================================================================
+#   Author: João Manoel Feck
+#   Email: joaomfeck@gmail.com
+#   GitHub: https://github.com/jmfeck
+# ==============================================================================
+
+import os
+import re
+import sys
+import csv
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+import http.client
+import http.server
+import urllib.parse
+import pymupdf
+from pymupdf import mupdf
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+# Program name for log prefix
+PROGRAM_NAME = "First Page Benchmark"
+
+# Set up timestamp
+timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+# Folder paths
+corpus_foldername = 'corpus'
+output_foldername = 'output'
+
+# Define paths
+path_script = os.path.realpath(__file__)
+path_project = os.path.dirname(os.path.dirname(path_script))
+path_corpus = os.path.join(path_project, corpus_foldername)
+path_output = os.path.join(path_project, output_foldername)
+
+# Make the shared modules in the repository root importable
+sys.path.insert(0, os.path.dirname(path_project))
+from common.page_subset import object_info
+from common.pdf_output import linearization, qpdf_path, save_compressed
+
+# Output layouts compared: name -> save_compressed() arguments (None keeps the corpus file as it is)
+LAYOUTS = {
+    "original": None,
+    "xref-tables": {"object_streams": False, "linearized": False},
+    "object-streams": {"object_streams": True, "linearized": False},
+    "linearized": {"object_streams": False, "linearized": True},
+    "linearized-object-streams": {"object_streams": True, "linearized": True},
+}
+
+# Bytes a viewer reads first, from the start of the file and from its end
+PROBE_BYTES = 1024
+# Connections a browser opens to one host, the ranges of a round trip are fetched in parallel
+MAX_CONNECTIONS = 6
+# Bytes sent through the link at a time
+SEND_CHUNK = 16 * 1024
+
+# Result columns, in the order written to the CSV file
+RESULT_FIELDS = ["corpus", "file", "layout", "bytes", "saved_pct", "first_page_s", "first_page_kb", "requests",
+                 "round_trips", "full_download_s"]
+
+_RANGE = re.compile(r"bytes=(\d*)-(\d*)$")
+_STARTXREF = re.compile(rb"startxref\s+(\d+)")
+
+
+# Shared link of limited bandwidth: the responses of every connection are sent through it in turn
+class ThrottledLink:
+
+    def __init__(self, bandwidth_kb):
+        self.bytes_per_s = bandwidth_kb * 1024
+        self._lock = threading.Lock()
+        self._free_at = 0.0
+
+    def send(self, wfile, data):
+        for start in range(0, len(data), SEND_CHUNK):
+            chunk = data[start:start + SEND_CHUNK]
+            with self._lock:
+                self._free_at = max(time.perf_counter(), self._free_at) + len(chunk) / self.bytes_per_s
+                sent_at = self._free_at
+            time.sleep(max(0.0, sent_at - time.perf_counter()))
+            wfile.write(chunk)
+
+
+# Stand-in for the web server the PDFs are served from: answers single-range requests
+# ("Range: bytes=start-end" or "bytes=-suffix") after the given latency, through the throttled link
+class RangeRequestHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        path = os.path.join(self.server.directory, os.path.basename(urllib.parse.unquote(self.path)))
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        size = os.path.getsize(path)
+        start, end, status = 0, size - 1, 200
+        match = _RANGE.match(self.headers.get("Range", ""))
+        if match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(end, int(match.group(2))) if match.group(2) else end
+            else:
+                start = max(0, size - int(match.group(2)))
+            status = 206
+        time.sleep(self.server.latency)
+        with open(path, "rb") as pdf_file:
+            pdf_file.seek(start)
+            data = pdf_file.read(end - start + 1)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/pdf")
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(len(data)))
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{start + len(data) - 1}/{size}")
+        self.end_headers()
+        self.server.link.send(self.wfile, data)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server(directory, latency_ms, bandwidth_kb):
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), RangeRequestHandler)
+    server.daemon_threads = True
+    server.directory = directory
+    server.latency = latency_ms / 1000
+    server.link = ThrottledLink(bandwidth_kb)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# Fetch byte ranges of one file from the server, counting requests and bytes received
+class RangeClient:
+
+    def __init__(self, port, filename):
+        self.port = port
+        self.url = "/" + urllib.parse.quote(filename)
+        self.requests = 0
+        self.received = 0
+        self._lock = threading.Lock()
+
+    # Bytes start to end (exclusive) of the file, the whole file when both are None,
+    # or its last `end` bytes when only start is None
+    def get(self, start=None, end=None):
+        headers = {}
+        if end is not None:
+            headers["Range"] = f"bytes={start}-{end - 1}" if start is not None else f"bytes=-{end}"
+        connection = http.client.HTTPConnection("127.0.0.1", self.port)
+        try:
+            connection.request("GET", self.url, headers=headers)
+            data = connection.getresponse().read()
+        finally:
+            connection.close()
+        with self._lock:
+            self.requests += 1
+            self.received += len(data)
+        return data
+
+    # Fetch the ranges of one round trip in parallel
+    def get_all(self, ranges):
+        with ThreadPoolExecutor(MAX_CONNECTIONS) as executor:
+            return list(executor.map(lambda byte_range: self.get(*byte_range), ranges))
+
+
+# Byte ranges of the objects a viewer reads, after the xref, to show page 1, grouped by round trip:
+# the objects referenced by an object are only known once it has arrived. Objects in an object
+# stream are read with the whole stream. The layout is read from the local copy, standing in for
+# the parsing a viewer does on the bytes it receives.
+def first_page_rounds(path, fetched):
+    document = pymupdf.open(path)
+    try:
+        pdf = mupdf.pdf_document_from_fz_document(document.this)
+        entries = {}
+        for xref in range(1, document.xref_length()):
+            entry = mupdf.ll_pdf_get_xref_entry_no_null(pdf.m_internal, xref)
+            entries[xref] = (entry.type, entry.ofs)
+        offsets = sorted(offset for kind, offset in entries.values() if kind == "n") + [os.path.getsize(path)]
+
+        def object_range(xref):
+            kind, offset = entries.get(xref, ("f", 0))
+            if kind == "o":
+                kind, offset = entries[offset]
+            if kind != "n":
+                return None
+            return offset, next(end for end in offsets if end > offset)
+
+        page_xrefs = {document.page_xref(index) for index in range(document.page_count)}
+        tree = [xref for xref in range(1, document.xref_length())
+                if document.xref_get_key(xref, "Type")[1] == "/Pages"]
+        # Page tree nodes from the root down to page 1
+        path_to_page = [document.page_xref(0)]
+        while True:
+            parent_type, parent = document.xref_get_key(path_to_page[-1], "Parent")
+            if parent_type != "xref":
+                break
+            path_to_page.append(int(parent.split()[0]))
+        path_to_page.reverse()
+
+        def references(xref):
+            if xref == document.pdf_catalog():
+                return path_to_page[:1]
+            if xref in path_to_page[:-1]:
+                return [path_to_page[path_to_page.index(xref) + 1]]
+            return [reference for reference in object_info(document, xref, {})[1]
+                    if reference not in page_xrefs and reference not in tree]
+
+        rounds, level, seen = [], [document.pdf_catalog()], set()
+        while level:
+            seen.update(level)
+            ranges = {object_range(xref) for xref in level} - {None}
+            ranges = sorted(byte_range for byte_range in ranges if byte_range not in fetched)
+            fetched.update(ranges)
+            if ranges:
+                rounds.append(ranges)
+            level = sorted({reference for xref in level for reference in references(xref)} - seen)
+        return rounds
+    finally:
+        document.close()
+
+
+# Time until a viewer fetching byte ranges has every byte of page 1, as a browser does with a
+# PDF served with "Accept-Ranges". It first reads the start and the end of the file. A linearized
+# file then needs one more request, for the first page section (up to /E, the hint tables
+# included). Otherwise the viewer reads the xref, then the objects page 1 needs, level by level.
+def time_to_first_page(client, path):
+    size = os.path.getsize(path)
+    start_time = time.perf_counter()
+    head, tail = client.get_all([(0, min(PROBE_BYTES, size)), (None, min(PROBE_BYTES, size))])
+    round_trips = 1
+    params = linearization(head)
+    if params is not None:
+        if params["E"] > len(head):
+            client.get(len(head), params["E"])
+            round_trips += 1
+    else:
+        startxref = int(_STARTXREF.findall(tail)[-1])
+        fetched = set()
+        if startxref < size - len(tail):
+            client.get(startxref, size - len(tail))
+            round_trips += 1
+        for ranges in first_page_rounds(path, fetched):
+            client.get_all(ranges)
+            round_trips += 1
+    return time.perf_counter() - start_time, round_trips
+
+
+# Write every layout of one corpus file into work_dir, or None for the layouts that cannot be written
+def write_layouts(path, work_dir, layouts):
+    written = {}
+    for layout in layouts:
+        options = LAYOUTS[layout]
+        output_path = os.path.join(work_dir, f"{layout}_{os.path.basename(path)}")
+        if options is None:
+            shutil.copyfile(path, output_path)
+        else:
+            document = pymupdf.open(path)
+            try:
+                save_compressed(document, output_path, **options)
+            finally:
+                document.close()
+        written[layout] = output_path
+    return written
+
+
+def _parse_list(value, choices, label, parser):
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in choices]
+    if unknown:
+        parser.error(f"Unknown {label}: {', '.join(unknown)}")
+    return names
+
+
+if __name__ == "__main__":
+    # Argument parser setup
+    parser = argparse.ArgumentParser(description="Compare the size and time to first page of the compress-pdf "
+                                                 "output layouts, served by a local range-request server.")
+    parser.add_argument("--corpus", type=str, default="text-heavy,scanned,many-pages",
+                        help="Comma-separated corpora to measure. Default: text-heavy,scanned,many-pages.")
+    parser.add_argument("--layouts", type=str, default=None,
+                        help=f"Comma-separated layouts to compare. Default: all ({', '.join(LAYOUTS)}); "
+                             "the linearized ones are skipped when qpdf is not installed.")
+    parser.add_argument("--latency-ms", type=float, default=100,
+                        help="Latency added to every request, in milliseconds. Default: 100.")
+    parser.add_argument("--bandwidth-kb", type=float, default=250,
+                        help="Bandwidth of the link the server sends through, in KB/s. Default: 250 (2 Mbit/s).")
+    args = parser.parse_args()
+
+    # Set up logging with program name as prefix in each log entry
+    log_format = f"{PROGRAM_NAME}: %(message)s"
+    logging.basicConfig(level=logging.INFO, format=log_format)
+
+    corpora = _parse_list(args.corpus, os.listdir(path_corpus) if os.path.isdir(path_corpus) else [],
+                          "corpus (run generate_corpus.py first)", parser)
+    layouts = _parse_list(args.layouts, LAYOUTS, "layout", parser) if args.layouts else list(LAYOUTS)
+    if any(LAYOUTS[layout] and LAYOUTS[layout]["linearized"] for layout in layouts):
+        try:
+            qpdf_path()
+        except RuntimeError as error:
+            logging.warning(f"{error} Skipping the linearized layouts.")
+            layouts = [layout for layout in layouts if not (LAYOUTS[layout] and LAYOUTS[layout]["linearized"])]
+    settings = {"latency_ms": args.latency_ms, "bandwidth_kb": args.bandwidth_kb, "layouts": layouts}
+
+    logging.info("Starting First Page Benchmark")
+    logging.info(f"Settings: {settings}")
+
+    work_dir = tempfile.mkdtemp(prefix="bench_first_page_")
+    server = start_server(work_dir, args.latency_ms, args.bandwidth_kb)
+    results = []
+    try:
+        for corpus in corpora:
+            path_set = os.path.join(path_corpus, corpus)
+            for filename in sorted(f for f in os.listdir(path_set) if f.lower().endswith(".pdf")):
+                written = write_layouts(os.path.join(path_set, filename), work_dir, layouts)
+                original_bytes = os.path.getsize(os.path.join(path_set, filename))
+                for layout, path in written.items():
+                    client = RangeClient(server.server_address[1], os.path.basename(path))
+                    first_page_s, round_trips = time_to_first_page(client, path)
+                    result = {"corpus": corpus, "file": filename, "layout": layout, "bytes": os.path.getsize(path),
+                              "saved_pct": round(100 * (1 - os.path.getsize(path) / original_bytes), 1),
+                              "first_page_s": round(first_page_s, 3),
+                              "first_page_kb": round(client.received / 1024, 1), "requests": client.requests,
+                              "round_trips": round_trips}
+                    start_time = time.perf_counter()
+                    client.get()
+                    result["full_download_s"] = round(time.perf_counter() - start_time, 3)
+                    results.append(result)
+                    logging.info(f"{corpus}/{filename} {layout}: {result['bytes']} bytes "
+                                 f"({result['saved_pct']}% saved), first page after {result['first_page_s']}s "
+                                 f"({result['first_page_kb']} KB, {round_trips} round trip(s)), "
+                                 f"full download {result['full_download_s']}s")
+                    os.remove(path)
+    finally:
+        server.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    # Average of each layout over every file
+    for layout in layouts:
+        rows = [result for result in results if result["layout"] == layout]
+        if rows:
+            logging.info(f"{layout}: {sum(row['saved_pct'] for row in rows) / len(rows):.1f}% saved, first page "
+                         f"after {sum(row['first_page_s'] for row in rows) / len(rows):.3f}s, full download "
+                         f"{sum(row['full_download_s'] for row in rows) / len(rows):.3f}s on average")
+
+    # Save the results as JSON (with the settings) and as a flat CSV table
+    os.makedirs(path_output, exist_ok=True)
+    path_json = os.path.join(path_output, f"{timestamp}_first_page.json")
+    with open(path_json, "w", encoding="utf-8") as json_file:
+        json.dump({"timestamp": timestamp, "settings": settings, "results": results}, json_file, indent=2)
+
+    path_csv = os.path.join(path_output, f"{timestamp}_first_page.csv")
+    with open(path_csv, "w", encoding="utf-8", newline="") as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=RESULT_FIELDS)
+        writer.writeheader()
+        writer.writerows(results)
+
+    logging.info(f"Results saved to {path_json} and {path_csv}")
+    logging.info("First Page Benchmark Completed")
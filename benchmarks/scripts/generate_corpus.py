@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+
+# ==============================================================================
+#   Author: João Manoel Feck
+#   Email: joaomfeck@gmail.com
+#   GitHub: https://github.com/jmfeck
+# ==============================================================================
+
+import io
+import os
+import sys
+import random
+import shutil
+import zipfile
+import logging
+import argparse
+import pymupdf
+from PIL import Image, ImageCms
+
+# Program name for log prefix
+PROGRAM_NAME = "Benchmark Corpus Generator"
+
+# Folder paths
+corpus_foldername = 'corpus'
+
+# Define paths
+path_script = os.path.realpath(__file__)
+path_project = os.path.dirname(os.path.dirname(path_script))
+path_corpus = os.path.join(path_project, corpus_foldername)
+
+# Fixed metadata so that the same seed always produces byte-identical files
+FIXED_METADATA = {
+    "producer": "python-pdf-tools benchmark corpus",
+    "creator": "generate_corpus.py",
+    "creationDate": "D:20240101000000+00'00'",
+    "modDate": "D:20240101000000+00'00'",
+}
+
+WORDS = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore "
+    "et dolore magna aliqua enim ad minim veniam quis nostrud exercitation ullamco laboris nisi aliquip "
+    "ex ea commodo consequat duis aute irure in reprehenderit voluptate velit esse cillum eu fugiat nulla "
+    "pariatur excepteur sint occaecat cupidatat non proident sunt culpa qui officia deserunt mollit anim "
+    "id est laborum invoice total amount balance statement account period customer reference"
+).split()
+
+# Corpus sizes per scale: (number of files, pages per file)
+CORPUS_SIZES = {
+    "small": {
+        "text-heavy": (5, 20),
+        "scanned": (3, 5),
+        "many-pages": (1, 1000),
+        "many-small-files": (200, 1),
+        "shared-resources": (100, 1),
+        "table-heavy": (5, 10),
+        "forms-annotations": (5, 5),
+        "images": (10, 1),
+        "html": (5, 1),
+        "docx": (3, 1),
+    },
+    "full": {
+        "text-heavy": (20, 50),
+        "scanned": (10, 20),
+        "many-pages": (1, 10000),
+        "many-small-files": (2000, 1),
+        "shared-resources": (1000, 2),
+        "table-heavy": (20, 20),
+        "forms-annotations": (20, 10),
+        "images": (50, 1),
+        "html": (20, 1),
+        "docx": (10, 1),
+    },
+}
+
+
+def _sentence(rng, length):
+    return " ".join(rng.choice(WORDS) for _ in range(length)).capitalize() + "."
+
+
+def _paragraphs(rng, count):
+    return "\n\n".join(" ".join(_sentence(rng, rng.randint(6, 16)) for _ in range(rng.randint(3, 6)))
+                       for _ in range(count))
+
+
+def _save(doc, path):
+    doc.set_metadata(FIXED_METADATA)
+    doc.save(path, garbage=3, deflate=True, no_new_id=True)
+    doc.close()
+
+
+def _add_text_page(doc, rng):
+    page = doc.new_page(width=595, height=842)
+    page.insert_textbox(pymupdf.Rect(50, 50, 545, 792), _paragraphs(rng, 6), fontsize=10, fontname="helv")
+    return page
+
+
+# Text-only documents, the typical born-digital report
+def make_text_pdf(path, rng, pages):
+    doc = pymupdf.open()
+    for _ in range(pages):
+        _add_text_page(doc, rng)
+    _save(doc, path)
+
+
+# Image-only pages that look like a scanner output (rendered text stored as a JPEG per page)
+def make_scanned_pdf(path, rng, pages):
+    doc = pymupdf.open()
+    source = pymupdf.open()
+    for _ in range(pages):
+        src_page = _add_text_page(source, rng)
+        pix = src_page.get_pixmap(dpi=150, colorspace=pymupdf.csRGB)
+        page = doc.new_page(width=595, height=842)
+        page.insert_image(page.rect, stream=pix.tobytes("jpeg", jpg_quality=85))
+    source.close()
+    _save(doc, path)
+
+
+# Text pages under the same letterhead logo, a JPEG with an embedded ICC profile, as the input
+# of the merge-pdf de-duplication (every file holds its own copy of the image and profile)
+def make_letterhead_pdf(path, rng, pages):
+    logo = Image.frombytes("RGB", (96, 96), random.Random("logo").randbytes(96 * 96 * 3))
+    profile = ImageCms.ImageCmsProfile(ImageCms.createProfile("sRGB")).tobytes()
+    buffer = io.BytesIO()
+    logo.save(buffer, "JPEG", quality=90, icc_profile=profile)
+    doc = pymupdf.open()
+    for _ in range(pages):
+        page = _add_text_page(doc, rng)
+        page.insert_image(pymupdf.Rect(470, 10, 530, 70), stream=buffer.getvalue())
+    _save(doc, path)
+
+
+# Pages with ruled tables full of numbers
+def make_table_pdf(path, rng, pages):
+    doc = pymupdf.open()
+    rows, cols = 30, 6
+    for _ in range(pages):
+        page = doc.new_page(width=595, height=842)
+        left, top, cell_w, cell_h = 50, 60, 82, 22
+        for row in range(rows + 1):
+            y = top + row * cell_h
+            page.draw_line((left, y), (left + cols * cell_w, y), width=0.5)
+        for col in range(cols + 1):
+            x = left + col * cell_w
+            page.draw_line((x, top), (x, top + rows * cell_h), width=0.5)
+        for row in range(rows):
+            for col in range(cols):
+                if row == 0:
+                    text = rng.choice(WORDS).upper()
+                else:
+                    text = f"{rng.uniform(0, 100000):,.2f}"
+                page.insert_text((left + col * cell_w + 4, top + row * cell_h + 15), text, fontsize=8)
+    _save(doc, path)
+
+
+# Pages with form fields and annotations, the input of the flatten tool
+def make_forms_pdf(path, rng, pages):
+    doc = pymupdf.open()
+    for page_index in range(pages):
+        page = _add_text_page(doc, rng)
+        for field_index in range(4):
+            widget = pymupdf.Widget()
+            widget.field_name = f"field_{page_index}_{field_index}"
+            widget.rect = pymupdf.Rect(60, 60 + field_index * 40, 300, 84 + field_index * 40)
+            if field_index == 3:
+                widget.field_type = pymupdf.PDF_WIDGET_TYPE_CHECKBOX
+                widget.field_value = True
+                widget.rect = pymupdf.Rect(60, 180, 80, 200)
+            else:
+                widget.field_type = pymupdf.PDF_WIDGET_TYPE_TEXT
+                widget.field_value = _sentence(rng, 3)
+            page.add_widget(widget)
+        page.add_highlight_annot(pymupdf.Rect(50, 300, 400, 320))
+        page.add_text_annot((500, 60), _sentence(rng, 8))
+        page.add_freetext_annot(pymupdf.Rect(300, 700, 545, 740), _sentence(rng, 6), fontsize=9)
+    _save(doc, path)
+
+
+def make_image_file(path, rng, pages):
+    source = pymupdf.open()
+    pix = _add_text_page(source, rng).get_pixmap(dpi=100, colorspace=pymupdf.csRGB)
+    pix.save(path)
+    source.close()
+
+
+def make_html_file(path, rng, pages):
+    body = "".join(f"<h2>{_sentence(rng, 4)}</h2><p>{_paragraphs(rng, 4)}</p>" for _ in range(6))
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(f"<html><body><h1>{_sentence(rng, 5)}</h1>{body}</body></html>")
+
+
+# Minimal Word document written by hand, with a fixed zip timestamp to stay deterministic
+def make_docx_file(path, rng, pages):
+    paragraphs = "".join(f"<w:p><w:r><w:t>{_sentence(rng, rng.randint(20, 40))}</w:t></w:r></w:p>" for _ in range(12))
+    parts = {
+        "[Content_Types].xml": (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/word/document.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+            '</Types>'),
+        "_rels/.rels": (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Target="word/document.xml" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+            '</Relationships>'),
+        "word/document.xml": (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+            f'<w:body>{paragraphs}</w:body></w:document>'),
+    }
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, content in parts.items():
+            archive.writestr(zipfile.ZipInfo(name, date_time=(2024, 1, 1, 0, 0, 0)), content)
+
+
+# Corpus name -> (generator, file extension)
+GENERATORS = {
+    "text-heavy": (make_text_pdf, ".pdf"),
+    "scanned": (make_scanned_pdf, ".pdf"),
+    "many-pages": (make_text_pdf, ".pdf"),
+    "many-small-files": (make_text_pdf, ".pdf"),
+    "shared-resources": (make_letterhead_pdf, ".pdf"),
+    "table-heavy": (make_table_pdf, ".pdf"),
+    "forms-annotations": (make_forms_pdf, ".pdf"),
+    "images": (make_image_file, ".png"),
+    "html": (make_html_file, ".html"),
+    "docx": (make_docx_file, ".docx"),
+}
+
+
+# Watermark image used by the add_image_watermark benchmark
+def make_watermark(path):
+    pix = pymupdf.Pixmap(pymupdf.csRGB, pymupdf.IRect(0, 0, 200, 200), 1)
+    pix.clear_with(200)
+    pix.save(path)
+
+
+# Generate every requested corpus into path_corpus/<name>, seeded per corpus.
+# counts ({name: number of files}) overrides the number of files of the scale, e.g. to benchmark
+# merge-pdf on 1,000, 10,000 and 50,000 inputs.
+def generate_corpus(names, scale="small", seed=42, force=False, counts=None):
+    os.makedirs(path_corpus, exist_ok=True)
+    make_watermark(os.path.join(path_corpus, "watermark.png"))
+
+    for name in names:
+        generator, extension = GENERATORS[name]
+        num_files, pages = CORPUS_SIZES[scale][name]
+        num_files = (counts or {}).get(name, num_files)
+        path_set = os.path.join(path_corpus, name)
+
+        if os.path.isdir(path_set) and not force and len(os.listdir(path_set)) == num_files:
+            logging.info(f"Corpus '{name}' already exists with {num_files} file(s), skipping")
+            continue
+        shutil.rmtree(path_set, ignore_errors=True)
+        os.makedirs(path_set)
+
+        logging.info(f"Generating corpus '{name}': {num_files} file(s) x {pages} page(s)")
+        rng = random.Random(f"{seed}:{name}")
+        for index in range(num_files):
+            generator(os.path.join(path_set, f"{name}_{index + 1:05d}{extension}"), rng, pages)
+
+
+if __name__ == "__main__":
+    # Set up logging with program name as prefix in each log entry
+    log_format = f"{PROGRAM_NAME}: %(message)s"
+    logging.basicConfig(level=logging.INFO, format=log_format)
+
+    # Argument parser setup
+    parser = argparse.ArgumentParser(description="Generate deterministic PDF corpora for the benchmarks.")
+    parser.add_argument("--corpus", type=str, default=",".join(GENERATORS),
+                        help=f"Comma-separated corpora to generate. Default: all ({', '.join(GENERATORS)}).")
+    parser.add_argument("--scale", type=str, choices=sorted(CORPUS_SIZES), default="small",
+                        help="Corpus size: 'small' (quick runs) or 'full' (includes the 10,000-page document). Default: small.")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed. Default: 42.")
+    parser.add_argument("--count", type=str, default=None, metavar="NAME=N,...",
+                        help="Number of files of some corpora, instead of the one of --scale, "
+                             "e.g. many-small-files=50000. A corpus with another number of files is regenerated.")
+    parser.add_argument("--force", action="store_true", help="Regenerate corpora that already exist.")
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.corpus.split(',') if name.strip()]
+    unknown = [name for name in names if name not in GENERATORS]
+    if unknown:
+        parser.error(f"Unknown corpus: {', '.join(unknown)}")
+
+    counts = {}
+    for item in (args.count or "").split(','):
+        if not item.strip():
+            continue
+        name, _, count = item.partition('=')
+        if name.strip() not in GENERATORS or not count.strip().isdigit() or int(count) < 1:
+            parser.error(f"--count expects NAME=N with a known corpus and N >= 1, got '{item.strip()}'")
+        counts[name.strip()] = int(count)
+
+    generate_corpus(names, scale=args.scale, seed=args.seed, force=args.force, counts=counts)
+    logging.info(f"Corpus ready in {path_corpus}")
+    sys.exit()
@@ -0,0 +1,495 @@
+# -*- coding: utf-8 -*-
+
+# ==============================================================================
+#   Author: João Manoel Feck
+#   Email: joaomfeck@gmail.com
+#   GitHub: https://github.com/jmfeck
+# ==============================================================================
+
+import os
+import re
+import sys
+import csv
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import http.server
+import pymupdf
+import lazypdf as lz
+from pymupdf import mupdf
+from datetime import datetime
+from functools import partial
+
+# Program name for log prefix
+PROGRAM_NAME = "PDF Benchmarks"
+
+# Set up timestamp
+timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+# Folder paths
+corpus_foldername = 'corpus'
+output_foldername = 'output'
+
+# Define paths
+path_script = os.path.realpath(__file__)
+path_project = os.path.dirname(os.path.dirname(path_script))
+path_corpus = os.path.join(path_project, corpus_foldername)
+path_output = os.path.join(path_project, output_foldername)
+path_watermark = os.path.join(path_corpus, "watermark.png")
+
+# Make the shared modules in the repository root importable
+sys.path.insert(0, os.path.dirname(path_project))
+from common.image_recompress import recompress_images
+from common.merge_writer import StreamingMerger, merge_parallel
+from common.metrics import peak_rss_mb, size_of
+from common.operations import run_steps
+from common.page_raster import flatten_parallel
+from common.page_subset import COMPRESSED_SAVE_OPTIONS, write_part
+
+BENCHMARK_PASSWORD = "benchmark"
+
+# Indirect reference in an object definition
+REFERENCE = re.compile(r"(\d+) 0 R")
+
+# Result columns, in the order written to the CSV file
+RESULT_FIELDS = ["tool", "corpus", "status", "files", "pages", "input_mb", "output_mb", "elapsed_s",
+                 "pages_per_s", "mb_per_s", "peak_rss_mb", "error"]
+
+
+def _stem(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+# Core operation of each tool, mirroring the lazypdf call made by its script.
+# Every function processes one input file and returns the output path(s) it wrote.
+def bench_rotate(path, out_dir, settings):
+    output_path = os.path.join(out_dir, f"{_stem(path)}.pdf")
+    lz.read(path).rotate(90).to_pdf(output_path)
+    return [output_path]
+
+
+def bench_add_page_numbers(path, out_dir, settings):
+    output_path = os.path.join(out_dir, f"{_stem(path)}.pdf")
+    lz.read(path).add_page_numbers(position="bottom-right").to_pdf(output_path)
+    return [output_path]
+
+
+def bench_add_watermark(path, out_dir, settings):
+    output_path = os.path.join(out_dir, f"{_stem(path)}.pdf")
+    lz.read(path).add_image_watermark(path_watermark, opacity=0.5, overlay=False).to_pdf(output_path)
+    return [output_path]
+
+
+def bench_resize(path, out_dir, settings):
+    output_path = os.path.join(out_dir, f"{_stem(path)}.pdf")
+    lz.read(path).resize("a4").to_pdf(output_path)
+    return [output_path]
+
+
+def bench_compress(path, out_dir, settings):
+    output_path = os.path.join(out_dir, f"{_stem(path)}.pdf")
+    if settings["img_quality"] is not None:
+        document = pymupdf.open(path)
+        try:
+            recompress_images(document, settings["img_quality"], settings.get("threads", 1))
+            document.save(output_path, **COMPRESSED_SAVE_OPTIONS)
+        finally:
+            document.close()
+    else:
+        lz.read(path).compress(compression_level=settings["compression_level"]).to_pdf(output_path)
+    return [output_path]
+
+
+def bench_convert_doc(path, out_dir, settings):
+    output_path = os.path.join(out_dir, f"{_stem(path)}.pdf")
+    lz.read_docx(path).to_pdf(output_path)
+    return [output_path]
+
+
+def bench_convert_html(path, out_dir, settings):
+    output_path = os.path.join(out_dir, f"{_stem(path)}.pdf")
+    lz.read_html(path, engine="pymupdf").to_pdf(output_path)
+    return [output_path]
+
+
+def bench_convert_img(path, out_dir, settings):
+    output_path = os.path.join(out_dir, f"{_stem(path)}.pdf")
+    lz.read_images(path, page_size="fit").to_pdf(output_path)
+    return [output_path]
+
+
+# The URL tool fetches pages over HTTP; the corpus is served from localhost to stay offline
+def bench_convert_url(url, out_dir, settings):
+    output_path = os.path.join(out_dir, f"{_stem(url)}.pdf")
+    lz.read_html(url, engine="pymupdf").to_pdf(output_path)
+    return [output_path]
+
+
+def bench_extract_images(path, out_dir, settings):
+    output_subdir = os.path.join(out_dir, _stem(path))
+    os.makedirs(output_subdir, exist_ok=True)
+    return lz.read(path).extract_images(output_subdir)
+
+
+def bench_extract_tables(path, out_dir, settings):
+    output_paths = []
+    for index, table in enumerate(lz.read(path).extract_tables(), start=1):
+        output_path = os.path.join(out_dir, f"{_stem(path)}_table_{index}.csv")
+        table.to_csv(output_path, index=False)
+        output_paths.append(output_path)
+    return output_paths
+
+
+def bench_extract_text(path, out_dir, settings, engine="text"):
+    output_path = os.path.join(out_dir, f"{_stem(path)}.txt")
+    with open(output_path, "w", encoding="utf-8") as text_file:
+        text_file.write(lz.read(path).extract_text(engine=engine, page_separator="\n--- Page {n} ---\n"))
+    return [output_path]
+
+
+def bench_extract_text_ocr(path, out_dir, settings):
+    return bench_extract_text(path, out_dir, settings, engine="ocr")
+
+
+def bench_flatten(path, out_dir, settings):
+    output_path = os.path.join(out_dir, f"{_stem(path)}.pdf")
+    if settings.get("workers", 1) > 1:
+        flatten_parallel(path, output_path, settings["dpi"], settings["workers"])
+    else:
+        lz.read(path).flatten(dpi=settings["dpi"]).to_pdf(output_path)
+    return [output_path]
+
+
+def bench_merge(paths, out_dir, settings, deduplicate=False, workers=None):
+    output_path = os.path.join(out_dir, "merged.pdf")
+    workers = settings.get("workers", 1) if workers is None else workers
+    with StreamingMerger(output_path, deduplicate=deduplicate) as merger:
+        if workers > 1:
+            merge_parallel(merger, os.path.dirname(paths[0]), [os.path.basename(path) for path in paths],
+                           workers, deduplicate=deduplicate)
+        else:
+            for path in paths:
+                merger.add(path)
+    return [output_path]
+
+
+# Raise ValueError if an object of the PDF at path references an object that does not exist,
+# e.g. a stream the de-duplication freed while something still pointed at it
+def check_references(path):
+    document = pymupdf.open(path)
+    try:
+        pdf = mupdf.pdf_document_from_fz_document(document.this)
+        for xref in range(1, document.xref_length()):
+            if not mupdf.pdf_object_exists(pdf, xref):
+                continue
+            for reference in {int(reference) for reference in REFERENCE.findall(document.xref_object(xref))}:
+                if not mupdf.pdf_object_exists(pdf, reference):
+                    raise ValueError(f"Object {xref} references the missing object {reference}")
+    finally:
+        document.close()
+
+
+# merge-pdf --dedup in one process and one batch, checked for references to freed objects
+def bench_merge_dedup(paths, out_dir, settings):
+    output_paths = bench_merge(paths, out_dir, settings, deduplicate=True, workers=1)
+    check_references(output_paths[0])
+    return output_paths
+
+
+# merge-pdf --dedup --workers: the parts are de-duplicated by the workers, then against each other
+# as they are appended (at least 2 workers, so the case covers that path without --workers)
+def bench_merge_dedup_parallel(paths, out_dir, settings):
+    output_paths = bench_merge(paths, out_dir, settings, deduplicate=True, workers=max(2, settings.get("workers", 1)))
+    check_references(output_paths[0])
+    return output_paths
+
+
+# Baseline for merge-pdf: lazypdf's own merge, which holds every input open until the output is saved
+def bench_merge_lazypdf(paths, out_dir, settings):
+    output_path = os.path.join(out_dir, "merged.pdf")
+    lz.merge(paths).to_pdf(output_path)
+    return [output_path]
+
+
+def bench_decrypt(path, out_dir, settings):
+    output_path = os.path.join(out_dir, f"{_stem(path)}.pdf")
+    lz.read(path).decrypt(BENCHMARK_PASSWORD).to_pdf(output_path)
+    return [output_path]
+
+
+def bench_encrypt(path, out_dir, settings):
+    output_path = os.path.join(out_dir, f"{_stem(path)}.pdf")
+    lz.read(path).encrypt(BENCHMARK_PASSWORD, algorithm="AES-256-R5").to_pdf(output_path)
+    return [output_path]
+
+
+def bench_pdfa(path, out_dir, settings):
+    output_path = os.path.join(out_dir, f"{_stem(path)}.pdf")
+    lz.read(path).to_pdfa(output_path, engine="pymupdf")
+    return [output_path]
+
+
+def bench_repair(path, out_dir, settings):
+    output_path = os.path.join(out_dir, f"{_stem(path)}.pdf")
+    lz.read(path).repair(engine="auto").to_pdf(output_path)
+    return [output_path]
+
+
+# Keep the first half of the pages, as "select-pdf --pages 1-N" would
+def bench_select(path, out_dir, settings):
+    output_path = os.path.join(out_dir, f"{_stem(path)}.pdf")
+    source = pymupdf.open(path)
+    write_part(source, list(range(1, max(1, source.page_count // 2) + 1)), output_path)
+    source.close()
+    return [output_path]
+
+
+# Split every page into its own file, as "split-pdf --pages 1-N" would
+def bench_split(path, out_dir, settings):
+    output_paths = []
+    source = pymupdf.open(path)
+    for page_num in range(1, source.page_count + 1):
+        output_path = os.path.join(out_dir, f"{_stem(path)}_page_{page_num}.pdf")
+        output_paths.append(write_part(source, [page_num], output_path))
+    source.close()
+    return output_paths
+
+
+def bench_pipeline(path, out_dir, settings):
+    output_path = os.path.join(out_dir, f"{_stem(path)}.pdf")
+    options = {"rotate": 90, "compression_level": settings["compression_level"],
+               "img_quality": settings["img_quality"], "threads": settings.get("threads", 1)}
+    pdf = run_steps(lz.read(path), ["repair", "rotate", "compress"], options)
+    pdf.to_pdf(output_path)
+    return [output_path]
+
+
+# Untimed preparation of the inputs a case needs (e.g. encrypted copies for the decryption tool)
+def prepare_encrypted(paths, work_dir):
+    prepared = []
+    for path in paths:
+        prepared_path = os.path.join(work_dir, os.path.basename(path))
+        lz.read(path).encrypt(BENCHMARK_PASSWORD).to_pdf(prepared_path)
+        prepared.append(prepared_path)
+    return prepared
+
+
+# Serve the corpus folder on a local port and turn the input paths into URLs
+def prepare_local_urls(paths, work_dir):
+    directory = os.path.dirname(paths[0])
+    handler = partial(http.server.SimpleHTTPRequestHandler, directory=directory)
+    handler.log_message = lambda *args: None
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+    return [f"http://127.0.0.1:{port}/{os.path.basename(path)}" for path in paths]
+
+
+# Tool name -> (benchmark function, default corpora, input extension, whole-batch operation, preparation)
+CASES = {
+    "rotate-pdf": (bench_rotate, ["text-heavy", "many-pages"], ".pdf", False, None),
+    "add-page-numbers-to-pdf": (bench_add_page_numbers, ["text-heavy", "many-pages"], ".pdf", False, None),
+    "add-watermark-to-pdf": (bench_add_watermark, ["text-heavy"], ".pdf", False, None),
+    "adjust-pdf-page-size": (bench_resize, ["text-heavy"], ".pdf", False, None),
+    "compress-pdf": (bench_compress, ["text-heavy", "scanned"], ".pdf", False, None),
+    "convert-to-pdf-from-doc": (bench_convert_doc, ["docx"], ".docx", False, None),
+    "convert-to-pdf-from-html": (bench_convert_html, ["html"], ".html", False, None),
+    "convert-to-pdf-from-img": (bench_convert_img, ["images"], ".png", False, None),
+    "convert-to-pdf-from-url": (bench_convert_url, ["html"], ".html", False, prepare_local_urls),
+    "extract-images-from-pdf": (bench_extract_images, ["scanned"], ".pdf", False, None),
+    "extract-tables-from-pdf": (bench_extract_tables, ["table-heavy"], ".pdf", False, None),
+    "extract-text-from-pdf": (bench_extract_text, ["text-heavy", "many-pages"], ".pdf", False, None),
+    "extract-text-from-pdf-ocr": (bench_extract_text_ocr, ["scanned"], ".pdf", False, None),
+    "flatten-pdf": (bench_flatten, ["forms-annotations"], ".pdf", False, None),
+    "merge-pdf": (bench_merge, ["many-small-files"], ".pdf", True, None),
+    "merge-pdf-dedup": (bench_merge_dedup, ["shared-resources"], ".pdf", True, None),
+    "merge-pdf-dedup-parallel": (bench_merge_dedup_parallel, ["shared-resources"], ".pdf", True, None),
+    "merge-pdf-lazypdf": (bench_merge_lazypdf, ["many-small-files"], ".pdf", True, None),
+    "pdf-decryption": (bench_decrypt, ["text-heavy"], ".pdf", False, prepare_encrypted),
+    "pdf-encryption": (bench_encrypt, ["text-heavy"], ".pdf", False, None),
+    "pdfa-conversion": (bench_pdfa, ["text-heavy"], ".pdf", False, None),
+    "pipeline-pdf": (bench_pipeline, ["text-heavy", "scanned"], ".pdf", False, None),
+    "repair-pdf": (bench_repair, ["text-heavy", "many-small-files"], ".pdf", False, None),
+    "select-pdf": (bench_select, ["text-heavy", "many-pages"], ".pdf", False, None),
+    "split-pdf": (bench_split, ["text-heavy"], ".pdf", False, None),
+}
+
+
+def _page_count(path):
+    if not path.lower().endswith(".pdf") or not os.path.isfile(path):
+        return 0
+    try:
+        return lz.read(path).page_count
+    except Exception:
+        return 0
+
+
+# Run one tool on one corpus inside the current process and return its measurements.
+# Called in a fresh subprocess per case, so the peak RSS belongs to that case alone.
+def run_case(tool, corpus, settings):
+    bench, _, extension, whole_batch, prepare = CASES[tool]
+    path_set = os.path.join(path_corpus, corpus)
+    input_paths = sorted(os.path.join(path_set, f) for f in os.listdir(path_set) if f.endswith(extension))
+    if not input_paths:
+        raise FileNotFoundError(f"No '{extension}' files in corpus '{corpus}'")
+
+    work_dir = tempfile.mkdtemp(prefix=f"bench_{tool}_")
+    try:
+        if prepare is not None:
+            input_paths = prepare(input_paths, work_dir)
+        out_dir = os.path.join(work_dir, "out")
+        os.makedirs(out_dir)
+
+        input_bytes = size_of(input_paths) or size_of(os.path.join(path_set, os.path.basename(path))
+                                                         for path in input_paths)
+        # Page throughput is measured on the PDF side: input pages, or output pages for the converters
+        pages = sum(_page_count(path) for path in input_paths)
+
+        start_time = time.perf_counter()
+        if whole_batch:
+            output_paths = bench(input_paths, out_dir, settings)
+        else:
+            output_paths = []
+            for path in input_paths:
+                output_paths.extend(bench(path, out_dir, settings))
+        elapsed = time.perf_counter() - start_time
+
+        if pages == 0:
+            pages = sum(_page_count(path) for path in output_paths)
+        output_bytes = size_of(output_paths)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        "files": len(input_paths),
+        "pages": pages,
+        "input_mb": round(input_bytes / (1024 * 1024), 3),
+        "output_mb": round(output_bytes / (1024 * 1024), 3),
+        "elapsed_s": round(elapsed, 4),
+        "pages_per_s": round(pages / elapsed, 2) if elapsed > 0 else None,
+        "mb_per_s": round(input_bytes / (1024 * 1024) / elapsed, 3) if elapsed > 0 else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1) if peak_rss_mb() is not None else None,
+    }
+
+
+# Spawn a fresh interpreter for one case and parse the JSON line it prints
+def run_case_subprocess(tool, corpus, settings, timeout):
+    command = [sys.executable, path_script, "--run-case", tool, corpus, "--settings", json.dumps(settings)]
+    result = {"tool": tool, "corpus": corpus}
+    try:
+        completed = subprocess.run(command, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        result.update(status="timeout", error=f"Timed out after {timeout}s")
+        return result
+
+    lines = completed.stdout.strip().splitlines()
+    if completed.returncode != 0 or not lines:
+        error = completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "no output"
+        result.update(status="error", error=error)
+        return result
+
+    result.update(json.loads(lines[-1]))
+    return result
+
+
+def _versions():
+    try:
+        import pymupdf
+        pymupdf_version = pymupdf.VersionBind
+    except (ImportError, AttributeError):
+        pymupdf_version = None
+    return {"lazypdf": getattr(lz, "__version__", None), "pymupdf": pymupdf_version,
+            "python": platform.python_version(), "platform": platform.platform()}
+
+
+def _parse_list(value, choices, label, parser):
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in choices]
+    if unknown:
+        parser.error(f"Unknown {label}: {', '.join(unknown)}")
+    return names
+
+
+if __name__ == "__main__":
+    # Argument parser setup
+    parser = argparse.ArgumentParser(description="Benchmark the core operation of every tool on the generated corpora.")
+    parser.add_argument("--tools", type=str, default=None,
+                        help=f"Comma-separated tools to benchmark. Default: all ({', '.join(CASES)}).")
+    parser.add_argument("--corpus", type=str, default=None,
+                        help="Comma-separated corpora to run every selected tool on, instead of each tool's default corpora.")
+    parser.add_argument("--compression-level", type=int, default=5, choices=range(1, 10),
+                        help="Compression level used by compress-pdf and pipeline-pdf. Default: 5.")
+    parser.add_argument("--img-quality", type=int, default=None,
+                        help="JPEG quality used to recompress images (compress-pdf, pipeline-pdf). Default: not recompressed.")
+    parser.add_argument("--dpi", type=int, default=72, help="Rasterization DPI used by flatten-pdf. Default: 72.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Worker processes used by merge-pdf (parallel merge) and flatten-pdf (parallel "
+                             "rasterization). Default: 1.")
+    parser.add_argument("--threads", type=int, default=1,
+                        help="Threads used by compress-pdf to recompress images (with --img-quality). Default: 1.")
+    parser.add_argument("--timeout", type=int, default=3600, help="Maximum seconds per case. Default: 3600.")
+    parser.add_argument("--run-case", nargs=2, metavar=("TOOL", "CORPUS"), help=argparse.SUPPRESS)
+    parser.add_argument("--settings", type=str, default="{}", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # Child mode: run a single case and print its measurements as one JSON line
+    if args.run_case:
+        logging.disable(logging.CRITICAL)
+        print(json.dumps(run_case(*args.run_case, json.loads(args.settings))))
+        sys.exit()
+
+    # Set up logging with program name as prefix in each log entry
+    log_format = f"{PROGRAM_NAME}: %(message)s"
+    logging.basicConfig(level=logging.INFO, format=log_format)
+
+    tools = _parse_list(args.tools, CASES, "tool", parser) if args.tools else list(CASES)
+    if args.corpus:
+        corpora = _parse_list(args.corpus, os.listdir(path_corpus) if os.path.isdir(path_corpus) else [],
+                              "corpus (run generate_corpus.py first)", parser)
+    settings = {"compression_level": args.compression_level, "img_quality": args.img_quality, "dpi": args.dpi,
+                "workers": args.workers, "threads": args.threads}
+    versions = _versions()
+
+    logging.info("Starting PDF Benchmarks")
+    logging.info(f"Timestamp: {timestamp}")
+    logging.info(f"Corpus folder: {path_corpus}")
+    logging.info(f"Versions: {versions}")
+    logging.info(f"Settings: {settings}")
+
+    results = []
+    for tool in tools:
+        for corpus in (corpora if args.corpus else CASES[tool][1]):
+            if not os.path.isdir(os.path.join(path_corpus, corpus)):
+                logging.warning(f"Corpus '{corpus}' not found, run generate_corpus.py first. Skipping {tool}.")
+                continue
+            result = run_case_subprocess(tool, corpus, settings, args.timeout)
+            result.setdefault("status", "ok")
+            results.append(result)
+            if result["status"] == "ok":
+                logging.info(f"{tool} on {corpus}: {result['pages']} page(s) in {result['elapsed_s']}s - "
+                             f"{result['pages_per_s']} pages/s, {result['mb_per_s']} MB/s, "
+                             f"peak RSS {result['peak_rss_mb']} MB, output {result['output_mb']} MB")
+            else:
+                logging.warning(f"{tool} on {corpus}: {result['status']} - {result['error']}")
+
+    # Save the results as JSON (with versions and settings) and as a flat CSV table
+    os.makedirs(path_output, exist_ok=True)
+    path_json = os.path.join(path_output, f"{timestamp}_benchmark.json")
+    with open(path_json, "w", encoding="utf-8") as json_file:
+        json.dump({"timestamp": timestamp, "versions": versions, "settings": settings, "results": results},
+                  json_file, indent=2)
+
+    path_csv = os.path.join(path_output, f"{timestamp}_benchmark.csv")
+    with open(path_csv, "w", encoding="utf-8", newline="") as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=RESULT_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(results)
+
+    logging.info(f"Results saved to {path_json} and {path_csv}")
+    logging.info("PDF Benchmarks Completed")
@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+
+# ==============================================================================
+#   Author: João Manoel Feck
+#   Email: joaomfeck@gmail.com
+#   GitHub: https://github.com/jmfeck
+# ==============================================================================
+
@@ -0,0 +1,388 @@
+# -*- coding: utf-8 -*-
+
+# ==============================================================================
+#   Author: João Manoel Feck
+#   Email: joaomfeck@gmail.com
+#   GitHub: https://github.com/jmfeck
+# ==============================================================================
+
+import os
+import sys
+import time
+import signal
+import logging
+from dataclasses import dataclass, field
+from concurrent.futures import CancelledError, ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from common import metrics
+from common.discovery import DISCOVERY_OPTIONS
+from common.logging_setup import (LOGGING_OPTIONS, add_logging_arguments, init_worker_logging,
+                                  start_worker_log_listener)
+from common.manifest import OutputManifest
+from common.watcher import create_watcher, file_signature, list_folder
+
+# Options added by add_batch_arguments, which never change the produced outputs
+BATCH_OPTIONS = ("workers", "incremental", "incremental_check", "watch", "watch_interval")
+
+# Number of processed files between two manifest writes
+MANIFEST_SAVE_INTERVAL = 100
+
+# Seconds between two backlog reports in watch mode
+WATCH_STATUS_INTERVAL = 30
+
+# Files submitted to the process pool ahead of the workers, per worker. Inputs are pulled from the
+# (possibly still running) folder scan only as fast as the workers consume them.
+IN_FLIGHT_PER_WORKER = 4
+
+
+# Outcome of processing a single input file
+@dataclass
+class FileResult:
+    name: str
+    success: bool
+    outputs: list = field(default_factory=list)
+    error: str = None
+    elapsed: float = 0.0
+    skipped: bool = False
+    metrics: dict = None
+
+
+# Per-file success/failure summary of a batch run
+@dataclass
+class BatchSummary:
+    results: list = field(default_factory=list)
+
+    @property
+    def succeeded(self):
+        return [result for result in self.results if result.success and not result.skipped]
+
+    @property
+    def skipped(self):
+        return [result for result in self.results if result.skipped]
+
+    @property
+    def failed(self):
+        return [result for result in self.results if not result.success]
+
+
+# Add the options shared by every batch tool to an argument parser
+def add_batch_arguments(parser):
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of worker processes used to process files in parallel. Default: 1.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Skip input files that are unchanged since a previous run with the same options "
+                             "and whose outputs still exist (tracked in output/manifest.json).")
+    parser.add_argument("--incremental-check", type=str, choices=["mtime", "hash"], default="mtime",
+                        help="How --incremental detects changed inputs: 'mtime' (size and modification time, "
+                             "default) or 'hash' (SHA-256 of the file content).")
+    parser.add_argument("--watch", action="store_true",
+                        help="Keep running after the existing files are processed and process new files as soon as "
+                             "they are written to the input folder. Stop with Ctrl+C or SIGTERM; queued files are "
+                             "finished before exiting.")
+    parser.add_argument("--watch-interval", type=float, default=1.0,
+                        help="Seconds between two scans of the input folder when inotify is not available. Default: 1.")
+    add_logging_arguments(parser)
+
+
+# Tool parameters that identify the outputs of a run (used as part of the manifest key)
+def tool_params(args):
+    params = {key: value for key, value in vars(args).items()
+              if key not in BATCH_OPTIONS + DISCOVERY_OPTIONS + LOGGING_OPTIONS}
+    params["tool"] = os.path.basename(sys.argv[0])
+    return params
+
+
+# Watch mode workers leave Ctrl+C and SIGTERM to the parent, which drains the queue before exiting
+def _init_watch_worker(log_queue, level):
+    init_worker_logging(log_queue, level)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+
+# Run the tool operation on one file, turning any exception into a failed result
+def _process_one(process_file, name):
+    start_time = time.perf_counter()
+    metrics.begin(name)
+    try:
+        outputs = process_file(name)
+    except Exception as e:
+        logging.error(f"Failed to process {name} - {e}")
+        return FileResult(name, False, error=str(e), elapsed=time.perf_counter() - start_time,
+                          metrics=metrics.finish())
+
+    if outputs is None:
+        outputs = []
+    elif isinstance(outputs, str):
+        outputs = [outputs]
+    return FileResult(name, True, list(outputs), elapsed=time.perf_counter() - start_time,
+                      metrics=metrics.finish())
+
+
+# One JSON-serializable metrics record per input file
+def metrics_record(result, path_input):
+    data = result.metrics or {}
+    path_input_file = os.path.join(path_input, result.name) if path_input is not None else None
+    record = {
+        "type": "file",
+        "file": result.name,
+        "status": "skipped" if result.skipped else "ok" if result.success else "failed",
+        "elapsed": round(result.elapsed, 4),
+        "stages": {name: round(seconds, 4) for name, seconds in data.get("stages", {}).items()},
+        "pages": data.get("pages"),
+        "input_bytes": os.path.getsize(path_input_file) if path_input_file and os.path.isfile(path_input_file) else None,
+        "output_bytes": metrics.size_of(result.outputs),
+        "peak_rss_mb": data.get("peak_rss_mb"),
+        "backlog": data.get("backlog"),
+        "error": result.error,
+    }
+    # Tool-specific values and counters, e.g. the image quality chosen by compress-pdf
+    record.update((key, value) for key, value in data.items() if key not in record)
+    return record
+
+
+def log_metrics_summary(summary):
+    logging.info(f"Metrics: {summary['files']} file(s), {summary['pages']} page(s), "
+                 f"{summary['input_bytes']} bytes in, {summary['output_bytes']} bytes out")
+    for name, values in summary["percentiles"].items():
+        unit = " MB" if name.endswith("peak_rss_mb") else "s"
+        logging.info(f"  - {name}: " + ", ".join(f"{key} {value}{unit}" for key, value in values.items()))
+    counters = summary.get("counters", {})
+    if counters:
+        logging.info("  - counters: " + ", ".join(f"{name} {value}" for name, value in counters.items()))
+    for name, hits in counters.items():
+        if name.endswith("_hits"):
+            lookups = hits + counters.get(f"{name[:-len('_hits')]}_misses", 0)
+            if lookups:
+                logging.info(f"  - {name[:-len('_hits')]} hit rate: {100 * hits / lookups:.1f}% ({hits} of {lookups})")
+
+
+def _run_parallel(process_file, input_files, workers, on_result):
+    log_queue, listener = start_worker_log_listener()
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker_logging,
+                                 initargs=(log_queue, logging.getLogger().level)) as executor:
+            input_files = iter(input_files)
+            in_flight = {}
+            exhausted = False
+            while in_flight or not exhausted:
+                # Keep a bounded number of files queued instead of submitting the whole input at once
+                while not exhausted and len(in_flight) < workers * IN_FLIGHT_PER_WORKER:
+                    name = next(input_files, None)
+                    if name is None:
+                        exhausted = True
+                    else:
+                        in_flight[executor.submit(_process_one, process_file, name)] = name
+                if not in_flight:
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = in_flight.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        # The worker itself died (e.g. killed by the OS), not just the operation
+                        logging.error(f"Failed to process {name} - worker error: {e}")
+                        result = FileResult(name, False, error=str(e))
+                    on_result(result)
+    finally:
+        listener.stop()
+
+
+# Keep a warm process pool and feed it every file that is written to the input folder,
+# until SIGINT/SIGTERM is received; the files already queued are then finished (drained)
+def _run_watch(process_file, initial_files, path_input, file_filter, args, on_result, is_up_to_date, metrics_writer):
+    stop_requested = False
+
+    def request_stop(signum, frame):
+        nonlocal stop_requested
+        if not stop_requested:
+            logging.info("Stop requested, finishing the queued files before exiting")
+        stop_requested = True
+
+    previous_handlers = {sig: signal.signal(sig, request_stop) for sig in (signal.SIGINT, signal.SIGTERM)}
+    workers = max(1, args.workers)
+    log_queue, listener = start_worker_log_listener()
+    recursive = getattr(args, "recursive", False)
+    watcher = create_watcher(path_input, args.watch_interval, recursive=recursive)
+
+    in_flight = {}
+    queued_names = set()
+    changed_while_queued = set()
+    seen = {}
+    processed_count = 0
+
+    def new_executor():
+        return ProcessPoolExecutor(max_workers=workers, initializer=_init_watch_worker,
+                                   initargs=(log_queue, logging.getLogger().level))
+
+    def submit(names):
+        for name in names:
+            if not file_filter(name):
+                continue
+            if name in queued_names:
+                changed_while_queued.add(name)
+                continue
+            # Ignore files that did not change since they were queued (e.g. repeated close events)
+            signature = file_signature(os.path.join(path_input, name))
+            if signature is None or seen.get(name) == signature:
+                continue
+            seen[name] = signature
+            if is_up_to_date(name):
+                on_result(FileResult(name, True, skipped=True))
+                continue
+            try:
+                future = executor.submit(_process_one, process_file, name)
+            except BrokenProcessPool:
+                replace_executor(executor)
+                future = executor.submit(_process_one, process_file, name)
+            # Each job remembers its pool, see replace_executor()
+            in_flight[future] = (name, executor)
+            queued_names.add(name)
+
+    # A dead worker breaks the whole pool, and every job still on it fails. The pool is replaced
+    # once, by the first of them; the others belong to a pool that is already gone.
+    def replace_executor(broken):
+        nonlocal executor
+        if broken is not executor:
+            return
+        logging.error("The worker pool crashed, starting a new one")
+        executor.shutdown(wait=False, cancel_futures=True)
+        executor = new_executor()
+
+    def collect(futures):
+        nonlocal processed_count
+        changed = []
+        for future in futures:
+            name, pool = in_flight.pop(future)
+            queued_names.discard(name)
+            try:
+                result = future.result()
+            except (Exception, CancelledError) as e:
+                error = str(e) or type(e).__name__
+                logging.error(f"Failed to process {name} - worker error: {error}")
+                result = FileResult(name, False, error=error)
+                if isinstance(e, BrokenProcessPool):
+                    replace_executor(pool)
+            result.metrics = dict(result.metrics or {}, backlog=len(in_flight))
+            processed_count += 1
+            on_result(result)
+            if name in changed_while_queued:
+                changed_while_queued.discard(name)
+                changed.append(name)
+        # Resubmitted once every collected job is handled, so never to a pool found broken above
+        submit(changed)
+
+    def report_status():
+        metrics_writer.write({"type": "watch", "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                              "backlog": len(in_flight), "processed": processed_count})
+        if in_flight:
+            logging.info(f"Watch: {len(in_flight)} file(s) in the backlog, {processed_count} processed so far")
+
+    executor = new_executor()
+    try:
+        logging.info(f"Watch mode: processing with {workers} warm worker process(es), press Ctrl+C to stop")
+        submit(initial_files)
+        last_status = time.monotonic()
+        while not stop_requested:
+            names = watcher.poll(args.watch_interval)
+            if names is None:
+                logging.warning("Too many file events at once, rescanning the input folder")
+                names = list_folder(path_input, recursive=recursive)
+            submit(names)
+            collect([future for future in list(in_flight) if future.done()])
+            if time.monotonic() - last_status >= WATCH_STATUS_INTERVAL:
+                report_status()
+                last_status = time.monotonic()
+
+        logging.info(f"Draining {len(in_flight)} queued file(s)")
+        while in_flight:
+            collect([next(as_completed(list(in_flight)))])
+        report_status()
+    finally:
+        executor.shutdown(wait=True)
+        watcher.close()
+        listener.stop()
+        for sig, handler in previous_handlers.items():
+            signal.signal(sig, handler)
+
+
+# Apply process_file to every input file, optionally fanning out to a process pool.
+# input_files can be a generator (see common.discovery): files are processed while it is still running.
+# process_file receives the file name and returns the output path(s) it wrote.
+# Per-file metrics are appended as JSON lines to path_metrics when it is given.
+# With --watch, file_filter decides which new files in path_input are processed.
+def run_batch(process_file, input_files, args, path_input=None, path_output=None, path_metrics=None,
+              file_filter=None):
+    results = {}
+    discovered_files = []
+    metrics_writer = metrics.MetricsWriter(path_metrics)
+
+    watch = getattr(args, "watch", False)
+    if watch and (path_input is None or file_filter is None):
+        logging.warning("Watch mode is not supported by this tool, processing the inputs once")
+        watch = False
+
+    manifest = None
+    if args.incremental and path_input is not None and path_output is not None:
+        manifest = OutputManifest(path_output, tool_params(args), check=args.incremental_check)
+    elif args.incremental:
+        logging.warning("Incremental mode is not supported by this tool, processing every input")
+
+    def is_up_to_date(name):
+        return manifest is not None and manifest.is_up_to_date(name, os.path.join(path_input, name))
+
+    processed_count = 0
+
+    def on_result(result):
+        nonlocal processed_count
+        if result.skipped:
+            result.outputs = manifest.outputs_of(result.name)
+        results[result.name] = result
+        metrics_writer.write(metrics_record(result, path_input))
+        if manifest is not None and result.success and not result.skipped:
+            manifest.record(result.name, os.path.join(path_input, result.name), result.outputs)
+            processed_count += 1
+            if processed_count % MANIFEST_SAVE_INTERVAL == 0:
+                manifest.save()
+
+    try:
+        if watch:
+            _run_watch(process_file, input_files, path_input, file_filter, args, on_result, is_up_to_date,
+                       metrics_writer)
+        else:
+            # Skip unchanged inputs whose outputs from a previous run are still valid
+            def pending_files():
+                for name in input_files:
+                    discovered_files.append(name)
+                    if is_up_to_date(name):
+                        on_result(FileResult(name, True, skipped=True))
+                    else:
+                        yield name
+
+            workers = max(1, args.workers)
+            if workers == 1:
+                for name in pending_files():
+                    on_result(_process_one(process_file, name))
+            else:
+                logging.info(f"Processing files with {workers} worker processes")
+                _run_parallel(process_file, pending_files(), workers, on_result)
+            if manifest is not None:
+                skipped_count = sum(1 for result in results.values() if result.skipped)
+                logging.info(f"Incremental mode: {skipped_count} unchanged file(s) skipped, "
+                             f"{len(discovered_files) - skipped_count} processed")
+    finally:
+        if manifest is not None:
+            manifest.save()
+        metrics_summary = metrics_writer.close()
+
+    summary = BatchSummary(list(results.values()) if watch else
+                           [results[name] for name in discovered_files if name in results])
+    logging.info(f"Summary: {len(summary.succeeded)} succeeded, {len(summary.skipped)} skipped, "
+                 f"{len(summary.failed)} failed")
+    for result in summary.failed:
+        logging.info(f"  - Failed: {result.name} ({result.error})")
+    if metrics_summary["files"]:
+        log_metrics_summary(metrics_summary)
+    return summary
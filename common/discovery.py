@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+# ==============================================================================
+#   Author: João Manoel Feck
+#   Email: joaomfeck@gmail.com
+#   GitHub: https://github.com/jmfeck
+# ==============================================================================
+
+import os
+import fnmatch
+import logging
+
+# Options added by add_discovery_arguments, which never change the produced outputs
+DISCOVERY_OPTIONS = ("include", "exclude", "recursive", "default_include")
+
+
+# Add the input selection options to an argument parser; default_include are the tool's own patterns
+def add_discovery_arguments(parser, default_include):
+    parser.add_argument("--include", type=str, action="append", default=None, metavar="PATTERN",
+                        help=f"Glob pattern of the input files to process (case-insensitive, can be repeated). "
+                             f"Patterns with a '/' match the path relative to the input folder. "
+                             f"Default: {' '.join(default_include)}.")
+    parser.add_argument("--exclude", type=str, action="append", default=[], metavar="PATTERN",
+                        help="Glob pattern of input files to skip (case-insensitive, can be repeated).")
+    parser.add_argument("--recursive", action="store_true",
+                        help="Also process files in subfolders of the input folder; the subfolder structure is "
+                             "mirrored in the output folder.")
+    parser.set_defaults(default_include=list(default_include))
+
+
+# Case-insensitive include/exclude glob matching on names relative to the input folder
+class InputFilter:
+
+    def __init__(self, include, exclude=()):
+        self.include = [pattern.lower() for pattern in include]
+        self.exclude = [pattern.lower() for pattern in exclude]
+
+    @staticmethod
+    def _matches(relative_name, patterns):
+        relative_name = relative_name.replace(os.sep, "/").lower()
+        basename = relative_name.rsplit("/", 1)[-1]
+        return any(fnmatch.fnmatchcase(relative_name if "/" in pattern else basename, pattern)
+                   for pattern in patterns)
+
+    def __call__(self, relative_name):
+        return (self._matches(relative_name, self.include)
+                and not self._matches(relative_name, self.exclude))
+
+
+def input_filter_from_args(args):
+    return InputFilter(args.include or args.default_include, args.exclude)
+
+
+# Yield the matching files under path_input as paths relative to it, while the folder is
+# still being scanned, so processing can start before a huge folder is fully listed
+def discover_files(path_input, input_filter, recursive=False):
+    pending_folders = [""]
+    while pending_folders:
+        relative_folder = pending_folders.pop()
+        subfolders = []
+        try:
+            with os.scandir(os.path.join(path_input, relative_folder)) as entries:
+                for entry in entries:
+                    relative_name = os.path.join(relative_folder, entry.name) if relative_folder else entry.name
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive:
+                            subfolders.append(relative_name)
+                    elif entry.is_file() and input_filter(relative_name):
+                        yield relative_name
+        except OSError as e:
+            logging.warning(f"Cannot read folder {os.path.join(path_input, relative_folder)} - {e}")
+        pending_folders.extend(sorted(subfolders, reverse=True))
+
+
+# Output folder for an input, mirroring its subfolder inside path_output (created if needed)
+def output_folder_for(path_output, relative_name):
+    output_folder = os.path.join(path_output, os.path.dirname(relative_name))
+    os.makedirs(output_folder, exist_ok=True)
+    return output_folder
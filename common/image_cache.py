@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+# ==============================================================================
+#   Author: João Manoel Feck
+#   Email: joaomfeck@gmail.com
+#   GitHub: https://github.com/jmfeck
+# ==============================================================================
+
+import os
+import hashlib
+import tempfile
+from collections import OrderedDict
+
+# Memory used by the in-memory part of the cache, per process
+IMAGE_CACHE_MB = 64
+
+
+# Cache key of an image recompressed with the given parameters: a hash of the image data and of
+# everything the encoder reads besides it, so identical images in different files share an entry
+def cache_key(data, *parameters):
+    digest = hashlib.sha256(repr(parameters).encode())
+    digest.update(data)
+    return digest.hexdigest()
+
+
+# Recompressed images of a batch run, keyed by cache_key(). Entries are kept in memory up to
+# max_mb, the least recently used going first. With a folder, every entry is also written there,
+# where the other worker processes and later runs find it; the folder can be deleted at any time.
+# A cache is used by one thread at a time.
+class ImageCache:
+
+    def __init__(self, max_mb=IMAGE_CACHE_MB, folder=None):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.folder = folder
+        self._entries = OrderedDict()
+        self._bytes = 0
+        if folder is not None:
+            os.makedirs(folder, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.folder, key[:2], key)
+
+    def _remember(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        self._entries[key] = data
+        self._bytes += len(data)
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+
+    # Cached data of a key, or None
+    def get(self, key):
+        data = self._entries.get(key)
+        if data is not None:
+            self._entries.move_to_end(key)
+            return data
+        if self.folder is not None:
+            try:
+                with open(self._path(key), "rb") as cached:
+                    data = cached.read()
+            except OSError:
+                return None
+            self._remember(key, data)
+        return data
+
+    def put(self, key, data):
+        if key in self._entries:
+            return
+        self._remember(key, data)
+        if self.folder is not None and not os.path.exists(self._path(key)):
+            # Written under a temporary name first, so other processes never read a partial entry
+            os.makedirs(os.path.dirname(self._path(key)), exist_ok=True)
+            handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(self._path(key)))
+            try:
+                with os.fdopen(handle, "wb") as temp_file:
+                    temp_file.write(data)
+                os.replace(temp_path, self._path(key))
+            except OSError:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
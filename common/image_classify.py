@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+# ==============================================================================
+#   Author: João Manoel Feck
+#   Email: joaomfeck@gmail.com
+#   GitHub: https://github.com/jmfeck
+# ==============================================================================
+
+import numpy as np
+
+# Image classes found by classify()
+BILEVEL, GRAYSCALE, COLOR = "bilevel", "grayscale", "color"
+IMAGE_CLASSES = (BILEVEL, GRAYSCALE, COLOR)
+
+# Pixels are examined every CLASSIFY_STEP rows and columns
+CLASSIFY_STEP = 2
+
+# A pixel is colored when its channels differ by more than GRAY_CHROMA. An image with at most
+# GRAY_MAX_COLORED of colored pixels is grayscale: the color fringes of scanners and JPEG stay below.
+GRAY_CHROMA = 32
+GRAY_MAX_COLORED = 0.005
+
+# A grayscale image with at most BILEVEL_MAX_MIDTONES of its pixels in the MIDTONES range is
+# bilevel: black and white, apart from the blurred or anti-aliased edges of scanned text
+MIDTONES = (64, 192)
+BILEVEL_MAX_MIDTONES = 0.05
+
+
+# Otsu threshold of a 256-bin luminance histogram: the level that best separates the dark pixels
+# (at or below it) from the light ones
+def otsu_threshold(histogram):
+    histogram = histogram.astype(np.float64)
+    dark_pixels = np.cumsum(histogram)[:-1]
+    dark_sum = np.cumsum(histogram * np.arange(256))[:-1]
+    total_pixels, total_sum = histogram.sum(), (histogram * np.arange(256)).sum()
+    light_pixels = total_pixels - dark_pixels
+    valid = (dark_pixels > 0) & (light_pixels > 0)
+    if not valid.any():
+        return 127
+    variance = np.zeros(255)
+    variance[valid] = ((total_sum * dark_pixels[valid] - dark_sum[valid] * total_pixels) ** 2
+                       / (dark_pixels[valid] * light_pixels[valid]))
+    return int(np.argmax(variance))
+
+
+# Class of a Pillow "L" or "RGB" image, from the spread of its channels and its luminance histogram,
+# with the Otsu threshold that turns it into black and white (None unless it is bilevel)
+def classify(image):
+    if image.mode == "RGB":
+        pixels = np.asarray(image)[::CLASSIFY_STEP, ::CLASSIFY_STEP]
+        chroma = pixels.max(axis=2).astype(np.int16) - pixels.min(axis=2)
+        if np.count_nonzero(chroma > GRAY_CHROMA) > GRAY_MAX_COLORED * chroma.size:
+            return COLOR, None
+    luma = np.asarray(image.convert("L"))[::CLASSIFY_STEP, ::CLASSIFY_STEP]
+    histogram = np.bincount(luma.ravel(), minlength=256)
+    if histogram[MIDTONES[0]:MIDTONES[1]].sum() > BILEVEL_MAX_MIDTONES * luma.size:
+        return GRAYSCALE, None
+    return BILEVEL, otsu_threshold(histogram)
@@ -0,0 +1,446 @@
+# -*- coding: utf-8 -*-
+
+# ==============================================================================
+#   Author: João Manoel Feck
+#   Email: joaomfeck@gmail.com
+#   GitHub: https://github.com/jmfeck
+# ==============================================================================
+
+import io
+import re
+import zlib
+import logging
+import pymupdf
+import numpy as np
+from pymupdf import mupdf
+from collections import deque
+from itertools import repeat
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from common.image_cache import cache_key
+from common.image_classify import BILEVEL, COLOR, GRAYSCALE, classify
+
+# Images decoded or encoded ahead of the one being written back, per thread. Every in-flight
+# image holds its decoded pixels, so this caps the memory used on large scans.
+IN_FLIGHT_PER_THREAD = 2
+
+# Images decoded to estimate the output size of a quality level with plan_quality(), and the
+# JPEG quality levels it chooses from
+SAMPLE_IMAGES = 8
+QUALITY_LEVELS = tuple(range(5, 100, 5))
+
+# Pillow modes and PDF color spaces of the recompressed images, by number of color components
+_MODES = {1: "L", 3: "RGB"}
+_COLORSPACES = {1: "/DeviceGray", 3: "/DeviceRGB"}
+_DEVICE_COMPONENTS = {"/DeviceGray": 1, "/DeviceRGB": 3}
+
+_ICC_BASED = re.compile(r"^\[\s*/ICCBased\s+(\d+) 0 R\s*\]$")
+
+# TIFF compression tags of the bilevel encodings, and the PDF filter of their strip
+_TIFF_FILTERS = {4: "/CCITTFaxDecode", 8: "/FlateDecode"}
+
+
+# Image recompression counters of one document. bilevel, grayscale and color count the images of
+# each class found by the scan-aware recompression.
+@dataclass
+class RecompressStats:
+    images: int = 0
+    recompressed: int = 0
+    input_bytes: int = 0
+    output_bytes: int = 0
+    cache_hits: int = 0
+    cache_misses: int = 0
+    bilevel: int = 0
+    grayscale: int = 0
+    color: int = 0
+
+
+# Image to recompress: the encoded data as stored in the PDF (kind "jpeg" or "flate", decoded by
+# Pillow and zlib in the thread pool) or pixels already decoded by MuPDF (kind "samples").
+# colorspace is the color space to write with the new stream, None keeps the current one.
+@dataclass
+class _ImageJob:
+    xref: int
+    stored_bytes: int
+    kind: str
+    data: bytes
+    mode: str
+    size: tuple
+    colorspace: str = None
+
+
+# Images drawn by the pages, in page order, each xref once: an image shared by several pages,
+# such as a logo, is recompressed once instead of once per page
+def image_xrefs(document):
+    seen = set()
+    for page in document:
+        for image in page.get_images(full=True):
+            if image[0] not in seen:
+                seen.add(image[0])
+                yield image[0]
+
+
+# Number of color components of a DeviceGray, DeviceRGB or ICCBased image, None for the other
+# color spaces (Indexed, CMYK, Separation...), which are decoded by MuPDF
+def _components(document, xref):
+    value_type, value = document.xref_get_key(xref, "ColorSpace")
+    if value_type == "name":
+        return _DEVICE_COMPONENTS.get(value)
+    if value_type == "xref":
+        value = document.xref_object(int(value.split()[0]), compressed=True)
+    icc_based = _ICC_BASED.match(value)
+    if icc_based:
+        value_type, components = document.xref_get_key(int(icc_based.group(1)), "N")
+        return int(components) if value_type == "int" else None
+    return None
+
+
+# Read an image on the calling thread, None for images that are left as they are.
+# Gray and RGB images stored as JPEG or as plain 8-bit deflated pixels are handed to the thread
+# pool undecoded. Every other image is decoded by MuPDF here, since a PyMuPDF document must not
+# be used from several threads, and converted to RGB if it has other colors.
+def _read_image(document, xref):
+    if document.xref_get_key(xref, "ImageMask")[1] == "true":
+        return None
+    stored_bytes = len(document.xref_stream_raw(xref) or b"")
+    mode = _MODES.get(_components(document, xref))
+    image_filter = document.xref_get_key(xref, "Filter")[1]
+    plain = mode is not None and all(document.xref_get_key(xref, key)[0] == "null"
+                                     for key in ("Decode", "DecodeParms"))
+    if plain and image_filter == "/DCTDecode":
+        return _ImageJob(xref, stored_bytes, "jpeg", document.xref_stream_raw(xref), mode, None)
+    if plain and image_filter == "/FlateDecode" and document.xref_get_key(xref, "BitsPerComponent")[1] == "8":
+        size = (int(document.xref_get_key(xref, "Width")[1]), int(document.xref_get_key(xref, "Height")[1]))
+        return _ImageJob(xref, stored_bytes, "flate", document.xref_stream_raw(xref), mode, size)
+    try:
+        pixmap = pymupdf.Pixmap(document, xref)
+        if pixmap.alpha:
+            pixmap = pymupdf.Pixmap(pixmap, 0)
+        if pixmap.n not in _MODES:
+            pixmap = pymupdf.Pixmap(pymupdf.csRGB, pixmap)
+    except Exception as e:
+        logging.debug(f"Image recompression: Cannot decode image {xref} - {e}")
+        return None
+    return _ImageJob(xref, stored_bytes, "samples", pixmap.samples, _MODES[pixmap.n],
+                     (pixmap.width, pixmap.height), _COLORSPACES[pixmap.n])
+
+
+# Images of the document that can be recompressed, read one at a time as they are consumed
+def _image_jobs(document):
+    for xref in image_xrefs(document):
+        job = _read_image(document, xref)
+        if job is not None:
+            yield job
+
+
+# Decode an image into a Pillow image. Runs in the thread pool: it only uses zlib and Pillow,
+# which release the GIL while they decode and encode, and never touches the document.
+def _decode_image(job):
+    if job.kind == "jpeg":
+        image = Image.open(io.BytesIO(job.data))
+        return image.convert(job.mode) if image.mode != job.mode else image
+    data = zlib.decompress(job.data) if job.kind == "flate" else job.data
+    return Image.frombytes(job.mode, job.size, data)
+
+
+def _encode_jpeg(image, quality):
+    output = io.BytesIO()
+    image.save(output, "JPEG", quality=quality)
+    return output.getvalue()
+
+
+# Black and white version of an image, cut at the threshold, as a single-strip TIFF: CCITT G4 or
+# deflated 1-bit pixels, whichever is smaller. The whole TIFF is what the cache stores,
+# _image_stream() takes the strip out of it.
+def _encode_bilevel(image, threshold):
+    bits = Image.fromarray(np.asarray(image.convert("L")) > threshold)
+    encodings = []
+    for compression in ("group4", "tiff_adobe_deflate"):
+        output = io.BytesIO()
+        bits.save(output, "TIFF", compression=compression, tiffinfo={278: bits.height})
+        encodings.append(output.getvalue())
+    return min(encodings, key=len)
+
+
+# Recompress an image as JPEG. Scan-aware, the image is classified first (see classify()):
+# bilevel images are stored as 1-bit, grayscale ones as gray JPEG, only color ones as color JPEG.
+def _encode_image(job, quality, scan_aware=False):
+    image = _decode_image(job)
+    if scan_aware:
+        image_class, threshold = classify(image)
+        if image_class == BILEVEL:
+            return _encode_bilevel(image, threshold)
+        if image_class == GRAYSCALE and image.mode != "L":
+            image = image.convert("L")
+    return _encode_jpeg(image, quality)
+
+
+# Stream data of an encoded image, the dictionary entries to write with it and its class
+def _image_stream(job, encoded):
+    if encoded[:2] == b"\xff\xd8":
+        gray = Image.open(io.BytesIO(encoded)).mode == "L"
+        colorspace = "/DeviceGray" if gray and job.mode != "L" else job.colorspace
+        return encoded, {"Filter": "/DCTDecode", "BitsPerComponent": "8", "ColorSpace": colorspace}, \
+            GRAYSCALE if gray else COLOR
+    tiff = Image.open(io.BytesIO(encoded))
+    offset, length = tiff.tag_v2[273][0], tiff.tag_v2[279][0]
+    entries = {"Filter": _TIFF_FILTERS[tiff.tag_v2[259]], "BitsPerComponent": "1", "ColorSpace": "/DeviceGray"}
+    # Photometric 1 stores black as 0, which is what /DeviceGray reads, 0 stores it as 1
+    black_is_zero = tiff.tag_v2.get(262, 0) == 1
+    if entries["Filter"] == "/CCITTFaxDecode":
+        entries["DecodeParms"] = (f"<</K -1/Columns {tiff.width}/Rows {tiff.height}"
+                                  f"/BlackIs1 {'true' if black_is_zero else 'false'}>>")
+    elif not black_is_zero:
+        entries["Decode"] = "[1 0]"
+    return encoded[offset:offset + length], entries, BILEVEL
+
+
+def _cache_key(job, quality, scan_aware):
+    return cache_key(job.data, job.kind, job.mode, job.size, quality, scan_aware)
+
+
+# Size of an image once recompressed at the given quality, None when it is left as it is
+# (stencil masks, images that cannot be decoded). The encoded image goes to the cache when one is
+# given, so a later recompress_images() call with the same cache does not encode it again; its
+# cache key is then added to encoded_keys, when given, so that call can tell it was no hit.
+def recompressed_size(document, xref, quality, cache=None, scan_aware=False, encoded_keys=None):
+    job = _read_image(document, xref)
+    if job is None:
+        return None
+    key = _cache_key(job, quality, scan_aware) if cache is not None else None
+    encoded = cache.get(key) if key is not None else None
+    if encoded is None:
+        try:
+            encoded = _encode_image(job, quality, scan_aware)
+        except Exception as e:
+            logging.debug(f"Image recompression: Cannot recompress image {xref} - {e}")
+            return None
+        if key is not None:
+            cache.put(key, encoded)
+            if encoded_keys is not None:
+                encoded_keys.add(key)
+    return len(_image_stream(job, encoded)[0])
+
+
+# Recompress the images of an open PyMuPDF document as JPEG at the given quality (1-100).
+# An image is replaced only when the JPEG is smaller than what the PDF stores. With threads > 1,
+# images are decoded and encoded by a thread pool, at most IN_FLIGHT_PER_THREAD per thread at a
+# time, and written back on the calling thread in page order, so the output does not depend on
+# the number of threads. With an ImageCache, an image whose data and parameters were already
+# recompressed, in this document or an earlier one, is taken from the cache instead.
+# scan_aware classifies every image first (see _encode_image()) and counts the classes.
+# A cache hit is an image encoded for another file, or earlier in this pass. estimated_keys holds
+# the keys recompressed_size() encoded while estimating this document: the caller counts them as
+# misses, so finding one of them in the cache is not counted here (only the first time, a second
+# image with the same key is a hit).
+# The document is changed in place; returns a RecompressStats.
+def recompress_images(document, quality, threads=1, cache=None, scan_aware=False, estimated_keys=None):
+    if not 1 <= quality <= 100:
+        raise ValueError(f"img_quality must be between 1 and 100, got {quality}.")
+    stats = RecompressStats()
+    pdf = mupdf.pdf_document_from_fz_document(document.this)
+    estimated_keys = set(estimated_keys or ())
+
+    # Images paired with their cache key and cached JPEG (None on a miss or without a cache)
+    def cached_jobs():
+        for job in _image_jobs(document):
+            key = cached = None
+            if cache is not None:
+                key = _cache_key(job, quality, scan_aware)
+                cached = cache.get(key)
+                if cached is None:
+                    stats.cache_misses += 1
+                elif key in estimated_keys:
+                    estimated_keys.discard(key)
+                else:
+                    stats.cache_hits += 1
+            yield job, key, cached
+
+    def write_back(job, key, encode):
+        stats.images += 1
+        stats.input_bytes += job.stored_bytes
+        try:
+            encoded = encode()
+        except Exception as e:
+            logging.debug(f"Image recompression: Cannot recompress image {job.xref} - {e}")
+            encoded = None
+        if encoded is None:
+            stats.output_bytes += job.stored_bytes
+            return
+        if key is not None:
+            cache.put(key, encoded)
+        data, entries, image_class = _image_stream(job, encoded)
+        if scan_aware:
+            setattr(stats, image_class, getattr(stats, image_class) + 1)
+        if len(data) >= job.stored_bytes:
+            stats.output_bytes += job.stored_bytes
+            return
+        document.update_stream(job.xref, data, compress=False)
+        # MuPDF applied /Decode when it decoded the pixels (update_stream() already dropped /DecodeParms)
+        mupdf.pdf_dict_dels(mupdf.pdf_load_object(pdf, job.xref), "Decode")
+        for name, value in entries.items():
+            if value is not None:
+                document.xref_set_key(job.xref, name, value)
+        stats.recompressed += 1
+        stats.output_bytes += len(data)
+
+    if threads <= 1:
+        for job, key, cached in cached_jobs():
+            write_back(job, key, lambda: cached if cached is not None else _encode_image(job, quality, scan_aware))
+        return stats
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        in_flight = deque()
+        for job, key, cached in cached_jobs():
+            if cached is not None:
+                in_flight.append((job, key, lambda cached=cached: cached))
+            else:
+                in_flight.append((job, key, executor.submit(_encode_image, job, quality, scan_aware).result))
+            if len(in_flight) >= threads * IN_FLIGHT_PER_THREAD:
+                write_back(*in_flight.popleft())
+        while in_flight:
+            write_back(*in_flight.popleft())
+    return stats
+
+
+# Stored size and pixel count of an image, read from its dictionary without decoding it.
+# None for stencil masks, which are never recompressed.
+def _image_size(document, xref):
+    if document.xref_get_key(xref, "ImageMask")[1] == "true":
+        return None
+    pixels = 1
+    for key in ("Width", "Height"):
+        value_type, value = document.xref_get_key(xref, key)
+        pixels *= int(value) if value_type == "int" else 0
+    return len(document.xref_stream_raw(xref) or b""), pixels
+
+
+# Images to sample, spread over the pixels of the document rather than over the image count, so
+# the few large scans of a mixed document weigh as much in the sample as in the output
+def _sample_indexes(sizes, count):
+    total = sum(pixels for _, pixels in sizes)
+    if not total:
+        return []
+    indexes, covered, index = [], 0, 0
+    for step in range(count):
+        position = (step + 0.5) * total / count
+        while index < len(sizes) - 1 and covered + sizes[index][1] <= position:
+            covered += sizes[index][1]
+            index += 1
+        if not indexes or indexes[-1] != index:
+            indexes.append(index)
+    return indexes
+
+
+# Luminance of an image cut into 8x8 blocks, as compared by ssim()
+def _luma_blocks(image):
+    pixels = np.asarray(image.convert("L"), dtype=np.float32)
+    height, width = pixels.shape[0] // 8 * 8, pixels.shape[1] // 8 * 8
+    return pixels[:height, :width].reshape(height // 8, 8, width // 8, 8)
+
+
+# Mean SSIM of two images, given as _luma_blocks(), over their 8x8 blocks (1.0 means identical)
+def ssim(first, second):
+    if not first.size:
+        return 1.0
+    first_mean, second_mean = first.mean(axis=(1, 3)), second.mean(axis=(1, 3))
+    first_var = (first * first).mean(axis=(1, 3)) - first_mean ** 2
+    second_var = (second * second).mean(axis=(1, 3)) - second_mean ** 2
+    covariance = (first * second).mean(axis=(1, 3)) - first_mean * second_mean
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    return float(np.mean((2 * first_mean * second_mean + c1) * (2 * covariance + c2)
+                         / ((first_mean ** 2 + second_mean ** 2 + c1) * (first_var + second_var + c2))))
+
+
+def _jpeg_ssim(original_blocks, encoded):
+    return ssim(original_blocks, _luma_blocks(Image.open(io.BytesIO(encoded))))
+
+
+# Image quality chosen for a target output size (see plan_quality()).
+# quality is None when the images are left as they are; ssim is the lowest SSIM of the sample.
+@dataclass
+class QualityPlan:
+    quality: int = None
+    predicted_bytes: int = 0
+    ssim: float = None
+    reachable: bool = True
+    sampled: int = 0
+
+
+# Choose the highest JPEG quality whose output should fit in target_bytes, without compressing
+# the whole document. Up to SAMPLE_IMAGES images are decoded once and encoded at the quality
+# levels tried by a bisection over QUALITY_LEVELS. Each level predicts the size of every image
+# from the bytes per pixel of the sample, capped at its stored size, since larger JPEGs are not
+# written. The rest of the file is estimated from file_bytes minus the stored image data, which
+# overestimates it, as the compressed save also shrinks it.
+# min_quality and min_ssim are floors: when the target needs less, the floor wins and the plan is
+# marked not reachable. The SSIM is only computed for the levels its own bisection tries.
+# When the file already fits, the images are kept (quality None).
+def plan_quality(document, file_bytes, target_bytes, min_quality=None, min_ssim=None, threads=1):
+    xrefs, sizes = [], []
+    for xref in image_xrefs(document):
+        size = _image_size(document, xref)
+        if size is not None:
+            xrefs.append(xref)
+            sizes.append(size)
+    other_bytes = max(0, file_bytes - sum(stored for stored, _ in sizes))
+    if file_bytes <= target_bytes or not sizes:
+        return QualityPlan(None, file_bytes, reachable=file_bytes <= target_bytes)
+
+    with ThreadPoolExecutor(max_workers=max(1, threads)) as executor:
+        decoding = {}
+        for index in _sample_indexes(sizes, SAMPLE_IMAGES):
+            job = _read_image(document, xrefs[index])
+            if job is not None:
+                decoding[index] = executor.submit(_decode_image, job)
+        images = {index: future.result() for index, future in decoding.items()}
+        if not images:
+            return QualityPlan(None, file_bytes, reachable=False)
+        sample_pixels = sum(sizes[index][1] for index in images)
+        jpegs, predictions, ssims, original_blocks = {}, {}, {}, []
+
+        def encoded(quality):
+            if quality not in jpegs:
+                jpegs[quality] = list(executor.map(_encode_jpeg, images.values(), repeat(quality)))
+            return jpegs[quality]
+
+        def predict(quality):
+            if quality not in predictions:
+                measured = dict(zip(images, map(len, encoded(quality))))
+                bytes_per_pixel = sum(measured.values()) / sample_pixels
+                predictions[quality] = other_bytes + sum(min(stored, measured.get(index, int(bytes_per_pixel * pixels)))
+                                                         for index, (stored, pixels) in enumerate(sizes))
+            return predictions[quality]
+
+        def lowest_ssim(quality):
+            if quality not in ssims:
+                if not original_blocks:
+                    original_blocks.extend(executor.map(_luma_blocks, images.values()))
+                ssims[quality] = min(executor.map(_jpeg_ssim, original_blocks, encoded(quality)))
+            return ssims[quality]
+
+        # Highest level that fits, then lowest level that meets the SSIM floor (both bisections)
+        levels = [level for level in QUALITY_LEVELS if min_quality is None or level > min_quality]
+        levels = ([min_quality] if min_quality is not None else []) + levels
+        low, high = 0, len(levels) - 1
+        while low < high:
+            middle = (low + high + 1) // 2
+            if predict(levels[middle]) <= target_bytes:
+                low = middle
+            else:
+                high = middle - 1
+        chosen = low
+        if min_ssim is not None and lowest_ssim(levels[chosen]) < min_ssim:
+            low, high = chosen + 1, len(levels) - 1
+            while low < high:
+                middle = (low + high) // 2
+                if lowest_ssim(levels[middle]) >= min_ssim:
+                    high = middle
+                else:
+                    low = middle + 1
+            chosen = min(low, len(levels) - 1)
+        quality = levels[chosen]
+        predicted = predict(quality)
+        sample_ssim = lowest_ssim(quality) if min_ssim is not None else None
+    return QualityPlan(quality, predicted, sample_ssim, predicted <= target_bytes, len(images))
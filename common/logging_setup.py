@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+# ==============================================================================
+#   Author: João Manoel Feck
+#   Email: joaomfeck@gmail.com
+#   GitHub: https://github.com/jmfeck
+# ==============================================================================
+
+import os
+import queue
+import atexit
+import logging
+import logging.handlers
+import multiprocessing
+
+LOG_LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR")
+
+# Options added by add_logging_arguments, which never change the produced outputs
+LOGGING_OPTIONS = ("log_level", "log_max_mb", "log_backups")
+
+# Dependencies that log every decoded image or parsed object at DEBUG level; they only
+# report warnings and errors, so --log-level DEBUG shows the tools' own details
+NOISY_LOGGERS = ("PIL", "pdfminer", "fontTools", "urllib3", "weasyprint", "camelot", "asyncio")
+
+
+# Add the logging options to an argument parser
+def add_logging_arguments(parser, default_level="INFO"):
+    parser.add_argument("--log-level", type=str.upper, choices=LOG_LEVELS, default=default_level,
+                        help=f"Minimum level of the messages written to the console and the log file. "
+                             f"DEBUG also shows detailed progress messages. Default: {default_level}.")
+    parser.add_argument("--log-max-mb", type=float, default=100,
+                        help="Size in MB at which the log file is rotated. Default: 100.")
+    parser.add_argument("--log-backups", type=int, default=5,
+                        help="Number of rotated log files kept. Default: 5.")
+
+
+# Send every log record through an in-memory queue; a background thread (QueueListener) does
+# the console and file I/O, so logging calls on the hot path never block on the disk.
+# Worker processes forward their records to this process (see init_worker_logging), so
+# only this process ever writes the log file. Returns the running listener.
+def setup_logging(log_format, path_log=None, args=None):
+    level = getattr(args, "log_level", "INFO")
+    formatter = logging.Formatter(log_format)
+
+    handlers = [logging.StreamHandler()]
+    if path_log is not None:
+        os.makedirs(os.path.dirname(path_log), exist_ok=True)
+        handlers.append(logging.handlers.RotatingFileHandler(
+            path_log, maxBytes=int(getattr(args, "log_max_mb", 100) * 1024 * 1024),
+            backupCount=getattr(args, "log_backups", 5), encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    root_logger = logging.getLogger()
+    for handler in list(root_logger.handlers):
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    root_logger.setLevel(level)
+    for name in NOISY_LOGGERS:
+        logging.getLogger(name).setLevel(max(logging.WARNING, root_logger.level))
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    # Flush the queued records when the script ends, including through sys.exit()
+    atexit.register(listener.stop)
+    return listener
+
+
+# Queue for the worker processes' records and the listener that hands them to this process's
+# handlers; the workers are started with initializer=init_worker_logging, initargs=(log_queue, level)
+def start_worker_log_listener():
+    log_queue = multiprocessing.Queue()
+    listener = logging.handlers.QueueListener(log_queue, *logging.getLogger().handlers,
+                                              respect_handler_level=True)
+    listener.start()
+    return log_queue, listener
+
+
+# Route every log record of a worker process to the parent through a multiprocessing queue.
+# Records below the parent's level are dropped in the worker instead of being pickled.
+def init_worker_logging(log_queue, level=logging.DEBUG):
+    root_logger = logging.getLogger()
+    for handler in list(root_logger.handlers):
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    root_logger.setLevel(level)
+    for name in NOISY_LOGGERS:
+        logging.getLogger(name).setLevel(max(logging.WARNING, level))
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+# ==============================================================================
+#   Author: João Manoel Feck
+#   Email: joaomfeck@gmail.com
+#   GitHub: https://github.com/jmfeck
+# ==============================================================================
+
+import os
+import json
+import hashlib
+from datetime import datetime
+
+MANIFEST_FILENAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+# Read size for content hashing
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+# Digest of the tool parameters, so a run with different options never reuses old outputs
+def params_digest(params):
+    encoded = json.dumps(params, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+# Identify the current state of an input file, either by size+mtime (cheap) or by content hash
+def file_fingerprint(path, check="mtime"):
+    if not os.path.isfile(path):
+        return None
+
+    stat = os.stat(path)
+    if check == "hash":
+        sha = hashlib.sha256()
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+                sha.update(chunk)
+        return {"size": stat.st_size, "sha256": sha.hexdigest()}
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+# Per-tool record of which inputs were already processed, stored in the output folder
+class OutputManifest:
+
+    def __init__(self, path_output, params, check="mtime"):
+        self.path_output = path_output
+        self.path_manifest = os.path.join(path_output, MANIFEST_FILENAME)
+        self.params = params_digest(params)
+        self.check = check
+        self.entries = {}
+        self._dirty = False
+
+        if os.path.exists(self.path_manifest):
+            with open(self.path_manifest, "r", encoding="utf-8") as file:
+                data = json.load(file)
+            if data.get("version") == MANIFEST_VERSION:
+                self.entries = data.get("entries", {})
+
+    def _key(self, name):
+        return f"{self.params}:{name}"
+
+    # An input can be skipped if it is unchanged and every recorded output is still there
+    def is_up_to_date(self, name, path_input_file):
+        entry = self.entries.get(self._key(name))
+        if entry is None:
+            return False
+
+        fingerprint = file_fingerprint(path_input_file, self.check)
+        if fingerprint is None or fingerprint != entry["fingerprint"]:
+            return False
+
+        for output in entry["outputs"]:
+            output_path = os.path.join(self.path_output, output["path"])
+            if not os.path.isfile(output_path) or os.path.getsize(output_path) != output["size"]:
+                return False
+        return True
+
+    def outputs_of(self, name):
+        entry = self.entries.get(self._key(name), {})
+        return [os.path.join(self.path_output, output["path"]) for output in entry.get("outputs", [])]
+
+    def record(self, name, path_input_file, output_paths):
+        fingerprint = file_fingerprint(path_input_file, self.check)
+        if fingerprint is None:
+            return
+
+        outputs = []
+        for output_path in output_paths:
+            if os.path.isfile(output_path):
+                outputs.append({"path": os.path.relpath(output_path, self.path_output),
+                                "size": os.path.getsize(output_path)})
+            elif os.path.isdir(output_path):
+                # Tools such as the image extractor return a folder per input
+                for root, _, files in os.walk(output_path):
+                    for filename in files:
+                        file_path = os.path.join(root, filename)
+                        outputs.append({"path": os.path.relpath(file_path, self.path_output),
+                                        "size": os.path.getsize(file_path)})
+
+        self.entries[self._key(name)] = {
+            "fingerprint": fingerprint,
+            "outputs": outputs,
+            "processed_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        self._dirty = True
+
+    # Write atomically so an interrupted run never leaves a truncated manifest behind
+    def save(self):
+        if not self._dirty:
+            return
+        os.makedirs(self.path_output, exist_ok=True)
+        path_tmp = f"{self.path_manifest}.tmp"
+        with open(path_tmp, "w", encoding="utf-8") as file:
+            json.dump({"version": MANIFEST_VERSION, "entries": self.entries}, file, indent=1)
+        os.replace(path_tmp, self.path_manifest)
+        self._dirty = False
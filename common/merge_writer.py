@@ -0,0 +1,565 @@
+# -*- coding: utf-8 -*-
+
+# ==============================================================================
+#   Author: João Manoel Feck
+#   Email: joaomfeck@gmail.com
+#   GitHub: https://github.com/jmfeck
+# ==============================================================================
+
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import logging
+import pymupdf
+from pymupdf import mupdf
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from common import metrics
+from common.batch_runner import FileResult
+from common.logging_setup import init_worker_logging, start_worker_log_listener
+from common.page_subset import page_runs
+
+# Input data (in MB) whose pages are kept in memory before they are appended to the output file
+FLUSH_MB = 64
+
+# Pages kept in memory before they are appended to the output file. insert_pdf() slows down as the
+# document it inserts into grows, so batches stay small even when the inputs are
+FLUSH_PAGES = 500
+
+# Streams smaller than this are not worth an entry in the de-duplication index
+DEDUP_MIN_BYTES = 128
+
+# Entries of the de-duplication index kept in memory before they are moved to an SQLite file
+DEDUP_MEMORY_ENTRIES = 500000
+
+# Chunks of inputs merged into one part by a worker, per worker (see merge_parallel). Several
+# chunks per worker keep them all busy until the end, even when some inputs take longer.
+CHUNKS_PER_WORKER = 4
+
+# Chunks submitted to the process pool ahead of the one being appended, per worker
+IN_FLIGHT_PER_WORKER = 2
+
+_REFERENCE = re.compile(r"(\d+) 0 R")
+_LENGTH = re.compile(r"/Length\s*\d+(\s+0\s+R)?")
+
+
+# Content hash of a stream object -> number of the object holding that content in the output.
+# Lookups check the in-memory entries first; once there are more than max_memory_entries, they
+# are moved to an SQLite file at spill_path, so memory stays bounded for huge merges.
+class StreamIndex:
+
+    def __init__(self, spill_path, max_memory_entries=DEDUP_MEMORY_ENTRIES):
+        self.spill_path = spill_path
+        self.max_memory_entries = max_memory_entries
+        self._entries = {}
+        self._database = None
+
+    def get(self, digest):
+        xref = self._entries.get(digest)
+        if xref is None and self._database is not None:
+            row = self._database.execute("SELECT xref FROM streams WHERE digest = ?", (digest,)).fetchone()
+            xref = row[0] if row else None
+        return xref
+
+    def add(self, digest, xref):
+        self._entries[digest] = xref
+        if len(self._entries) > self.max_memory_entries:
+            self._spill()
+
+    def _spill(self):
+        if self._database is None:
+            self._database = sqlite3.connect(self.spill_path)
+            self._database.execute("CREATE TABLE streams (digest BLOB PRIMARY KEY, xref INTEGER)")
+        with self._database:
+            self._database.executemany("INSERT OR IGNORE INTO streams VALUES (?, ?)", self._entries.items())
+        self._entries = {}
+
+    def close(self):
+        self._entries = {}
+        if self._database is not None:
+            self._database.close()
+            self._database = None
+            os.remove(self.spill_path)
+
+
+# Point the indirect references of a dictionary or array (and the containers nested in it) that
+# target a key of replaced to the object given by its value. Returns True if anything changed.
+def _replace_references(pdf, container, replaced):
+    changed = False
+    is_dict = mupdf.pdf_is_dict(container)
+    for index in range(mupdf.pdf_dict_len(container) if is_dict else mupdf.pdf_array_len(container)):
+        value = mupdf.pdf_dict_get_val(container, index) if is_dict else mupdf.pdf_array_get(container, index)
+        if mupdf.pdf_is_indirect(value):
+            target = replaced.get(mupdf.pdf_to_num(value))
+            if target is not None:
+                reference = mupdf.pdf_new_indirect(pdf, target, 0)
+                if is_dict:
+                    mupdf.pdf_dict_put(container, mupdf.pdf_dict_get_key(container, index), reference)
+                else:
+                    mupdf.pdf_array_put(container, index, reference)
+                changed = True
+        elif mupdf.pdf_is_dict(value) or mupdf.pdf_is_array(value):
+            changed = _replace_references(pdf, value, replaced) or changed
+    return changed
+
+
+# Replace the stream objects numbered first_xref and above whose content is already in the output
+# by references to the existing copy, and free them. Fonts, images and ICC profiles embedded by
+# every input are then stored once in the merged file. The content hash of an object covers its
+# stream data, its dictionary and, recursively, the content of the objects it references, so an
+# image matches the first copy even though its colour space array is a different object. Pages,
+# objects outside the new range and reference cycles are hashed by their object number.
+# Objects that only the removed streams referenced are freed too. New contents are added to the
+# index. Returns (objects removed, bytes saved).
+def deduplicate_streams(document, first_xref, index):
+    pdf = mupdf.pdf_document_from_fz_document(document.this)
+    xref_count = document.xref_length()
+    replaced = {}
+    digests = {}
+    saved_bytes = 0
+
+    def reference_key(match):
+        xref = int(match[1])
+        if first_xref <= xref < xref_count:
+            digest = content_digest(xref)
+            if digest is not None:
+                return f"<{digest.hex()}>"
+        return match[0]
+
+    def content_digest(xref):
+        nonlocal saved_bytes
+        if xref in digests:
+            return digests[xref]
+        digests[xref] = None
+        definition = _LENGTH.sub("", document.xref_object(xref, compressed=True))
+        if "/Type/Page" in definition:
+            return None
+        definition = _REFERENCE.sub(reference_key, definition)
+        raw = document.xref_stream_raw(xref) or b"" if document.xref_is_stream(xref) else None
+        digest = hashlib.sha256(definition.encode() + b"\0" + (raw or b"")).digest()
+        digests[xref] = digest
+        if raw is not None and len(raw) >= DEDUP_MIN_BYTES:
+            existing = index.get(digest)
+            if existing is None:
+                index.add(digest, xref)
+            elif existing != xref:
+                replaced[xref] = existing
+                saved_bytes += len(raw) + len(definition)
+        return digest
+
+    with metrics.stage("dedup"):
+        for xref in range(first_xref, xref_count):
+            if document.xref_is_stream(xref):
+                content_digest(xref)
+        if not replaced:
+            return 0, 0
+        # Number of new objects that reference each new object once the duplicates are replaced,
+        # to find the children left unused. The loop below reads the definitions as rewritten,
+        # so the counts must describe the rewritten references too.
+        referrers = {}
+        for xref in range(first_xref, xref_count):
+            definition = document.xref_object(xref, compressed=True)
+            references = {int(reference) for reference in _REFERENCE.findall(definition)}
+            # Only objects that mention a replaced stream are loaded and rewritten
+            if xref not in replaced and any(reference in replaced for reference in references):
+                _replace_references(pdf, mupdf.pdf_load_object(pdf, xref), replaced)
+                references = {replaced.get(reference, reference) for reference in references}
+            for reference in references:
+                referrers[reference] = referrers.get(reference, 0) + 1
+        # Free the duplicates, then the objects only they referenced (a font descriptor's
+        # dictionaries, a small soft mask), and so on down
+        removed = list(replaced)
+        dropped = set(replaced)
+        while removed:
+            xref = removed.pop()
+            definition = document.xref_object(xref, compressed=True)
+            for reference in {int(reference) for reference in _REFERENCE.findall(definition)}:
+                if not first_xref <= reference < xref_count or reference in dropped:
+                    continue
+                referrers[reference] -= 1
+                if referrers[reference] == 0:
+                    dropped.add(reference)
+                    removed.append(reference)
+                    raw = document.xref_stream_raw(reference) if document.xref_is_stream(reference) else None
+                    saved_bytes += len(raw or b"") + len(document.xref_object(reference, compressed=True))
+            mupdf.pdf_delete_object(pdf, xref)
+    return len(dropped), saved_bytes
+
+
+# Graft the whole page tree of batch under the root page tree node of output, together with the
+# form fields of its widgets. Unlike insert_pdf(), which inserts pages one by one and costs time
+# proportional to the pages already in the output for every page, this adds one node to the root
+# /Kids, so appending to a file with a million pages is as fast as appending to an empty one.
+# Returns the graft map, which maps every object of batch to its copy in output.
+def append_page_tree(output, batch):
+    output_pdf = mupdf.pdf_document_from_fz_document(output.this)
+    batch_pdf = mupdf.pdf_document_from_fz_document(batch.this)
+    graft_map = mupdf.pdf_new_graft_map(output_pdf)
+
+    output_pages = mupdf.pdf_dict_getp(mupdf.pdf_trailer(output_pdf), "Root/Pages")
+    batch_pages = mupdf.pdf_dict_getp(mupdf.pdf_trailer(batch_pdf), "Root/Pages")
+    node = mupdf.pdf_graft_mapped_object(graft_map, batch_pages)
+    mupdf.pdf_dict_put(node, mupdf.PDF_ENUM_NAME_Parent, output_pages)
+    # The batch pages must not inherit a rotation set on the root node of the output
+    if mupdf.pdf_dict_get(output_pages, mupdf.PDF_ENUM_NAME_Rotate).m_internal:
+        mupdf.pdf_dict_put_int(node, mupdf.PDF_ENUM_NAME_Rotate, 0)
+    mupdf.pdf_array_push(mupdf.pdf_dict_get(output_pages, mupdf.PDF_ENUM_NAME_Kids), node)
+    page_count = mupdf.pdf_dict_get_int(output_pages, mupdf.PDF_ENUM_NAME_Count) + batch.page_count
+    mupdf.pdf_dict_put_int(output_pages, mupdf.PDF_ENUM_NAME_Count, page_count)
+
+    # Widgets only work when their fields are listed in the document's /AcroForm
+    batch_form = mupdf.pdf_dict_getp(mupdf.pdf_trailer(batch_pdf), "Root/AcroForm")
+    batch_fields = mupdf.pdf_dict_get(batch_form, mupdf.PDF_ENUM_NAME_Fields)
+    if mupdf.pdf_is_array(batch_fields) and mupdf.pdf_array_len(batch_fields):
+        output_root = mupdf.pdf_dict_getp(mupdf.pdf_trailer(output_pdf), "Root")
+        output_form = mupdf.pdf_dict_get(output_root, mupdf.PDF_ENUM_NAME_AcroForm)
+        if not mupdf.pdf_is_dict(output_form):
+            output_form = mupdf.pdf_dict_put_dict(output_root, mupdf.PDF_ENUM_NAME_AcroForm, 2)
+        output_fields = mupdf.pdf_dict_get(output_form, mupdf.PDF_ENUM_NAME_Fields)
+        if not mupdf.pdf_is_array(output_fields):
+            output_fields = mupdf.pdf_dict_put_array(output_form, mupdf.PDF_ENUM_NAME_Fields, 8)
+        for index in range(mupdf.pdf_array_len(batch_fields)):
+            mupdf.pdf_array_push(output_fields,
+                                 mupdf.pdf_graft_mapped_object(graft_map, mupdf.pdf_array_get(batch_fields, index)))
+        for key in (mupdf.PDF_ENUM_NAME_DR, mupdf.PDF_ENUM_NAME_DA):
+            value = mupdf.pdf_dict_get(batch_form, key)
+            if value.m_internal and not mupdf.pdf_dict_get(output_form, key).m_internal:
+                mupdf.pdf_dict_put(output_form, key, mupdf.pdf_graft_mapped_object(graft_map, value))
+    return graft_map
+
+
+# Raise ValueError if pages cannot be appended to the PDF file at path as an incremental update
+# (encrypted or damaged files, or files that would need a full rewrite)
+def check_appendable(path):
+    try:
+        output = pymupdf.open(path, filetype="pdf")
+    except Exception as e:
+        raise ValueError(f"{path} cannot be opened - {e}") from None
+    try:
+        if output.needs_pass:
+            raise ValueError(f"{path} is encrypted")
+        if not output.can_save_incrementally():
+            raise ValueError(f"{path} cannot be saved incrementally")
+    finally:
+        output.close()
+
+
+# Numbers and generations of the objects of the catalog, root page tree node and form that
+# append_page_tree() may change (the ones stored as indirect objects)
+def _page_tree_xrefs(pdf):
+    root = mupdf.pdf_dict_get(mupdf.pdf_trailer(pdf), mupdf.PDF_ENUM_NAME_Root)
+    pages = mupdf.pdf_dict_get(root, mupdf.PDF_ENUM_NAME_Pages)
+    form = mupdf.pdf_dict_get(root, mupdf.PDF_ENUM_NAME_AcroForm)
+    objects = [root, pages, mupdf.pdf_dict_get(pages, mupdf.PDF_ENUM_NAME_Kids), form,
+               mupdf.pdf_dict_get(form, mupdf.PDF_ENUM_NAME_Fields)]
+    return {mupdf.pdf_to_num(obj): mupdf.pdf_to_gen(obj) for obj in objects if mupdf.pdf_is_indirect(obj)}
+
+
+# Write the objects of a document opened from path given as {number: generation} at the end of that file, followed by
+# an xref section and a trailer pointing to the previous one (an incremental update, PDF 7.5.6).
+# saveIncr() looks at every object of the document to find the changed ones, which takes seconds
+# on a file with millions of objects; the caller knows which ones changed, so this costs time
+# proportional to what is written. The xref is a table or a stream like the previous section.
+# The document must not be saved afterwards, its trailer is changed to build the new one.
+def _write_update(document, path, objects):
+    pdf = mupdf.pdf_document_from_fz_document(document.this)
+    offsets = {}
+    with open(path, "r+b") as output:
+        output.seek(0, os.SEEK_END)
+        output.write(b"\n")
+        for xref in sorted(objects):
+            if not mupdf.pdf_object_exists(pdf, xref):
+                continue
+            stream = None
+            if mupdf.pdf_obj_num_is_stream(pdf, xref):
+                stream = document.xref_stream_raw(xref) or b""
+                mupdf.pdf_dict_put_int(mupdf.pdf_load_object(pdf, xref), mupdf.PDF_ENUM_NAME_Length, len(stream))
+            offsets[xref] = output.tell()
+            output.write(b"%d %d obj\n" % (xref, objects[xref])
+                         + document.xref_object(xref, compressed=True, ascii=True).encode())
+            if stream is not None:
+                output.write(b"\nstream\n" + stream + b"\nendstream")
+            output.write(b"\nendobj\n")
+
+        # The trailer of the document is reused for the new section, the document is not saved
+        trailer = mupdf.pdf_trailer(pdf)
+        for key in ("XRefStm", "Type", "Index", "W", "Filter", "DecodeParms", "Length"):
+            mupdf.pdf_dict_dels(trailer, key)
+        mupdf.pdf_dict_put_int(trailer, mupdf.PDF_ENUM_NAME_Prev, pdf.m_internal.startxref)
+        size = document.xref_length()
+        startxref = output.tell()
+        if pdf.m_internal.last_xref_was_old_style:
+            mupdf.pdf_dict_put_int(trailer, mupdf.PDF_ENUM_NAME_Size, size)
+            output.write(b"xref\n")
+            for first, last in page_runs(offsets):
+                output.write(b"%d %d\n" % (first, last - first + 1))
+                output.write(b"".join(b"%010d %05d n\r\n" % (offsets[xref], objects[xref])
+                                      for xref in range(first, last + 1)))
+            output.write(b"trailer\n" + document.xref_object(-1, compressed=True, ascii=True).encode())
+        else:
+            # The xref stream is a new object and lists itself
+            offsets[size] = startxref
+            objects[size] = 0
+            index = mupdf.pdf_dict_put_array(trailer, mupdf.PDF_ENUM_NAME_Index, 2)
+            for first, last in page_runs(offsets):
+                mupdf.pdf_array_push_int(index, first)
+                mupdf.pdf_array_push_int(index, last - first + 1)
+            data = b"".join(b"\x01" + offsets[xref].to_bytes(8, "big") + objects[xref].to_bytes(2, "big")
+                            for xref in offsets)
+            mupdf.pdf_dict_put(trailer, mupdf.PDF_ENUM_NAME_Type, mupdf.PDF_ENUM_NAME_XRef)
+            mupdf.pdf_dict_put_int(trailer, mupdf.PDF_ENUM_NAME_Size, size + 1)
+            width = mupdf.pdf_dict_put_array(trailer, mupdf.PDF_ENUM_NAME_W, 3)
+            for value in (1, 8, 2):
+                mupdf.pdf_array_push_int(width, value)
+            mupdf.pdf_dict_put_int(trailer, mupdf.PDF_ENUM_NAME_Length, len(data))
+            output.write(b"%d 0 obj\n" % size + document.xref_object(-1, compressed=True, ascii=True).encode()
+                         + b"\nstream\n" + data + b"\nendstream\nendobj\n")
+        output.write(b"\nstartxref\n%d\n%%%%EOF\n" % startxref)
+
+
+# Append the pages of an open document to a PDF file on disk with an incremental update: only the
+# new objects, the changed page tree nodes and a new xref section are written at the end of the
+# file, so the cost depends on the pages appended, not on the size of the file.
+# With a stream_index, streams already in the file are not written again (see deduplicate_streams).
+# Returns (objects removed, bytes saved) by the de-duplication.
+def append_to_pdf_file(path, document, stream_index=None):
+    output = pymupdf.open(path)
+    try:
+        if not output.can_save_incrementally():
+            raise ValueError(f"{path} cannot be saved incrementally")
+        first_xref = output.xref_length()
+        append_page_tree(output, document)
+        deduplicated = (0, 0)
+        if stream_index is not None:
+            deduplicated = deduplicate_streams(output, first_xref, stream_index)
+        output_pdf = mupdf.pdf_document_from_fz_document(output.this)
+        changed = dict.fromkeys(range(first_xref, output.xref_length()), 0)
+        changed.update(_page_tree_xrefs(output_pdf))
+        _write_update(output, path, changed)
+    finally:
+        output.close()
+    return deduplicated
+
+
+# Merged PDF built on disk one input at a time. Each input is opened, its pages are copied into
+# an in-memory batch and it is closed again, so only one input is open at once. Every flush_mb of
+# input (or FLUSH_PAGES pages), the batch is appended to the output file with an incremental save
+# and released, so memory stays bounded however many inputs are merged. Use as a context manager:
+# the output file only appears once close() has written everything.
+# With deduplicate=True, identical streams (fonts, images, ICC profiles...) of all the inputs are
+# stored once; deduplicated_objects and saved_bytes report what was left out.
+# With append=True, the pages are added to the existing PDF at output_path as incremental updates,
+# so the existing content is neither read nor rewritten and the cost depends on the new pages
+# only. De-duplication then only covers the new inputs. abort() truncates the file back to its
+# original size.
+class StreamingMerger:
+
+    def __init__(self, output_path, flush_mb=FLUSH_MB, deduplicate=False,
+                 dedup_memory_entries=DEDUP_MEMORY_ENTRIES, append=False):
+        self.output_path = output_path
+        self.partial_path = f"{output_path}.part"
+        self.flush_bytes = int(flush_mb * 1024 * 1024)
+        self.page_count = 0
+        self.deduplicated_objects = 0
+        self.saved_bytes = 0
+        self._original_size = None
+        if append:
+            check_appendable(output_path)
+            self.partial_path = output_path
+            self._original_size = os.path.getsize(output_path)
+        self._stream_index = None
+        if deduplicate:
+            self._stream_index = StreamIndex(f"{output_path}.dedup-index", dedup_memory_entries)
+        self._batch = pymupdf.open()
+        self._batch_bytes = 0
+        self._started = append
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    # Copy every page of a PDF file to the end of the merge; returns the number of pages added
+    def add(self, pdf_path):
+        with metrics.stage("read"):
+            source = pymupdf.open(pdf_path)
+        try:
+            if source.needs_pass:
+                raise ValueError("The document is encrypted")
+            with metrics.stage("operation"):
+                self._batch.insert_pdf(source)
+            page_count = source.page_count
+        finally:
+            source.close()
+        self.page_count += page_count
+        self._batch_bytes += os.path.getsize(pdf_path)
+        if self._batch_bytes >= self.flush_bytes or self._batch.page_count >= FLUSH_PAGES:
+            self.flush()
+        return page_count
+
+    # Copy every page of a PDF that is itself a merge of several inputs (e.g. a part built by a
+    # worker process) to the end of the merge. The part becomes one batch: its page tree is
+    # grafted as a whole, without copying its pages one by one. Returns the number of pages added.
+    def add_part(self, pdf_path):
+        self.flush()
+        self._batch.close()
+        with metrics.stage("read"):
+            self._batch = pymupdf.open(pdf_path)
+        page_count = self._batch.page_count
+        self.page_count += page_count
+        self.flush()
+        return page_count
+
+    # Append the pages copied so far to the output file and release them
+    def flush(self):
+        if self._batch.page_count == 0:
+            return
+        with metrics.stage("write"):
+            if self._started:
+                removed, saved_bytes = append_to_pdf_file(self.partial_path, self._batch, self._stream_index)
+            else:
+                removed, saved_bytes = 0, 0
+                if self._stream_index is not None:
+                    removed, saved_bytes = deduplicate_streams(self._batch, 1, self._stream_index)
+                self._batch.save(self.partial_path)
+                self._started = True
+        self.deduplicated_objects += removed
+        self.saved_bytes += saved_bytes
+        self._batch.close()
+        self._batch = pymupdf.open()
+        self._batch_bytes = 0
+
+    # Write the remaining pages and move the complete file to output_path
+    def close(self):
+        self.flush()
+        self._batch.close()
+        if self._stream_index is not None:
+            self._stream_index.close()
+        if not self._started:
+            raise ValueError("No pages to merge")
+        if self.partial_path != self.output_path:
+            os.replace(self.partial_path, self.output_path)
+        return self.output_path
+
+    # Drop the merge, removing the incomplete output or the updates appended to an existing file
+    def abort(self):
+        self._batch.close()
+        if self._stream_index is not None:
+            self._stream_index.close()
+        if self._original_size is not None:
+            os.truncate(self.partial_path, self._original_size)
+        elif os.path.exists(self.partial_path):
+            os.remove(self.partial_path)
+
+
+# Copy the pages of the input pdf_file (relative to path_input) to the end of the merge, turning
+# any exception into a failed result. The pages and stage times are in the result metrics.
+def merge_input(merger, path_input, pdf_file):
+    start_time = time.perf_counter()
+    metrics.begin(pdf_file)
+    try:
+        page_count = merger.add(os.path.join(path_input, pdf_file))
+        metrics.record(pages=page_count)
+        result = FileResult(pdf_file, True)
+    except Exception as e:
+        result = FileResult(pdf_file, False, error=str(e))
+    result.elapsed = time.perf_counter() - start_time
+    result.metrics = metrics.finish()
+    return result
+
+
+# Split the inputs, in order, into chunks of at most flush_mb of input data, and small enough
+# that every worker gets CHUNKS_PER_WORKER of them
+def chunk_files(path_input, pdf_files, workers, flush_mb):
+    max_files = max(1, -(-len(pdf_files) // (workers * CHUNKS_PER_WORKER)))
+    max_bytes = flush_mb * 1024 * 1024
+    chunk, chunk_bytes = [], 0
+    for pdf_file in pdf_files:
+        chunk.append(pdf_file)
+        chunk_bytes += os.path.getsize(os.path.join(path_input, pdf_file))
+        if len(chunk) >= max_files or chunk_bytes >= max_bytes:
+            yield chunk
+            chunk, chunk_bytes = [], 0
+    if chunk:
+        yield chunk
+
+
+# Worker process: merge a chunk of inputs into the part file part_path. Returns the result of
+# every input, the number of pages of the part (0 if no input could be read, the part is then
+# not written) and what the de-duplication removed from it.
+def merge_chunk(path_input, pdf_files, part_path, flush_mb, deduplicate):
+    merger = StreamingMerger(part_path, flush_mb=flush_mb, deduplicate=deduplicate)
+    try:
+        results = [merge_input(merger, path_input, pdf_file) for pdf_file in pdf_files]
+    except BaseException:
+        merger.abort()
+        raise
+    if merger.page_count:
+        merger.close()
+    else:
+        merger.abort()
+    return results, merger.page_count, merger.deduplicated_objects, merger.saved_bytes
+
+
+# Merge the inputs (relative to path_input) into merger with worker processes, which parse and
+# merge chunks of consecutive inputs into part files next to the output. The parts are appended
+# to merger in input order as they complete (see StreamingMerger.add_part()), while the following
+# chunks are still being merged: parsing and copying the inputs, which dominates large merges, is
+# spread over the workers, and appending a part only grafts its page tree.
+# Calls on_result with the result of every input, in order. Returns (objects, bytes) removed by
+# the de-duplication in the workers; merger counts what it removes across parts itself.
+def merge_parallel(merger, path_input, pdf_files, workers, flush_mb=FLUSH_MB, deduplicate=False, on_result=None):
+    log_queue, listener = start_worker_log_listener()
+    in_flight = deque()
+    deduplicated_objects = saved_bytes = 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker_logging,
+                                 initargs=(log_queue, logging.getLogger().level)) as executor:
+            try:
+                chunks = enumerate(chunk_files(path_input, pdf_files, workers, flush_mb))
+                exhausted = False
+                while in_flight or not exhausted:
+                    while not exhausted and len(in_flight) < workers * IN_FLIGHT_PER_WORKER:
+                        item = next(chunks, None)
+                        if item is None:
+                            exhausted = True
+                        else:
+                            index, chunk = item
+                            part_path = f"{merger.output_path}.{index}.part"
+                            future = executor.submit(merge_chunk, path_input, chunk, part_path, flush_mb, deduplicate)
+                            in_flight.append((future, chunk, part_path))
+                    if not in_flight:
+                        break
+
+                    future, chunk, part_path = in_flight.popleft()
+                    try:
+                        results, page_count, removed, removed_bytes = future.result()
+                    except Exception as e:
+                        # The worker itself died (e.g. killed by the OS), not just the operation
+                        results = [FileResult(pdf_file, False, error=f"worker error: {e}") for pdf_file in chunk]
+                        page_count = removed = removed_bytes = 0
+                    if page_count:
+                        try:
+                            merger.add_part(part_path)
+                        finally:
+                            os.remove(part_path)
+                    deduplicated_objects += removed
+                    saved_bytes += removed_bytes
+                    if on_result is not None:
+                        for result in results:
+                            on_result(result)
+            finally:
+                for future, _, _ in in_flight:
+                    future.cancel()
+    finally:
+        listener.stop()
+        for _, _, part_path in in_flight:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+    return deduplicated_objects, saved_bytes
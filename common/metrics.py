@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+# ==============================================================================
+#   Author: João Manoel Feck
+#   Email: joaomfeck@gmail.com
+#   GitHub: https://github.com/jmfeck
+# ==============================================================================
+
+import os
+import sys
+import json
+import math
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# Percentiles reported at the end of every run
+PERCENTILES = (50, 90, 99)
+
+# Metrics of the file currently processed by this process (one file at a time per process)
+_current = None
+
+# Whether the peak memory of the process was reset when the current file began
+_peak_reset = False
+
+
+# Peak resident memory of the current process in MB, or None where it cannot be measured.
+# This is a high-water mark over the life of the process: in a worker it covers every file the
+# worker processed so far. Per-file peaks use reset_peak_rss() and file_peak_rss_mb() instead.
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+# Reset the peak resident memory of the current process (VmHWM), so that it covers what runs next.
+# Linux only: writing 5 to /proc/self/clear_refs resets it. Returns False where it cannot be reset.
+def reset_peak_rss():
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        return False
+    return True
+
+
+# Peak resident memory in MB since the last reset_peak_rss(), read from /proc/self/status
+def file_peak_rss_mb():
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+# Start collecting metrics for one input file
+def begin(name):
+    global _current, _peak_reset
+    _current = {"file": name, "stages": {}, "pages": None}
+    _peak_reset = reset_peak_rss()
+
+
+# Stop collecting and return the metrics of the file as a plain (picklable) dict. peak_rss_mb is
+# the peak memory while the file was processed. Where the peak cannot be reset (macOS, Windows),
+# process_peak_rss_mb is reported instead: the peak of the process so far, which also covers the
+# files processed before this one by the same worker.
+def finish():
+    global _current
+    data, _current = _current, None
+    if data is not None:
+        peak = file_peak_rss_mb() if _peak_reset else None
+        if peak is not None:
+            data["peak_rss_mb"] = round(peak, 1)
+        else:
+            peak = peak_rss_mb()
+            data["process_peak_rss_mb"] = round(peak, 1) if peak is not None else None
+    return data
+
+
+# Time a block of work under the given stage name (e.g. "read", "operation", "write").
+# Outside of a batch run this is a no-op timer, so the tool functions can always use it.
+@contextmanager
+def stage(name):
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        if _current is not None:
+            stages = _current["stages"]
+            stages[name] = stages.get(name, 0.0) + time.perf_counter() - start_time
+
+
+# Record counters of the current file, e.g. record(pages=12)
+def record(**values):
+    if _current is not None:
+        _current.update(values)
+
+
+# Add to counters of the current file, e.g. count(image_cache_hits=1). Unlike record(), the
+# counters are also totalled over the run in the summary.
+def count(**increments):
+    if _current is not None:
+        counters = _current.setdefault("counters", {})
+        for name, value in increments.items():
+            counters[name] = counters.get(name, 0) + value
+
+
+# Stage times recorded so far for the current file
+def stage_times():
+    return dict(_current["stages"]) if _current is not None else {}
+
+
+# Total size in bytes of a list of files and folders (some tools return a folder per input)
+def size_of(paths):
+    total = 0
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                total += sum(os.path.getsize(os.path.join(root, filename)) for filename in files)
+        elif os.path.isfile(path):
+            total += os.path.getsize(path)
+    return total
+
+
+# Parse a size in bytes with an optional K, M or G suffix, e.g. "25M"
+def parse_byte_size(value):
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    value = value.strip().upper().rstrip("B")
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+# Nearest-rank percentile of an already sorted list
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+# Append-only JSON lines file with one record per processed file and a final summary record
+class MetricsWriter:
+
+    def __init__(self, path_metrics):
+        self.path_metrics = path_metrics
+        self.records = []
+        self._file = None
+        if path_metrics is not None:
+            os.makedirs(os.path.dirname(path_metrics), exist_ok=True)
+            self._file = open(path_metrics, "a", encoding="utf-8")
+
+    def write(self, data):
+        if data.get("status") == "ok":
+            self.records.append(data)
+        if self._file is not None:
+            self._file.write(json.dumps(data, default=str) + "\n")
+            self._file.flush()
+
+    # Percentiles of the total time and of every stage, plus totals, over the successful files
+    def summary(self):
+        summary = {"type": "summary", "files": len(self.records),
+                   "pages": sum(data.get("pages") or 0 for data in self.records),
+                   "input_bytes": sum(data.get("input_bytes") or 0 for data in self.records),
+                   "output_bytes": sum(data.get("output_bytes") or 0 for data in self.records)}
+
+        series = {"elapsed": [data["elapsed"] for data in self.records]} if self.records else {}
+        for data in self.records:
+            for name, seconds in data["stages"].items():
+                series.setdefault(name, []).append(seconds)
+        counters = {}
+        for data in self.records:
+            for name, value in (data.get("counters") or {}).items():
+                counters[name] = counters.get(name, 0) + value
+        if counters:
+            summary["counters"] = counters
+        for name in ("peak_rss_mb", "process_peak_rss_mb"):
+            peaks = [data[name] for data in self.records if data.get(name) is not None]
+            if peaks:
+                series[name] = peaks
+
+        summary["percentiles"] = {}
+        for name, values in series.items():
+            values = sorted(values)
+            summary["percentiles"][name] = {f"p{pct}": round(percentile(values, pct), 4) for pct in PERCENTILES}
+            summary["percentiles"][name]["max"] = round(values[-1], 4)
+        return summary
+
+    def close(self):
+        summary = self.summary()
+        summary["finished_at"] = datetime.now().isoformat(timespec="seconds")
+        if self._file is not None:
+            self._file.write(json.dumps(summary) + "\n")
+            self._file.close()
+            self._file = None
+        return summary
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+# ==============================================================================
+#   Author: João Manoel Feck
+#   Email: joaomfeck@gmail.com
+#   GitHub: https://github.com/jmfeck
+# ==============================================================================
+
+import pymupdf
+from lazypdf.core import PDFFile
+from common import metrics
+from common.image_recompress import recompress_images
+
+
+# Each operation takes an open lazypdf document and the tool options and returns
+# the transformed document; they mirror the calls made by the individual tools.
+def repair(pdf, options):
+    return pdf.repair(engine=options.get("engine", "auto"))
+
+
+def rotate(pdf, options):
+    return pdf.rotate(options.get("rotate", 90))
+
+
+def resize(pdf, options):
+    return pdf.resize(options.get("size", "a4"))
+
+
+def add_page_numbers(pdf, options):
+    return pdf.add_page_numbers(position=options.get("position", "bottom-right"))
+
+
+def add_image_watermark(pdf, options):
+    watermark_path = options.get("watermark_path")
+    if not watermark_path:
+        raise ValueError("add_image_watermark requires a watermark image path")
+    return pdf.add_image_watermark(watermark_path, opacity=options.get("watermark_transparency", 0.5),
+                                   overlay=False)
+
+
+# Images are recompressed by recompress_images(), as compress-pdf does: lazypdf's
+# compress(img_quality=...) stores the JPEG data under /FlateDecode, which viewers cannot read.
+# It works on a PyMuPDF copy of the document, without the encryption set by encrypt() (see
+# parse_steps()). compress() then selects the save options of save_compressed() for the output.
+def compress(pdf, options):
+    img_quality = options.get("img_quality")
+    if img_quality is not None:
+        document = pymupdf.open("pdf", pdf.to_bytes())
+        path = pdf.path
+        pdf.close()
+        stats = recompress_images(document, img_quality, options.get("threads", 1))
+        metrics.count(images=stats.images, images_recompressed=stats.recompressed,
+                      image_input_bytes=stats.input_bytes, image_output_bytes=stats.output_bytes)
+        pdf = PDFFile(document, path)
+    return pdf.compress(compression_level=options.get("compression_level", 5))
+
+
+def encrypt(pdf, options):
+    password = options.get("password")
+    if not password:
+        raise ValueError("encrypt requires a password")
+    return pdf.encrypt(password, algorithm=options.get("algorithm", "AES-256-R5"))
+
+
+OPERATIONS = {
+    "repair": repair,
+    "rotate": rotate,
+    "resize": resize,
+    "add_page_numbers": add_page_numbers,
+    "add_image_watermark": add_image_watermark,
+    "compress": compress,
+    "encrypt": encrypt,
+}
+
+
+# Parse a comma-separated list of operation names, e.g. "repair,rotate,compress"
+def parse_steps(steps):
+    names = [name.strip() for name in steps.split(',') if name.strip()]
+    unknown = [name for name in names if name not in OPERATIONS]
+    if unknown:
+        raise ValueError(f"Unknown operation(s): {', '.join(unknown)}. Options: {', '.join(OPERATIONS)}")
+    if not names:
+        raise ValueError("At least one operation is required")
+    # The encryption is applied when the document is written, after every step
+    if "encrypt" in names and names[-1] != "encrypt":
+        raise ValueError("encrypt must be the last operation")
+    return names
+
+
+# Apply the operations in order to one in-memory document, timing every stage in the per-file
+# metrics (see metrics.stage_times)
+def run_steps(pdf, steps, options):
+    for name in steps:
+        with metrics.stage(name):
+            pdf = OPERATIONS[name](pdf, options)
+    return pdf
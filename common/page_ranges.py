@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+# ==============================================================================
+#   Author: João Manoel Feck
+#   Email: joaomfeck@gmail.com
+#   GitHub: https://github.com/jmfeck
+# ==============================================================================
+
+# Page range specs such as "1-3,5,7-9" (1-indexed, matching lazypdf convention).
+# Specs are kept as (first, last) pairs and pages are only generated while they are consumed,
+# so "1-1000000" costs the same as "1".
+
+
+# Parse a page range spec into (first, last) pairs, in the order given
+def parse_page_ranges(page_ranges):
+    ranges = []
+    for part in page_ranges.split(','):
+        part = part.strip()
+        try:
+            if '-' in part:
+                first, last = map(int, part.split('-'))
+            else:
+                first = last = int(part)
+        except ValueError:
+            raise ValueError(f"Invalid page range '{part}' in '{page_ranges}'") from None
+        if first < 1 or last < first:
+            raise ValueError(f"Invalid page range '{part}' in '{page_ranges}'")
+        ranges.append((first, last))
+    return ranges
+
+
+# Sort the ranges and join the ones that overlap or touch, e.g. [(5, 9), (1, 3), (4, 6)] -> [(1, 9)]
+def merge_ranges(ranges):
+    merged = []
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+    return merged
+
+
+# Sorted, de-duplicated page numbers of the ranges that exist in a document of page_count pages
+def iter_pages(ranges, page_count):
+    for first, last in merge_ranges(ranges):
+        if first > page_count:
+            break
+        yield from range(first, min(last, page_count) + 1)
+
+
+# Ranges given more than once, e.g. [(1, 3), (5, 5), (1, 3)] -> [(1, 3)]
+def duplicate_ranges(ranges):
+    seen = set()
+    duplicates = []
+    for page_range in ranges:
+        if page_range in seen and page_range not in duplicates:
+            duplicates.append(page_range)
+        seen.add(page_range)
+    return duplicates
+
+
+# Parts of the ranges that lie beyond the last page of the document
+def ranges_out_of_range(ranges, page_count):
+    return [(max(first, page_count + 1), last) for first, last in merge_ranges(ranges) if last > page_count]
+
+
+# Format (first, last) pairs back into a spec, e.g. [(1, 3), (5, 5)] -> "1-3,5"
+def format_ranges(ranges):
+    return ",".join(str(first) if first == last else f"{first}-{last}" for first, last in ranges)
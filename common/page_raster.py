@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+# ==============================================================================
+#   Author: João Manoel Feck
+#   Email: joaomfeck@gmail.com
+#   GitHub: https://github.com/jmfeck
+# ==============================================================================
+
+import os
+import re
+import logging
+import pymupdf
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from common import metrics
+from common.logging_setup import init_worker_logging, start_worker_log_listener
+from common.merge_writer import StreamingMerger
+
+# Consecutive pages rendered into one part file by a worker
+CHUNK_PAGES = 8
+
+# Pages being rendered or waiting to be appended, by default (see flatten_parallel())
+MAX_IN_FLIGHT_PAGES = 64
+
+# Source document of a worker process, opened once by its initializer
+_source = None
+
+_REFERENCE = re.compile(r"(\d+) 0 R")
+
+
+# Entries of an array value read with xref_get_key(): inline, or an indirect array object
+def _array_items(document, value_type, value):
+    if value_type == "xref":
+        value = document.xref_object(int(value.split()[0]), compressed=True)
+    elif value_type != "array":
+        return []
+    return [int(reference) for reference in _REFERENCE.findall(value)]
+
+
+# 1-based numbers of the pages that have something to flatten: annotations in their /Annots other
+# than links, which have no appearance, or widgets of the AcroForm fields (found through /P).
+# Only dictionaries are read, no page is parsed or rendered.
+def annotated_pages(document):
+    page_numbers = {document.page_xref(index): index + 1 for index in range(document.page_count)}
+    pages = set()
+    for page_xref, page_num in page_numbers.items():
+        for annot in _array_items(document, *document.xref_get_key(page_xref, "Annots")):
+            if document.xref_get_key(annot, "Subtype")[1] != "/Link":
+                pages.add(page_num)
+                break
+    pending = _array_items(document, *document.xref_get_key(document.pdf_catalog(), "AcroForm/Fields"))
+    seen = set()
+    while pending:
+        field = pending.pop()
+        if field in seen:
+            continue
+        seen.add(field)
+        page_type, page = document.xref_get_key(field, "P")
+        if page_type == "xref" and int(page.split()[0]) in page_numbers:
+            pages.add(page_numbers[int(page.split()[0])])
+        pending.extend(_array_items(document, *document.xref_get_key(field, "Kids")))
+    return sorted(pages)
+
+
+def _init_worker(pdf_path, log_queue, level):
+    global _source
+    init_worker_logging(log_queue, level)
+    _source = pymupdf.open(pdf_path)
+
+
+# Worker process: flatten pages first_index to last_index (0-based) of the source into the part
+# file part_path, as lazypdf's flatten() does: every page is replaced by an image of it at dpi.
+# With flatten_indexes, only those pages are, the others are copied as they are.
+# Only one pixmap is held at a time, the images go to the part already compressed.
+def flatten_chunk(first_index, last_index, dpi, part_path, flatten_indexes=None):
+    part = pymupdf.open()
+    try:
+        for index in range(first_index, last_index + 1):
+            if flatten_indexes is not None and index not in flatten_indexes:
+                part.insert_pdf(_source, from_page=index, to_page=index)
+                continue
+            page = _source[index]
+            pixmap = page.get_pixmap(dpi=dpi)
+            new_page = part.new_page(width=page.rect.width, height=page.rect.height)
+            new_page.insert_image(new_page.rect, pixmap=pixmap)
+            pixmap = None
+        part.save(part_path, deflate=True)
+    finally:
+        part.close()
+    return last_index - first_index + 1
+
+
+# Flatten a PDF like lazypdf's flatten(dpi=...) with `workers` processes. Each worker opens the
+# source once and renders chunks of up to CHUNK_PAGES consecutive pages into part files next to
+# the output, so the pixmaps never go through pickling. The parts are appended to the output in
+# page order by a StreamingMerger, while the following chunks are rendered. Chunks are only
+# submitted while at most max_in_flight_pages pages are being rendered or waiting to be appended,
+# which bounds the memory and the disk space used by the parts. With pages (1-based numbers), only
+# those pages are flattened, as with flatten(pages=...). Returns the number of pages.
+def flatten_parallel(pdf_path, output_path, dpi, workers, max_in_flight_pages=MAX_IN_FLIGHT_PAGES, pages=None):
+    with metrics.stage("read"):
+        source = pymupdf.open(pdf_path)
+        try:
+            if source.needs_pass:
+                raise ValueError("The document is encrypted")
+            page_count = source.page_count
+        finally:
+            source.close()
+    if page_count == 0:
+        raise ValueError("The document has no pages")
+    metrics.record(pages=page_count)
+
+    chunk_pages = max(1, min(CHUNK_PAGES, max_in_flight_pages // workers, -(-page_count // workers)))
+    max_chunks = max(1, max_in_flight_pages // chunk_pages)
+    chunks = iter(range(0, page_count, chunk_pages))
+    flatten_indexes = None if pages is None else {page_num - 1 for page_num in pages}
+    log_queue, listener = start_worker_log_listener()
+    in_flight = deque()
+    try:
+        with StreamingMerger(output_path) as merger:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(pdf_path, log_queue, logging.getLogger().level)) as executor:
+                try:
+                    while True:
+                        while len(in_flight) < max_chunks:
+                            first_index = next(chunks, None)
+                            if first_index is None:
+                                break
+                            last_index = min(first_index + chunk_pages, page_count) - 1
+                            part_path = f"{output_path}.{first_index}.part"
+                            chunk_indexes = None
+                            if flatten_indexes is not None:
+                                chunk_indexes = flatten_indexes.intersection(range(first_index, last_index + 1))
+                            future = executor.submit(flatten_chunk, first_index, last_index, dpi, part_path,
+                                                     chunk_indexes)
+                            in_flight.append((future, part_path))
+                        if not in_flight:
+                            break
+                        future, part_path = in_flight.popleft()
+                        with metrics.stage("operation"):
+                            future.result()
+                        try:
+                            merger.add_part(part_path)
+                        finally:
+                            os.remove(part_path)
+                finally:
+                    for future, _ in in_flight:
+                        future.cancel()
+    finally:
+        listener.stop()
+        for _, part_path in in_flight:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+    return page_count
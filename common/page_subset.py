@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+# ==============================================================================
+#   Author: João Manoel Feck
+#   Email: joaomfeck@gmail.com
+#   GitHub: https://github.com/jmfeck
+# ==============================================================================
+
+import re
+import pymupdf
+from common import metrics
+from common.page_ranges import iter_pages
+
+# Save options of the parts: streams the source left uncompressed are deflated, the rest is
+# written as is. There is no garbage collection pass, a part never holds unused objects.
+PART_SAVE_OPTIONS = {"deflate": True}
+
+# Save options of compressed parts, the same as lazypdf's compress() without image recompression:
+# every stream is deflated and duplicate objects are merged
+COMPRESSED_SAVE_OPTIONS = {"garbage": 4, "deflate": True, "deflate_images": True, "deflate_fonts": True,
+                           "clean": True}
+
+# Size estimates for --max-bytes: bytes written around each object ("n 0 obj", "endobj", the
+# stream keywords and its xref entry) and around each part (header, catalog, page tree, trailer)
+OBJECT_OVERHEAD = 60
+PART_OVERHEAD = 1024
+
+_REFERENCE = re.compile(r"(\d+) 0 R")
+_PARENT = re.compile(r"/Parent\s*\d+ 0 R")
+
+
+# Group sorted page numbers into runs of consecutive pages, e.g. [1, 2, 3, 7] -> [(1, 3), (7, 7)]
+def page_runs(page_numbers):
+    runs = []
+    for page_num in page_numbers:
+        if runs and page_num == runs[-1][1] + 1:
+            runs[-1] = (runs[-1][0], page_num)
+        else:
+            runs.append((page_num, page_num))
+    return runs
+
+
+# Copy the given pages (1-based) of an open PyMuPDF document into a new document.
+# insert_pdf() only copies the objects the pages reference, and a single graft map is kept for
+# the whole part (final=False until the last run), so an object shared by several pages, such
+# as a font or a logo, is copied once even when the pages are not consecutive.
+def subset_document(source, page_numbers):
+    part = pymupdf.open()
+    runs = page_runs(page_numbers)
+    for index, (first_page, last_page) in enumerate(runs):
+        part.insert_pdf(source, from_page=first_page - 1, to_page=last_page - 1,
+                        final=index == len(runs) - 1)
+    return part
+
+
+# Write the given pages of an open source document to output_path. The source is parsed once
+# by the caller and reused for every part, instead of being copied and compressed per part.
+# compress=True also runs the full compression pass on the part.
+def write_part(source, page_numbers, output_path, compress=False):
+    with metrics.stage("operation"):
+        part = subset_document(source, page_numbers)
+    try:
+        with metrics.stage("write"):
+            part.save(output_path, **(COMPRESSED_SAVE_OPTIONS if compress else PART_SAVE_OPTIONS))
+    finally:
+        part.close()
+    return output_path
+
+
+# Serialized size of an object and the objects it references, read from the xref table of the
+# source without decoding any stream. Cached, since fonts and images are shared by many pages.
+def object_info(source, xref, cache):
+    info = cache.get(xref)
+    if info is None:
+        definition = source.xref_object(xref, compressed=True)
+        size = len(definition) + OBJECT_OVERHEAD
+        if source.xref_is_stream(xref):
+            length_type, length = source.xref_get_key(xref, "Length")
+            if length_type == "xref":
+                length = source.xref_object(int(length.split()[0]), compressed=True)
+            size += int(length) if length.isdigit() else len(source.xref_stream_raw(xref) or b"")
+        info = cache[xref] = (size, [int(reference) for reference in _REFERENCE.findall(definition)])
+    return info
+
+
+# Objects a page carries into a part: the page, its contents, resources and annotations.
+# The page tree (/Parent) and other pages, e.g. link targets, are not followed, insert_pdf()
+# does not copy them either.
+def page_objects(source, page_num, page_xrefs, cache):
+    page_xref = source.page_xref(page_num - 1)
+    definition = _PARENT.sub("", source.xref_object(page_xref, compressed=True))
+    objects = {page_xref}
+    cache.setdefault(page_xref, (len(definition) + OBJECT_OVERHEAD, []))
+    pending = [int(reference) for reference in _REFERENCE.findall(definition)]
+    while pending:
+        xref = pending.pop()
+        if xref in objects or xref in page_xrefs or not 0 < xref < source.xref_length():
+            continue
+        objects.add(xref)
+        pending.extend(object_info(source, xref, cache)[1])
+    return objects
+
+
+# Group consecutive pages into parts whose estimated size stays under max_bytes. The estimate
+# adds up the sizes of the objects the pages reference, counting shared objects once per part,
+# so no part is serialized to measure it. A page larger than max_bytes becomes a part on its own.
+# Yields (page_numbers, estimated_bytes) pairs.
+def parts_by_size(source, page_numbers, max_bytes):
+    page_xrefs = {source.page_xref(index) for index in range(source.page_count)}
+    cache = {}
+    part, part_objects, part_bytes = [], set(), PART_OVERHEAD
+    for page_num in page_numbers:
+        objects = page_objects(source, page_num, page_xrefs, cache)
+        added_bytes = sum(cache[xref][0] for xref in objects - part_objects)
+        if part and part_bytes + added_bytes > max_bytes:
+            yield part, part_bytes
+            part, part_objects, part_bytes = [], set(), PART_OVERHEAD
+            added_bytes = sum(cache[xref][0] for xref in objects)
+        part.append(page_num)
+        part_objects |= objects
+        part_bytes += added_bytes
+    if part:
+        yield part, part_bytes
+
+
+# Parts of a split as lists of 1-based page numbers, generated lazily. Exactly one mode is used:
+# pages: one part per page of the ranges, groups: one part per range, every: consecutive chunks
+# of N pages, max_bytes: consecutive pages up to an estimated size (see parts_by_size). Groups that
+# end up with the same pages once cut at the last page (1-10 and 1-20 of 8 pages) give one part.
+def split_parts(source, pages=None, groups=None, every=None, max_bytes=None):
+    page_count = source.page_count
+    if groups is not None:
+        seen = set()
+        for first, last in groups:
+            last = min(last, page_count)
+            if first <= page_count and (first, last) not in seen:
+                seen.add((first, last))
+                yield list(range(first, last + 1))
+    elif every is not None:
+        for first in range(1, page_count + 1, every):
+            yield list(range(first, min(first + every, page_count + 1)))
+    elif max_bytes is not None:
+        for part, _ in parts_by_size(source, range(1, page_count + 1), max_bytes):
+            yield part
+    else:
+        for page_num in iter_pages(pages, page_count):
+            yield [page_num]
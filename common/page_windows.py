@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+# ==============================================================================
+#   Author: João Manoel Feck
+#   Email: joaomfeck@gmail.com
+#   GitHub: https://github.com/jmfeck
+# ==============================================================================
+
+import os
+import logging
+import pymupdf
+import lazypdf as lz
+from common import metrics
+from common.merge_writer import StreamingMerger
+
+
+# Add the page-window option to the argument parser of a tool with a page-independent operation
+def add_window_arguments(parser):
+    parser.add_argument("--window-pages", type=int, default=0, metavar="N",
+                        help="Process very large PDFs N pages at a time and append every window to the output "
+                             "file, so memory use does not grow with the document size. Default: 0 (load the "
+                             "whole document).")
+
+
+# Apply a page-independent operation to a PDF one window of pages at a time.
+# operation(pdf, first_page) receives a lazypdf document holding only the window and the
+# 1-based number of its first page in the source, and returns the transformed document.
+# Only one window is in memory at once, so peak memory depends on window_pages, not on the
+# document size. Every window is appended to the output by a StreamingMerger, as an incremental
+# update whose cost depends on the window, not on the pages already written. Resources shared by
+# many pages (fonts, a watermark image) are stored once per window instead of once per file, so
+# the output can be slightly larger.
+def process_in_windows(pdf_path, output_path, operation, window_pages):
+    # Windows go through temporary files next to the output, which MuPDF reads lazily,
+    # instead of being copied around in memory
+    window_input_path = f"{output_path}.window-in"
+    window_output_path = f"{output_path}.window-out"
+    source = pymupdf.open(pdf_path)
+    try:
+        page_count = source.page_count
+        if page_count == 0:
+            raise ValueError("The document has no pages")
+        metrics.record(pages=page_count)
+        # The output only appears once it is complete
+        with StreamingMerger(output_path) as merger:
+            for first_index in range(0, page_count, window_pages):
+                last_index = min(first_index + window_pages, page_count) - 1
+                with metrics.stage("read"):
+                    window = pymupdf.open()
+                    window.insert_pdf(source, from_page=first_index, to_page=last_index)
+                    window.save(window_input_path)
+                    window.close()
+                    pdf = lz.read(window_input_path)
+                with metrics.stage("operation"):
+                    pdf = operation(pdf, first_index + 1)
+                with metrics.stage("write"):
+                    pdf.to_pdf(window_output_path)
+                pdf.close()
+                merger.add_part(window_output_path)
+                logging.debug(f"Pages {first_index + 1}-{last_index + 1} of {page_count} written")
+    finally:
+        source.close()
+        for path in (window_input_path, window_output_path):
+            if os.path.exists(path):
+                os.remove(path)
+    return output_path
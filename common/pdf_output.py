@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+# ==============================================================================
+#   Author: João Manoel Feck
+#   Email: joaomfeck@gmail.com
+#   GitHub: https://github.com/jmfeck
+# ==============================================================================
+
+import os
+import re
+import shutil
+import tempfile
+import subprocess
+from common.page_subset import COMPRESSED_SAVE_OPTIONS
+
+# COMPRESSED_SAVE_OPTIONS plus object streams: objects other than streams are packed into
+# compressed object streams, indexed by a cross-reference stream instead of an xref table
+OBJECT_STREAM_SAVE_OPTIONS = dict(COMPRESSED_SAVE_OPTIONS, use_objstms=1)
+
+# Linearization dictionary, the first object of a linearized file
+_LINEARIZED = re.compile(rb"<<\s*/Linearized\s[^>]*>>")
+_LINEARIZED_KEY = re.compile(rb"/([LOENT])\s+(\d+)")
+_LINEARIZED_HINTS = re.compile(rb"/H\s*\[\s*(\d+)\s+(\d+)")
+
+
+# Path of the qpdf executable, which writes the linearized files (MuPDF no longer linearizes)
+def qpdf_path():
+    path = shutil.which("qpdf")
+    if path is None:
+        raise RuntimeError(
+            "Linearized output requires qpdf. Install it (https://github.com/qpdf/qpdf/releases, "
+            "'apt install qpdf' or 'brew install qpdf') and make sure 'qpdf' is on your PATH."
+        )
+    return path
+
+
+# Linearize a PDF with qpdf, which writes the first page and the hint tables at the start of the file
+def linearize(input_path, output_path, object_streams=False):
+    command = [qpdf_path(), "--linearize", f"--object-streams={'generate' if object_streams else 'disable'}",
+               input_path, output_path]
+    completed = subprocess.run(command, capture_output=True, text=True)
+    # Exit code 3 means the file was written with warnings
+    if completed.returncode not in (0, 3):
+        raise RuntimeError(f"qpdf could not linearize {os.path.basename(input_path)}: {completed.stderr.strip()}")
+
+
+# Save an open PyMuPDF document with the compressed save options, in one of the output layouts:
+# xref tables (default), object streams, or linearized (with or without object streams)
+def save_compressed(document, output_path, object_streams=False, linearized=False):
+    if not linearized:
+        document.save(output_path, **(OBJECT_STREAM_SAVE_OPTIONS if object_streams else COMPRESSED_SAVE_OPTIONS))
+        return
+    handle, temp_path = tempfile.mkstemp(suffix=".pdf", dir=os.path.dirname(output_path) or ".")
+    os.close(handle)
+    try:
+        document.save(temp_path, **COMPRESSED_SAVE_OPTIONS)
+        linearize(temp_path, output_path, object_streams)
+    finally:
+        os.remove(temp_path)
+
+
+# Linearization parameters found in the first bytes of a file, or None if it is not linearized:
+# L (file length), O (first page object), E (end of the first page), N (pages), T (main xref offset)
+# and H (hint stream offset and length)
+def linearization(head):
+    match = _LINEARIZED.search(head[:2048])
+    if match is None:
+        return None
+    params = {key.decode(): int(value) for key, value in _LINEARIZED_KEY.findall(match.group())}
+    hints = _LINEARIZED_HINTS.search(match.group())
+    if hints is not None:
+        params["H"] = (int(hints.group(1)), int(hints.group(2)))
+    return params
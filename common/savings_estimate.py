@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+# ==============================================================================
+#   Author: João Manoel Feck
+#   Email: joaomfeck@gmail.com
+#   GitHub: https://github.com/jmfeck
+# ==============================================================================
+
+import re
+import zlib
+import hashlib
+import pymupdf
+from dataclasses import dataclass
+from common.image_recompress import recompressed_size
+from common.page_subset import OBJECT_OVERHEAD, object_info, page_objects
+
+# Pages whose objects are measured to estimate the savings of a document
+SAMPLE_PAGES = 8
+
+_REFERENCE = re.compile(r"(\d+) 0 R")
+
+
+# Bytes of the sampled objects and how many of them compression is expected to save, plus the
+# bytes of the objects nothing uses, which are measured over the whole document
+@dataclass
+class SavingsEstimate:
+    file_bytes: int = 0
+    sampled_pages: int = 0
+    sampled_bytes: int = 0
+    saved_bytes: int = 0
+    unused_bytes: int = 0
+    page_count: int = 0
+
+    # Expected bytes saved on the whole file. When every page was sampled, the bytes saved were
+    # measured on all of them, and the rest of the file (page tree, xref table) is kept as it is.
+    @property
+    def predicted_bytes(self):
+        if self.sampled_pages and self.sampled_pages == self.page_count:
+            return min(self.file_bytes, self.unused_bytes + self.saved_bytes)
+        used_bytes = max(0, self.file_bytes - self.unused_bytes)
+        ratio = self.saved_bytes / self.sampled_bytes if self.sampled_bytes else 0.0
+        return min(self.file_bytes, self.unused_bytes + int(ratio * used_bytes))
+
+    # Expected share of the file saved (0.1 means 10% smaller)
+    @property
+    def ratio(self):
+        return self.predicted_bytes / self.file_bytes if self.file_bytes else 0.0
+
+
+# Up to count 1-based page numbers spread evenly over the document
+def sample_pages(page_count, count=SAMPLE_PAGES):
+    if page_count <= count:
+        return list(range(1, page_count + 1))
+    return [1 + (2 * step + 1) * page_count // (2 * count) for step in range(count)]
+
+
+# Bytes saved on one object: images drawn by the pages are recompressed at img_quality when that
+# is smaller, as recompress_images() does, and streams stored without a filter are deflated at
+# compression_level. Other streams and objects are written back about as they are.
+def _object_savings(document, xref, img_quality, compression_level, cache, scan_aware=False, encoded_keys=None):
+    if not document.xref_is_stream(xref):
+        return 0
+    raw = document.xref_stream_raw(xref) or b""
+    if img_quality is not None:
+        size = recompressed_size(document, xref, img_quality, cache, scan_aware, encoded_keys)
+        if size is not None and size < len(raw):
+            return len(raw) - size
+    if document.xref_get_key(xref, "Filter")[0] == "null":
+        return max(0, len(raw) - len(zlib.compress(raw, compression_level)))
+    return 0
+
+
+# Bytes saved on the content streams of the sampled pages, by content stream xref. The
+# compressed save cleans them (clean=True), which rewrites their operators in a compact syntax
+# and merges them into one deflated stream per page. Each page is copied into a scratch document
+# and cleaned there, so the document itself is not changed. The savings of a page, measured on
+# whole objects (see page_subset.object_info()), are given to its first content stream. Pages
+# MuPDF cannot clean are left out.
+def _content_savings(document, pages, compression_level, sizes):
+    savings = {}
+    scratch = pymupdf.open()
+    try:
+        for page_num in pages:
+            xrefs = [xref for xref in document[page_num - 1].get_contents() if xref not in savings]
+            if not xrefs:
+                continue
+            try:
+                scratch.insert_pdf(document, from_page=page_num - 1, to_page=page_num - 1, links=False, annots=False)
+                page = scratch[-1]
+                page.clean_contents()
+                cleaned = sum(len(zlib.compress(scratch.xref_stream(xref) or b"", compression_level))
+                              + len(scratch.xref_object(xref, compressed=True)) + OBJECT_OVERHEAD
+                              for xref in page.get_contents())
+            except Exception:
+                continue
+            stored = sum(object_info(document, xref, sizes)[0] for xref in xrefs)
+            savings.update(dict.fromkeys(xrefs, 0))
+            savings[xrefs[0]] = max(0, stored - cleaned)
+    finally:
+        scratch.close()
+    return savings
+
+
+# Bytes of the objects that cannot be reached from the trailer, which the compressed save drops.
+# Only dictionaries are read (see page_subset.object_info()), never stream data. The sizes are not
+# shared with page_objects(), which stores pages without their references.
+def _unused_bytes(document):
+    sizes = {}
+    pending = [int(reference) for reference in _REFERENCE.findall(document.xref_object(-1, compressed=True))]
+    used = set()
+    while pending:
+        xref = pending.pop()
+        if xref not in used and 0 < xref < document.xref_length():
+            used.add(xref)
+            pending.extend(object_info(document, xref, sizes)[1])
+    unused_bytes = 0
+    for xref in range(1, document.xref_length()):
+        # Free entries, and object and xref streams, which are rebuilt on save, are not objects of their own
+        if xref in used or document.xref_get_key(xref, "Type")[1] in ("/ObjStm", "/XRef"):
+            continue
+        if document.xref_object(xref, compressed=True) != "null":
+            unused_bytes += object_info(document, xref, sizes)[0]
+    return unused_bytes
+
+
+# Estimate what compressing an open PyMuPDF document of file_bytes bytes would save, from the
+# objects used by a sample of its pages (see sample_pages()). Only those objects are deflated,
+# recompressed or cleaned (see _content_savings()), so the cost barely grows with the page count.
+# Sampled objects identical to another one, which the compressed save merges, count as saved, and
+# so do the unused objects of the whole document.
+# With an ImageCache, the sampled images are encoded once for the estimate and the compression;
+# the cache keys of the images encoded here are added to encoded_keys (see recompress_images()).
+def estimate_savings(document, file_bytes, img_quality=None, compression_level=5, cache=None, scan_aware=False,
+                     encoded_keys=None):
+    pages = sample_pages(document.page_count)
+    page_xrefs = {document.page_xref(index) for index in range(document.page_count)}
+    sizes, objects, images = {}, set(), set()
+    for page_num in pages:
+        objects |= page_objects(document, page_num, page_xrefs, sizes)
+        images.update(image[0] for image in document[page_num - 1].get_images(full=True))
+
+    estimate = SavingsEstimate(file_bytes, len(pages), unused_bytes=_unused_bytes(document),
+                               page_count=document.page_count)
+    content_savings = _content_savings(document, pages, compression_level, sizes)
+    seen = set()
+    for xref in sorted(objects):
+        estimate.sampled_bytes += sizes[xref][0]
+        # Cleaning already merges the content streams of a page, duplicates included
+        if xref in content_savings:
+            estimate.saved_bytes += content_savings[xref]
+            continue
+        content = document.xref_object(xref, compressed=True).encode()
+        if document.xref_is_stream(xref):
+            content += document.xref_stream_raw(xref) or b""
+        digest = hashlib.sha256(content).digest()
+        if digest in seen:
+            estimate.saved_bytes += sizes[xref][0]
+            continue
+        seen.add(digest)
+        estimate.saved_bytes += _object_savings(document, xref, img_quality if xref in images else None,
+                                                compression_level, cache, scan_aware, encoded_keys)
+    return estimate
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+# ==============================================================================
+#   Author: João Manoel Feck
+#   Email: joaomfeck@gmail.com
+#   GitHub: https://github.com/jmfeck
+# ==============================================================================
+
+import os
+import sys
+import time
+import errno
+import struct
+import select
+import logging
+import ctypes
+import ctypes.util
+
+# inotify event masks (see inotify(7)): a file closed after writing, or renamed into the folder;
+# IN_CREATE/IN_ISDIR only matter for new subfolders in recursive mode
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+# struct inotify_event header: wd, mask, cookie, len (followed by the NUL-padded name)
+_EVENT_HEADER = struct.Struct("iIII")
+_READ_SIZE = 64 * 1024
+
+
+# Signature used to tell whether a file changed since it was last queued
+def file_signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+# Files of a folder, as paths relative to it when subfolders are included
+def list_folder(path, recursive=False):
+    if not recursive:
+        return [entry.name for entry in os.scandir(path) if entry.is_file()]
+    return [os.path.relpath(os.path.join(root, filename), path)
+            for root, _, filenames in os.walk(path) for filename in filenames]
+
+
+# Linux inotify through ctypes, so no third-party package is needed.
+# inotify watches are not recursive, so with recursive=True every subfolder gets its own watch.
+class InotifyWatcher:
+
+    def __init__(self, path, recursive=False):
+        self.path = path
+        self.recursive = recursive
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, f"inotify_init1 failed: {os.strerror(error)}")
+        # Watch descriptor -> folder relative to path ("" is the watched folder itself)
+        self._folders = {}
+        try:
+            self._add_watch("")
+            if recursive:
+                for root, folders, _ in os.walk(path):
+                    for folder in folders:
+                        self._add_watch(os.path.relpath(os.path.join(root, folder), path))
+        except OSError:
+            os.close(self.fd)
+            raise
+
+    def _add_watch(self, relative_folder):
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | (IN_CREATE if self.recursive else 0)
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(os.path.join(self.path, relative_folder)), mask)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, f"inotify_add_watch failed: {os.strerror(error)}")
+        self._folders[wd] = relative_folder
+
+    # Wait up to timeout seconds and return the names of files that finished writing.
+    # None means the kernel queue overflowed and the caller has to rescan the folder.
+    def poll(self, timeout):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, _READ_SIZE)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return []
+            raise
+
+        names = []
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + _EVENT_HEADER.size:offset + _EVENT_HEADER.size + length].rstrip(b"\0")
+            offset += _EVENT_HEADER.size + length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if mask & IN_IGNORED:
+                if self._folders.pop(wd, None) == "":
+                    raise OSError(errno.ENOENT, "The watched folder was removed")
+                continue
+            if not name or wd not in self._folders:
+                continue
+            relative_name = os.path.join(self._folders[wd], os.fsdecode(name))
+            if mask & IN_ISDIR:
+                # A new subfolder: watch it, and report the files written before the watch existed
+                try:
+                    self._add_watch(relative_name)
+                    names.extend(os.path.join(relative_name, filename)
+                                  for filename in list_folder(os.path.join(self.path, relative_name), True))
+                except OSError as e:
+                    logging.warning(f"Cannot watch folder {relative_name} - {e}")
+            elif not mask & IN_CREATE:
+                names.append(relative_name)
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+# Portable fallback: rescan the folder and report files whose size and modification time
+# did not change between two scans, i.e. files that are no longer being written
+class PollingWatcher:
+
+    def __init__(self, path, interval, recursive=False):
+        self.path = path
+        self.interval = interval
+        self.recursive = recursive
+        self._previous = {}
+
+    def poll(self, timeout):
+        time.sleep(max(timeout, self.interval))
+        current = {name: file_signature(os.path.join(self.path, name))
+                   for name in list_folder(self.path, self.recursive)}
+        stable = [name for name, signature in current.items()
+                  if signature is not None and self._previous.get(name) == signature]
+        self._previous = current
+        return stable
+
+    def close(self):
+        pass
+
+
+# Use inotify where available (Linux) and fall back to polling elsewhere
+def create_watcher(path, interval, recursive=False):
+    if sys.platform.startswith("linux"):
+        try:
+            watcher = InotifyWatcher(path, recursive)
+            logging.info(f"Watching {path} with inotify")
+            return watcher
+        except (OSError, AttributeError) as e:
+            logging.warning(f"inotify is not available ({e}), falling back to polling")
+    logging.info(f"Watching {path} by polling every {interval}s")
+    return PollingWatcher(path, interval, recursive)
@@ -9,9 +9,12 @@
 import os
 import sys
 import logging
+import shutil
 import argparse
+import pymupdf
 import lazypdf as lz
 from datetime import datetime
+from functools import partial
 
 # Timestamp for file and log naming
 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -21,6 +24,7 @@ input_foldername = 'input'
 output_foldername = 'output'
 log_foldername = 'logs'
 log_filename = f"{timestamp}_log.log"
+metrics_filename = f"{timestamp}_metrics.jsonl"
 
 # Define paths
 path_script = os.path.realpath(__file__)
@@ -29,47 +33,258 @@ path_input = os.path.join(path_project, input_foldername)
 path_output = os.path.join(path_project, output_foldername)
 path_log_folder = os.path.join(path_project, log_foldername)
 path_log = os.path.join(path_log_folder, log_filename)
+path_metrics = os.path.join(path_log_folder, metrics_filename)
 
-# Set up logging with both file and console output
-os.makedirs(path_log_folder, exist_ok=True)
-logging.basicConfig(level=logging.DEBUG, format='%(message)s')
-file_handler = logging.FileHandler(path_log)
-logging.getLogger().addHandler(file_handler)
-
-# Argument parser setup
-parser = argparse.ArgumentParser(description="Compress PDF files.")
-parser.add_argument("--img-quality", type=int, default=None,
-                    help="Quality level for image recompression (1-100). Omit to skip image compression.")
-parser.add_argument("--compression-level", type=int, default=5, choices=range(1, 10),
-                    help="Deflate compression level for content streams (1-9). Default: 5.")
-args = parser.parse_args()
-
-logging.info("PDF Compressor: Starting")
-logging.info("PDF Compressor: Searching for PDF files to compress in the input folder...")
-
-# List PDF files in the input folder
-input_pdf_files = [f for f in os.listdir(path_input) if f.endswith(".pdf")]
-input_num_pdfs = len(input_pdf_files)
-logging.info(f"PDF Compressor: {input_num_pdfs} PDF(s) found")
-
-# Check if there are any PDF files to process
-if not input_pdf_files:
-    logging.info("PDF Compressor: No PDF files found. Exiting the program.")
-    sys.exit()
-
-# Compress each PDF file
-for pdf_file in input_pdf_files:
+# Make the shared modules in the repository root importable
+sys.path.insert(0, os.path.dirname(path_project))
+from common import metrics
+from common.batch_runner import add_batch_arguments, run_batch
+from common.discovery import add_discovery_arguments, discover_files, input_filter_from_args, output_folder_for
+from common.image_cache import IMAGE_CACHE_MB, ImageCache
+from common.image_recompress import plan_quality, recompress_images
+from common.logging_setup import setup_logging
+from common.metrics import parse_byte_size
+from common.pdf_output import qpdf_path, save_compressed
+from common.savings_estimate import estimate_savings
+
+
+# Recompressed image cache of this process, shared by every file it compresses
+_image_cache = None
+
+
+def image_cache(cache_mb, cache_dir):
+    global _image_cache
+    if _image_cache is None and (cache_mb > 0 or cache_dir):
+        _image_cache = ImageCache(cache_mb, cache_dir)
+    return _image_cache
+
+
+def _mb(size):
+    return f"{size / (1024 * 1024):.1f} MB"
+
+
+# Recompress the images of a PDF as JPEG and write it with the same save options as lazypdf's
+# compress(). Images are decoded and encoded by `threads` threads (see recompress_images()).
+# With target_size (bytes), the quality is chosen by plan_quality() from a sample of the images,
+# within the min_quality and min_ssim floors, and the document is then compressed once.
+# object_streams and linearized select the output layout (see save_compressed()). scan_aware
+# stores bilevel images as 1-bit and grayscale ones as gray JPEG (see recompress_images()).
+# estimated_keys are the cache keys of the images encoded by the savings estimate of this file.
+def recompress_pdf_file(pdf_path, output_path, img_quality, threads, target_size=None, min_quality=None,
+                        min_ssim=None, cache=None, object_streams=False, linearized=False, scan_aware=False,
+                        estimated_keys=None):
+    with metrics.stage("read"):
+        document = pymupdf.open(pdf_path)
+    try:
+        metrics.record(pages=document.page_count)
+        if target_size is not None:
+            with metrics.stage("plan"):
+                plan = plan_quality(document, os.path.getsize(pdf_path), target_size, min_quality, min_ssim, threads)
+            img_quality = plan.quality
+            metrics.record(target_quality=plan.quality, predicted_bytes=plan.predicted_bytes, sample_ssim=plan.ssim)
+            if plan.quality is None:
+                logging.info(f"PDF Compressor: Images kept as they are, predicted size {_mb(plan.predicted_bytes)}")
+            else:
+                ssim_text = f", lowest sample SSIM {plan.ssim:.3f}" if plan.ssim is not None else ""
+                logging.info(f"PDF Compressor: Image quality {plan.quality} chosen from {plan.sampled} sampled "
+                             f"image(s), predicted size {_mb(plan.predicted_bytes)}{ssim_text}")
+            if not plan.reachable:
+                logging.warning(f"PDF Compressor: {os.path.basename(pdf_path)} is not expected to fit in "
+                                f"{_mb(target_size)} within the quality floor")
+        if img_quality is not None:
+            with metrics.stage("operation"):
+                stats = recompress_images(document, img_quality, threads, cache, scan_aware, estimated_keys)
+            metrics.count(images=stats.images, images_recompressed=stats.recompressed,
+                          image_input_bytes=stats.input_bytes, image_output_bytes=stats.output_bytes)
+            cache_text = ""
+            if cache is not None:
+                metrics.count(image_cache_hits=stats.cache_hits, image_cache_misses=stats.cache_misses)
+                cache_text = f", {stats.cache_hits} from the cache"
+            logging.info(f"PDF Compressor: Recompressed {stats.recompressed} of {stats.images} image(s), "
+                         f"{_mb(stats.input_bytes)} -> {_mb(stats.output_bytes)}{cache_text}")
+            if scan_aware:
+                metrics.count(images_bilevel=stats.bilevel, images_grayscale=stats.grayscale, images_color=stats.color)
+                logging.info(f"PDF Compressor: Image classes: {stats.bilevel} bilevel, {stats.grayscale} grayscale, "
+                             f"{stats.color} color")
+        with metrics.stage("write"):
+            save_compressed(document, output_path, object_streams, linearized)
+    finally:
+        document.close()
+    if target_size is not None:
+        output_bytes = os.path.getsize(output_path)
+        logging.info(f"PDF Compressor: Output is {_mb(output_bytes)} (predicted {_mb(plan.predicted_bytes)}, "
+                     f"target {_mb(target_size)})")
+        if output_bytes > target_size:
+            logging.warning(f"PDF Compressor: {os.path.basename(output_path)} is over the target size")
+
+
+# Share of a PDF that compressing it is expected to save, estimated from a sample of its pages.
+# The cache keys of the images encoded for the estimate are added to encoded_keys.
+def predicted_savings(pdf_path, img_quality, compression_level, cache, scan_aware=False, encoded_keys=None):
+    document = pymupdf.open(pdf_path)
+    try:
+        return estimate_savings(document, os.path.getsize(pdf_path), img_quality, compression_level, cache,
+                                scan_aware, encoded_keys).ratio
+    finally:
+        document.close()
+
+
+# Copy the input unchanged to the output path ("copy") or write nothing for it ("skip")
+def keep_input(pdf_path, output_path, below_min_savings):
+    if below_min_savings == "skip":
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        return None
+    shutil.copyfile(pdf_path, output_path)
+    return output_path
+
+
+# Compress a single PDF file (runs inside a worker process when --workers > 1).
+# With min_savings (percent), files expected to shrink less are copied through or skipped
+# (below_min_savings) without being compressed, and so are files that compression made larger.
+def compress_pdf_file(pdf_file, timestamp, img_quality, compression_level, threads=1, target_size=None,
+                      min_quality=None, min_ssim=None, image_cache_mb=IMAGE_CACHE_MB, image_cache_dir=None,
+                      min_savings=None, below_min_savings="copy", object_streams=False, linearized=False,
+                      scan_aware=False):
     pdf_path = os.path.join(path_input, pdf_file)
-    compressed_output_filename = f"{timestamp}_compressed_{pdf_file}"
-    compressed_output_path = os.path.join(path_output, compressed_output_filename)
+    output_folder = output_folder_for(path_output, pdf_file)
+    compressed_output_filename = f"{timestamp}_compressed_{os.path.basename(pdf_file)}"
+    compressed_output_path = os.path.join(output_folder, compressed_output_filename)
+    cache = image_cache(image_cache_mb, image_cache_dir)
+    kept = "copied unchanged" if below_min_savings == "copy" else "skipped"
+    estimated_keys = set()
+
+    if min_savings is not None:
+        with metrics.stage("estimate"):
+            predicted = predicted_savings(pdf_path, img_quality, compression_level, cache, scan_aware,
+                                          estimated_keys)
+        metrics.record(predicted_savings=round(100 * predicted, 1))
+        # The images the estimate encoded are cache misses, whether or not the file is then compressed
+        if estimated_keys:
+            metrics.count(image_cache_misses=len(estimated_keys))
+        if 100 * predicted < min_savings:
+            metrics.count(files_below_min_savings=1)
+            logging.info(f"PDF Compressor: {pdf_file} is expected to shrink by {100 * predicted:.1f}%, "
+                         f"below --min-savings {min_savings:g}%, {kept}")
+            return keep_input(pdf_path, compressed_output_path, below_min_savings)
 
     logging.info(f"PDF Compressor: Compressing {pdf_file}")
 
-    try:
-        os.makedirs(path_output, exist_ok=True)
-        lz.read(pdf_path).compress(img_quality=args.img_quality, compression_level=args.compression_level).to_pdf(compressed_output_path)
-        logging.info(f"PDF Compressor: Compressed PDF saved to {compressed_output_path}")
-    except Exception as e:
-        logging.error(f"PDF Compressor: Failed to compress {pdf_file} - {e}")
+    # lazypdf's compress() writes xref tables only, the other layouts are saved through PyMuPDF
+    if img_quality is not None or target_size is not None or object_streams or linearized:
+        recompress_pdf_file(pdf_path, compressed_output_path, img_quality, threads, target_size, min_quality,
+                            min_ssim, cache, object_streams, linearized, scan_aware, estimated_keys)
+    else:
+        with metrics.stage("read"):
+            pdf = lz.read(pdf_path)
+        metrics.record(pages=pdf.page_count)
+        with metrics.stage("operation"):
+            pdf = pdf.compress(compression_level=compression_level)
+        with metrics.stage("write"):
+            pdf.to_pdf(compressed_output_path)
+
+    if min_savings is not None:
+        input_bytes, output_bytes = os.path.getsize(pdf_path), os.path.getsize(compressed_output_path)
+        actual = 1 - output_bytes / input_bytes if input_bytes else 0.0
+        metrics.record(actual_savings=round(100 * actual, 1))
+        metrics.count(predicted_saved_bytes=int(predicted * input_bytes), saved_bytes=input_bytes - output_bytes)
+        logging.info(f"PDF Compressor: {pdf_file} shrank by {100 * actual:.1f}% (predicted {100 * predicted:.1f}%)")
+        if output_bytes > input_bytes:
+            metrics.count(files_below_min_savings=1)
+            logging.info(f"PDF Compressor: Compressing made {pdf_file} larger, {kept}")
+            return keep_input(pdf_path, compressed_output_path, below_min_savings)
+    logging.info(f"PDF Compressor: Compressed PDF saved to {compressed_output_path}")
+    return compressed_output_path
+
+
+if __name__ == "__main__":
+    # Argument parser setup
+    parser = argparse.ArgumentParser(description="Compress PDF files.")
+    quality_modes = parser.add_mutually_exclusive_group()
+    quality_modes.add_argument("--img-quality", type=int, default=None,
+                               help="Quality level for image recompression (1-100). Omit to skip image compression.")
+    quality_modes.add_argument("--target-size", type=parse_byte_size, metavar="SIZE",
+                               help="Recompress images at the highest quality expected to keep each file under SIZE "
+                                    "bytes (K, M and G suffixes allowed, e.g. 10M). The quality is estimated from a "
+                                    "sample of the images, then each file is compressed once.")
+    parser.add_argument("--min-quality", type=int, default=None,
+                        help="With --target-size, never recompress images below this quality (1-100), "
+                             "even if the file then stays over the target.")
+    parser.add_argument("--min-ssim", type=float, default=None,
+                        help="With --target-size, lowest SSIM (0-1) accepted for the sampled images, "
+                             "e.g. 0.9. Takes precedence over the target size.")
+    parser.add_argument("--scan-aware", action="store_true",
+                        help="With --img-quality, classify each image by its histogram first: black and white "
+                             "images (scanned text) are stored as 1-bit CCITT G4 or deflated pixels, grayscale "
+                             "ones as gray JPEG, and only color images as color JPEG.")
+    parser.add_argument("--compression-level", type=int, default=5, choices=range(1, 10),
+                        help="Deflate compression level for content streams (1-9). Default: 5.")
+    parser.add_argument("--threads", type=int, default=1,
+                        help="Number of threads that decode and re-encode the images of each file with "
+                             "--img-quality or --target-size. The output does not depend on it. Default: 1.")
+    parser.add_argument("--image-cache-mb", type=float, default=IMAGE_CACHE_MB,
+                        help="Memory (per worker process) used to cache recompressed images by content, so an "
+                             "image repeated across files, such as a letterhead or a signature, is recompressed "
+                             f"once. 0 disables the in-memory cache. Default: {IMAGE_CACHE_MB}.")
+    parser.add_argument("--image-cache-dir", metavar="FOLDER",
+                        help="Also store recompressed images in this folder, shared by the worker processes "
+                             "and reused by later runs.")
+    parser.add_argument("--min-savings", type=float, metavar="PERCENT",
+                        help="Estimate the savings of each file from a sample of its pages first, and leave files "
+                             "expected to shrink less than PERCENT (or that come out larger) as they are.")
+    parser.add_argument("--below-min-savings", choices=["copy", "skip"], default="copy",
+                        help="What --min-savings does with those files: 'copy' them unchanged to the output "
+                             "folder (default) or 'skip' them.")
+    parser.add_argument("--object-streams", action="store_true",
+                        help="Pack the objects into compressed object streams, indexed by a cross-reference stream.")
+    parser.add_argument("--linearize", action="store_true",
+                        help="Write linearized (fast web view) files, whose first page a browser shows before the "
+                             "rest is downloaded. Requires qpdf on the PATH.")
+    add_discovery_arguments(parser, ["*.pdf"])
+    add_batch_arguments(parser)
+    args = parser.parse_args()
+    if (args.min_quality is not None or args.min_ssim is not None) and args.target_size is None:
+        parser.error("--min-quality and --min-ssim require --target-size")
+    if args.min_quality is not None and not 1 <= args.min_quality <= 100:
+        parser.error("--min-quality must be between 1 and 100")
+    if args.min_ssim is not None and not 0 <= args.min_ssim <= 1:
+        parser.error("--min-ssim must be between 0 and 1")
+    if args.target_size is not None and args.target_size < 1:
+        parser.error("--target-size must be positive")
+    if args.min_savings is not None and args.target_size is not None:
+        parser.error("--min-savings cannot be used with --target-size, which sizes each file itself")
+    if args.scan_aware and args.img_quality is None:
+        parser.error("--scan-aware requires --img-quality")
+    if args.linearize:
+        try:
+            qpdf_path()
+        except RuntimeError as error:
+            parser.error(str(error))
+
+    # Set up queued console and rotating file logging
+    setup_logging('%(message)s', path_log, args)
+
+    logging.info("PDF Compressor: Starting")
+    logging.info("PDF Compressor: Searching for PDF files to compress in the input folder...")
+
+    # Stream the matching files, processing starts while the input folder is still being scanned
+    input_filter = input_filter_from_args(args)
+    input_pdf_files = discover_files(path_input, input_filter, recursive=args.recursive)
+
+    # Compress each PDF file
+    summary = run_batch(partial(compress_pdf_file, timestamp=timestamp, img_quality=args.img_quality,
+                                compression_level=args.compression_level, threads=args.threads,
+                                target_size=args.target_size, min_quality=args.min_quality, min_ssim=args.min_ssim,
+                                image_cache_mb=args.image_cache_mb, image_cache_dir=args.image_cache_dir,
+                                min_savings=args.min_savings, below_min_savings=args.below_min_savings,
+                                object_streams=args.object_streams, linearized=args.linearize,
+                                scan_aware=args.scan_aware),
+                        input_pdf_files, args, path_input, path_output,
+                        path_metrics=path_metrics, file_filter=input_filter)
+
+    # Check if there were any PDF files to process
+    if not summary.results and not args.watch:
+        logging.warning("PDF Compressor: No PDF files found in the input folder. Exiting.")
+        sys.exit()
 
-logging.info("PDF Compressor: Process completed successfully.")
+    logging.info("PDF Compressor: Process completed successfully.")
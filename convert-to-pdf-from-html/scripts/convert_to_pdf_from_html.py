@@ -12,6 +12,7 @@ import logging
 import argparse
 import lazypdf as lz
 from datetime import datetime
+from functools import partial
 
 # Program name for log prefix
 PROGRAM_NAME = "HTML to PDF Converter"
@@ -24,6 +25,7 @@ input_foldername = 'input'
 output_foldername = 'output'
 log_foldername = 'logs'
 log_filename = f"{timestamp}_log.log"
+metrics_filename = f"{timestamp}_metrics.jsonl"
 
 # Define paths
 path_script = os.path.realpath(__file__)
@@ -32,54 +34,65 @@ path_input = os.path.join(path_project, input_foldername)
 path_output = os.path.join(path_project, output_foldername)
 path_log_folder = os.path.join(path_project, log_foldername)
 path_log = os.path.join(path_log_folder, log_filename)
+path_metrics = os.path.join(path_log_folder, metrics_filename)
 
-# Set up logging with program name as prefix in each log entry
-os.makedirs(path_log_folder, exist_ok=True)
-log_format = f"{PROGRAM_NAME}: %(message)s"
-logging.basicConfig(level=logging.DEBUG, format=log_format)
-
-# Configure file handler with the same format
-file_handler = logging.FileHandler(path_log)
-file_handler.setFormatter(logging.Formatter(log_format))
-logging.getLogger().addHandler(file_handler)
-
-# Argument parser setup
-parser = argparse.ArgumentParser(description="Convert HTML files to PDF.")
-parser.add_argument("--engine", type=str, choices=["pymupdf", "weasyprint", "playwright"], default="pymupdf",
-                    help="Rendering engine: 'pymupdf' (default, no external deps), 'weasyprint' (needs GTK), 'playwright' (headless Chromium)")
-args = parser.parse_args()
-
-logging.info("Starting HTML to PDF Conversion Process")
-logging.info(f"Timestamp: {timestamp}")
-logging.info(f"Input folder: {path_input}")
-logging.info(f"Output folder: {path_output}")
-logging.info("Searching for HTML files in the input folder...")
-
-# List and count HTML files
-input_html_files = [f for f in os.listdir(path_input) if f.endswith(".html")]
-input_num_htmls = len(input_html_files)
-logging.info(f"Found {input_num_htmls} HTML file(s) to process.")
-
-# Check if there are any HTML files to process
-if not input_html_files:
-    logging.warning("No HTML files found in the input folder. Exiting the program.")
-    sys.exit()
-
-# Process each HTML file
-for html_file in input_html_files:
-    html_path = os.path.join(path_input, html_file)
-    logging.info(f"Processing file: {html_file}")
-
-    try:
-        os.makedirs(path_output, exist_ok=True)
-        output_filename = f"{timestamp}_{html_file.split('.')[0]}.pdf"
-        output_path = os.path.join(path_output, output_filename)
+# Make the shared modules in the repository root importable
+sys.path.insert(0, os.path.dirname(path_project))
+from common import metrics
+from common.batch_runner import add_batch_arguments, run_batch
+from common.discovery import add_discovery_arguments, discover_files, input_filter_from_args, output_folder_for
+from common.logging_setup import setup_logging
 
-        lz.read_html(html_path, engine=args.engine).to_pdf(output_path)
-        logging.info(f"Converted {html_file} to PDF at {output_path}")
 
-    except Exception as e:
-        logging.error(f"Failed to process {html_file} - {e}")
+# Convert a single HTML file (runs inside a worker process when --workers > 1)
+def convert_html_file(html_file, timestamp, engine):
+    html_path = os.path.join(path_input, html_file)
+    logging.info(f"Processing file: {html_file}")
 
-logging.info("HTML to PDF Conversion Process Completed Successfully")
-logging.info(f"Total HTML files processed: {input_num_htmls}")
+    output_folder = output_folder_for(path_output, html_file)
+    output_filename = f"{timestamp}_{os.path.basename(html_file).split('.')[0]}.pdf"
+    output_path = os.path.join(output_folder, output_filename)
+
+    with metrics.stage("read"):
+        pdf = lz.read_html(html_path, engine=engine)
+    metrics.record(pages=pdf.page_count)
+    with metrics.stage("write"):
+        pdf.to_pdf(output_path)
+    logging.info(f"Converted {html_file} to PDF at {output_path}")
+    return output_path
+
+
+if __name__ == "__main__":
+    # Argument parser setup
+    parser = argparse.ArgumentParser(description="Convert HTML files to PDF.")
+    parser.add_argument("--engine", type=str, choices=["pymupdf", "weasyprint", "playwright"], default="pymupdf",
+                        help="Rendering engine: 'pymupdf' (default, no external deps), 'weasyprint' (needs GTK), 'playwright' (headless Chromium)")
+    add_discovery_arguments(parser, ["*.html"])
+    add_batch_arguments(parser)
+    args = parser.parse_args()
+
+    # Set up queued console and rotating file logging with program name as prefix in each log entry
+    setup_logging(f"{PROGRAM_NAME}: %(message)s", path_log, args)
+
+    logging.info("Starting HTML to PDF Conversion Process")
+    logging.info(f"Timestamp: {timestamp}")
+    logging.info(f"Input folder: {path_input}")
+    logging.info(f"Output folder: {path_output}")
+    logging.info("Searching for HTML files in the input folder...")
+
+    # Stream the matching files, processing starts while the input folder is still being scanned
+    input_filter = input_filter_from_args(args)
+    input_html_files = discover_files(path_input, input_filter, recursive=args.recursive)
+
+    # Process each HTML file
+    summary = run_batch(partial(convert_html_file, timestamp=timestamp, engine=args.engine),
+                        input_html_files, args, path_input, path_output,
+                        path_metrics=path_metrics, file_filter=input_filter)
+
+    # Check if there were any HTML files to process
+    if not summary.results and not args.watch:
+        logging.warning("No HTML files found in the input folder. Exiting.")
+        sys.exit()
+
+    logging.info("HTML to PDF Conversion Process Completed Successfully")
+    logging.info(f"Total HTML files processed: {len(summary.results)}")
@@ -9,8 +9,10 @@
 import os
 import sys
 import logging
+import argparse
 import lazypdf as lz
 from datetime import datetime
+from functools import partial
 
 # Program name for log prefix
 PROGRAM_NAME = "Image to PDF Converter"
@@ -23,6 +25,7 @@ input_foldername = 'input'
 output_foldername = 'output'
 log_foldername = 'logs'
 log_filename = f"{timestamp}_log.log"
+metrics_filename = f"{timestamp}_metrics.jsonl"
 
 # Define paths
 path_script = os.path.realpath(__file__)
@@ -31,49 +34,63 @@ path_input = os.path.join(path_project, input_foldername)
 path_output = os.path.join(path_project, output_foldername)
 path_log_folder = os.path.join(path_project, log_foldername)
 path_log = os.path.join(path_log_folder, log_filename)
+path_metrics = os.path.join(path_log_folder, metrics_filename)
 
-# Set up logging with program name as prefix in each log entry
-os.makedirs(path_log_folder, exist_ok=True)
-log_format = f"{PROGRAM_NAME}: %(message)s"
-logging.basicConfig(level=logging.DEBUG, format=log_format)
-
-# Configure file handler with the same format
-file_handler = logging.FileHandler(path_log)
-file_handler.setFormatter(logging.Formatter(log_format))
-logging.getLogger().addHandler(file_handler)
-
-logging.info("Starting Image to PDF Conversion Process")
-logging.info(f"Timestamp: {timestamp}")
-logging.info(f"Input folder: {path_input}")
-logging.info(f"Output folder: {path_output}")
-logging.info("Searching for image files in the input folder...")
-
-# List of accepted image formats
-accepted_formats = (".jpg", ".jpeg", ".png", ".tiff", ".bmp")
-input_image_files = [f for f in os.listdir(path_input) if f.lower().endswith(accepted_formats)]
-input_num_images = len(input_image_files)
-logging.info(f"Found {input_num_images} image file(s) to process.")
-
-# Check if there are any image files to process
-if not input_image_files:
-    logging.warning("No image files found in the input folder. Exiting the program.")
-    sys.exit()
-
-# Process each image file
-for image_file in input_image_files:
-    image_path = os.path.join(path_input, image_file)
-    logging.info(f"Processing file: {image_file}")
-
-    try:
-        os.makedirs(path_output, exist_ok=True)
-        output_filename = f"{timestamp}_{image_file.split('.')[0]}.pdf"
-        output_path = os.path.join(path_output, output_filename)
+# Make the shared modules in the repository root importable
+sys.path.insert(0, os.path.dirname(path_project))
+from common import metrics
+from common.batch_runner import add_batch_arguments, run_batch
+from common.discovery import add_discovery_arguments, discover_files, input_filter_from_args, output_folder_for
+from common.logging_setup import setup_logging
 
-        lz.read_images(image_path, page_size="fit").to_pdf(output_path)
-        logging.info(f"Converted {image_file} to PDF at {output_path}")
 
-    except Exception as e:
-        logging.error(f"Failed to process {image_file} - {e}")
+# Convert a single image file (runs inside a worker process when --workers > 1)
+def convert_image_file(image_file, timestamp):
+    image_path = os.path.join(path_input, image_file)
+    logging.info(f"Processing file: {image_file}")
 
-logging.info("Image to PDF Conversion Process Completed Successfully")
-logging.info(f"Total image files processed: {input_num_images}")
+    output_folder = output_folder_for(path_output, image_file)
+    output_filename = f"{timestamp}_{os.path.basename(image_file).split('.')[0]}.pdf"
+    output_path = os.path.join(output_folder, output_filename)
+
+    with metrics.stage("read"):
+        pdf = lz.read_images(image_path, page_size="fit")
+    metrics.record(pages=pdf.page_count)
+    with metrics.stage("write"):
+        pdf.to_pdf(output_path)
+    logging.info(f"Converted {image_file} to PDF at {output_path}")
+    return output_path
+
+
+if __name__ == "__main__":
+    # Argument parser setup
+    parser = argparse.ArgumentParser(description="Convert image files to PDF.")
+    add_discovery_arguments(parser, ["*.jpg", "*.jpeg", "*.png", "*.tiff", "*.bmp"])
+    add_batch_arguments(parser)
+    args = parser.parse_args()
+
+    # Set up queued console and rotating file logging with program name as prefix in each log entry
+    setup_logging(f"{PROGRAM_NAME}: %(message)s", path_log, args)
+
+    logging.info("Starting Image to PDF Conversion Process")
+    logging.info(f"Timestamp: {timestamp}")
+    logging.info(f"Input folder: {path_input}")
+    logging.info(f"Output folder: {path_output}")
+    logging.info("Searching for image files in the input folder...")
+
+    # Stream the matching files, processing starts while the input folder is still being scanned
+    input_filter = input_filter_from_args(args)
+    input_image_files = discover_files(path_input, input_filter, recursive=args.recursive)
+
+    # Process each image file
+    summary = run_batch(partial(convert_image_file, timestamp=timestamp),
+                        input_image_files, args, path_input, path_output,
+                        path_metrics=path_metrics, file_filter=input_filter)
+
+    # Check if there were any image files to process
+    if not summary.results and not args.watch:
+        logging.warning("No image files found in the input folder. Exiting.")
+        sys.exit()
+
+    logging.info("Image to PDF Conversion Process Completed Successfully")
+    logging.info(f"Total image files processed: {len(summary.results)}")
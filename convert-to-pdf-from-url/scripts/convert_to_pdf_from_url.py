@@ -12,6 +12,7 @@ import logging
 import argparse
 import lazypdf as lz
 from datetime import datetime
+from functools import partial
 
 # Program name for log prefix
 PROGRAM_NAME = "URL to PDF Converter"
@@ -25,6 +26,7 @@ output_foldername = 'output'
 log_foldername = 'logs'
 input_filename = 'urls.txt'  # File containing the list of URLs
 log_filename = f"{timestamp}_log.log"
+metrics_filename = f"{timestamp}_metrics.jsonl"
 
 # Define paths
 path_script = os.path.realpath(__file__)
@@ -34,56 +36,68 @@ path_input_file = os.path.join(path_input_folder, input_filename)
 path_output = os.path.join(path_project, output_foldername)
 path_log_folder = os.path.join(path_project, log_foldername)
 path_log = os.path.join(path_log_folder, log_filename)
-
-# Set up logging with program name as prefix in each log entry
-os.makedirs(path_log_folder, exist_ok=True)
-log_format = f"{PROGRAM_NAME}: %(message)s"
-logging.basicConfig(level=logging.DEBUG, format=log_format)
-
-# Configure file handler with the same format
-file_handler = logging.FileHandler(path_log)
-file_handler.setFormatter(logging.Formatter(log_format))
-logging.getLogger().addHandler(file_handler)
-
-# Argument parser setup
-parser = argparse.ArgumentParser(description="Convert URLs to PDF.")
-parser.add_argument("--engine", type=str, choices=["pymupdf", "weasyprint", "playwright"], default="pymupdf",
-                    help="Rendering engine: 'pymupdf' (default, no external deps), 'weasyprint' (needs GTK), 'playwright' (headless Chromium)")
-args = parser.parse_args()
-
-logging.info("Starting URL to PDF Conversion Process")
-logging.info(f"Timestamp: {timestamp}")
-logging.info(f"Input file: {path_input_file}")
-logging.info(f"Output folder: {path_output}")
-
-# Check if URLs file exists
-if not os.path.exists(path_input_file):
-    logging.error(f"URL file not found in the input folder: {path_input_file}. Exiting.")
-    sys.exit()
-
-# Read URLs from the text file
-try:
-    with open(path_input_file, "r") as file:
-        urls = [line.strip() for line in file if line.strip()]
-except Exception as e:
-    logging.error(f"Failed to read URL file - {e}")
-    sys.exit()
-
-logging.info(f"Found {len(urls)} URL(s) to process.")
-
-# Process each URL
-for index, url in enumerate(urls, start=1):
+path_metrics = os.path.join(path_log_folder, metrics_filename)
+
+# Make the shared modules in the repository root importable
+sys.path.insert(0, os.path.dirname(path_project))
+from common import metrics
+from common.batch_runner import add_batch_arguments, run_batch
+from common.logging_setup import setup_logging
+
+
+# Convert a single numbered URL (runs inside a worker process when --workers > 1)
+def convert_url(indexed_url, timestamp, engine):
+    index, url = indexed_url.split(" ", 1)
+    output_filename = f"{timestamp}_url_{index}.pdf"
+    output_path = os.path.join(path_output, output_filename)
+
+    os.makedirs(path_output, exist_ok=True)
+    logging.info(f"Converting URL to PDF: {url}")
+    with metrics.stage("read"):
+        pdf = lz.read_html(url, engine=engine)
+    metrics.record(pages=pdf.page_count)
+    with metrics.stage("write"):
+        pdf.to_pdf(output_path)
+    logging.info(f"PDF saved: {output_path}")
+    return output_path
+
+
+if __name__ == "__main__":
+    # Argument parser setup
+    parser = argparse.ArgumentParser(description="Convert URLs to PDF.")
+    parser.add_argument("--engine", type=str, choices=["pymupdf", "weasyprint", "playwright"], default="pymupdf",
+                        help="Rendering engine: 'pymupdf' (default, no external deps), 'weasyprint' (needs GTK), 'playwright' (headless Chromium)")
+    add_batch_arguments(parser)
+    args = parser.parse_args()
+
+    # Set up queued console and rotating file logging with program name as prefix in each log entry
+    setup_logging(f"{PROGRAM_NAME}: %(message)s", path_log, args)
+
+    logging.info("Starting URL to PDF Conversion Process")
+    logging.info(f"Timestamp: {timestamp}")
+    logging.info(f"Input file: {path_input_file}")
+    logging.info(f"Output folder: {path_output}")
+
+    # Check if URLs file exists
+    if not os.path.exists(path_input_file):
+        logging.error(f"URL file not found in the input folder: {path_input_file}. Exiting.")
+        sys.exit()
+
+    # Read URLs from the text file
     try:
-        os.makedirs(path_output, exist_ok=True)
-        output_filename = f"{timestamp}_url_{index}.pdf"
-        output_path = os.path.join(path_output, output_filename)
+        with open(path_input_file, "r") as file:
+            urls = [line.strip() for line in file if line.strip()]
+    except Exception as e:
+        logging.error(f"Failed to read URL file - {e}")
+        sys.exit()
 
-        logging.info(f"Converting URL to PDF: {url}")
-        lz.read_html(url, engine=args.engine).to_pdf(output_path)
-        logging.info(f"PDF saved: {output_path}")
+    logging.info(f"Found {len(urls)} URL(s) to process.")
 
-    except Exception as e:
-        logging.error(f"Failed to convert {url} - {e}")
+    # Process each URL, keeping its position in the list for the output name
+    indexed_urls = [f"{index} {url}" for index, url in enumerate(urls, start=1)]
+    run_batch(partial(convert_url, timestamp=timestamp, engine=args.engine),
+              indexed_urls, args,
+              path_metrics=path_metrics)
 
-logging.info("URL to PDF Conversion Process Completed Successfully")
-logging.info(f"Total URLs processed: {len(urls)}")
+    logging.info("URL to PDF Conversion Process Completed Successfully")
+    logging.info(f"Total URLs processed: {len(urls)}")
@@ -9,8 +9,10 @@
 import os
 import sys
 import logging
+import argparse
 import lazypdf as lz
 from datetime import datetime
+from functools import partial
 
 # Program name for log prefix
 PROGRAM_NAME = "PDF Image Extractor"
@@ -23,6 +25,7 @@ input_foldername = 'input'
 output_foldername = 'output'
 log_foldername = 'logs'
 log_filename = f"{timestamp}_log.log"
+metrics_filename = f"{timestamp}_metrics.jsonl"
 
 # Define paths
 path_script = os.path.realpath(__file__)
@@ -31,50 +34,62 @@ path_input = os.path.join(path_project, input_foldername)
 path_output = os.path.join(path_project, output_foldername)
 path_log_folder = os.path.join(path_project, log_foldername)
 path_log = os.path.join(path_log_folder, log_filename)
+path_metrics = os.path.join(path_log_folder, metrics_filename)
 
-# Set up logging with program name as prefix in each log entry
-os.makedirs(path_log_folder, exist_ok=True)
-log_format = f"{PROGRAM_NAME}: %(message)s"
+# Make the shared modules in the repository root importable
+sys.path.insert(0, os.path.dirname(path_project))
+from common import metrics
+from common.batch_runner import add_batch_arguments, run_batch
+from common.discovery import add_discovery_arguments, discover_files, input_filter_from_args, output_folder_for
+from common.logging_setup import setup_logging
 
-# Configure root logger for console output
-logging.basicConfig(level=logging.DEBUG, format=log_format)
 
-# Configure file handler with the same format
-file_handler = logging.FileHandler(path_log)
-file_handler.setFormatter(logging.Formatter(log_format))
-logging.getLogger().addHandler(file_handler)
-
-logging.info("Starting Process")
-logging.info(f"Timestamp: {timestamp}")
-logging.info(f"Input folder: {path_input}")
-logging.info(f"Output folder: {path_output}")
-logging.info("Searching for PDF files in the input folder...")
-
-# List and count PDF files
-input_pdf_files = [f for f in os.listdir(path_input) if f.endswith(".pdf")]
-input_num_pdfs = len(input_pdf_files)
-logging.info(f"Found {input_num_pdfs} PDF file(s) to process.")
-
-# Check if there are any PDF files to process
-if not input_pdf_files:
-    logging.warning("No PDF files found in the input folder. Exiting the program.")
-    sys.exit()
-
-# Process each PDF file
-for pdf_file in input_pdf_files:
+# Extract the images of a single PDF file (runs inside a worker process when --workers > 1)
+def extract_images_from_file(pdf_file, timestamp):
     pdf_path = os.path.join(path_input, pdf_file)
     logging.info(f"Processing file: {pdf_file}")
 
-    try:
-        os.makedirs(path_output, exist_ok=True)
-        output_subdir = os.path.join(path_output, f"{timestamp}_{pdf_file.split('.')[0]}")
-        os.makedirs(output_subdir, exist_ok=True)
-
-        extracted_files = lz.read(pdf_path).extract_images(output_subdir)
-        logging.info(f"Extracted {len(extracted_files)} image(s) from {pdf_file}")
-
-    except Exception as e:
-        logging.error(f"Failed to process {pdf_file} - {e}")
-
-logging.info("PDF Image Extraction Process Completed Successfully")
-logging.info(f"Total PDF files processed: {input_num_pdfs}")
+    output_folder = output_folder_for(path_output, pdf_file)
+    output_subdir = os.path.join(output_folder, f"{timestamp}_{os.path.basename(pdf_file).split('.')[0]}")
+    os.makedirs(output_subdir, exist_ok=True)
+
+    with metrics.stage("read"):
+        pdf = lz.read(pdf_path)
+    metrics.record(pages=pdf.page_count)
+    with metrics.stage("write"):
+        extracted_files = pdf.extract_images(output_subdir)
+    logging.info(f"Extracted {len(extracted_files)} image(s) from {pdf_file}")
+    return extracted_files
+
+
+if __name__ == "__main__":
+    # Argument parser setup
+    parser = argparse.ArgumentParser(description="Extract embedded images from PDF files.")
+    add_discovery_arguments(parser, ["*.pdf"])
+    add_batch_arguments(parser)
+    args = parser.parse_args()
+
+    # Set up queued console and rotating file logging with program name as prefix in each log entry
+    setup_logging(f"{PROGRAM_NAME}: %(message)s", path_log, args)
+
+    logging.info("Starting Process")
+    logging.info(f"Timestamp: {timestamp}")
+    logging.info(f"Input folder: {path_input}")
+    logging.info(f"Output folder: {path_output}")
+    logging.info("Searching for PDF files in the input folder...")
+
+    # Stream the matching files, processing starts while the input folder is still being scanned
+    input_filter = input_filter_from_args(args)
+    input_pdf_files = discover_files(path_input, input_filter, recursive=args.recursive)
+
+    # Process each PDF file
+    summary = run_batch(partial(extract_images_from_file, timestamp=timestamp), input_pdf_files, args, path_input, path_output,
+                        path_metrics=path_metrics, file_filter=input_filter)
+
+    # Check if there were any PDF files to process
+    if not summary.results and not args.watch:
+        logging.warning("No PDF files found in the input folder. Exiting.")
+        sys.exit()
+
+    logging.info("PDF Image Extraction Process Completed Successfully")
+    logging.info(f"Total PDF files processed: {len(summary.results)}")
@@ -13,6 +13,7 @@ import argparse
 import lazypdf as lz
 import pandas as pd
 from datetime import datetime
+from functools import partial
 
 # Program name for log prefix
 PROGRAM_NAME = "PDF Table Extractor"
@@ -25,6 +26,7 @@ input_foldername = 'input'
 output_foldername = 'output'
 log_foldername = 'logs'
 log_filename = f"{timestamp}_log.log"
+metrics_filename = f"{timestamp}_metrics.jsonl"
 
 # Define paths
 path_script = os.path.realpath(__file__)
@@ -33,72 +35,88 @@ path_input = os.path.join(path_project, input_foldername)
 path_output = os.path.join(path_project, output_foldername)
 path_log_folder = os.path.join(path_project, log_foldername)
 path_log = os.path.join(path_log_folder, log_filename)
+path_metrics = os.path.join(path_log_folder, metrics_filename)
 
-# Set up logging with program name as prefix in each log entry
-os.makedirs(path_log_folder, exist_ok=True)
-log_format = f"{PROGRAM_NAME}: %(message)s"
-logging.basicConfig(level=logging.INFO, format=log_format)
-
-# Configure file handler with the same format
-file_handler = logging.FileHandler(path_log)
-file_handler.setFormatter(logging.Formatter(log_format))
-logging.getLogger().addHandler(file_handler)
-
-# Argument parser setup
-parser = argparse.ArgumentParser(description="Extract tables from PDF files and save in CSV or Excel format.")
-parser.add_argument("--export-format", type=str, choices=["csv", "excel"], default="csv",
-                    help="Output format for the extracted tables: 'csv' or 'excel' (default: csv)")
-parser.add_argument("--flavor", type=str, choices=["stream", "lattice"], default="lattice",
-                    help="Table detection strategy: 'lattice' (tables with borders) or 'stream' (borderless). Default: lattice.")
-args = parser.parse_args()
-
-logging.info("Starting PDF Table Extraction Process")
-logging.info(f"Timestamp: {timestamp}")
-logging.info(f"Input folder: {path_input}")
-logging.info(f"Output folder: {path_output}")
-logging.info(f"Output format: {args.export_format}")
-logging.info("Searching for PDF files in the input folder...")
-
-# List and count PDF files
-input_pdf_files = [f for f in os.listdir(path_input) if f.endswith(".pdf")]
-input_num_pdfs = len(input_pdf_files)
-logging.info(f"Found {input_num_pdfs} PDF file(s) to process.")
-
-# Check if there are any PDF files to process
-if not input_pdf_files:
-    logging.warning("No PDF files found in the input folder. Exiting the program.")
-    sys.exit()
-
-# Process each PDF file
-for pdf_file in input_pdf_files:
+# Make the shared modules in the repository root importable
+sys.path.insert(0, os.path.dirname(path_project))
+from common import metrics
+from common.batch_runner import add_batch_arguments, run_batch
+from common.discovery import add_discovery_arguments, discover_files, input_filter_from_args, output_folder_for
+from common.logging_setup import setup_logging
+
+
+# Extract the tables of a single PDF file (runs inside a worker process when --workers > 1)
+def extract_tables_from_file(pdf_file, timestamp, export_format, flavor):
     pdf_path = os.path.join(path_input, pdf_file)
     logging.info(f"Processing file: {pdf_file}")
 
-    try:
-        os.makedirs(path_output, exist_ok=True)
-        tables = lz.read(pdf_path).extract_tables(flavor=args.flavor)
+    output_folder = output_folder_for(path_output, pdf_file)
+    with metrics.stage("read"):
+        pdf = lz.read(pdf_path)
+    metrics.record(pages=pdf.page_count)
+    with metrics.stage("operation"):
+        tables = pdf.extract_tables(flavor=flavor)
+    output_paths = []
 
-        if tables:
+    if tables:
+        with metrics.stage("write"):
             for table_index, table in enumerate(tables, start=1):
                 try:
-                    output_filename = f"{timestamp}_{pdf_file.split('.')[0]}_table{table_index}"
+                    output_filename = f"{timestamp}_{os.path.basename(pdf_file).split('.')[0]}_table{table_index}"
                     df = pd.DataFrame(table[1:], columns=table[0] if table else None)
 
-                    if args.export_format == "csv":
-                        output_path = os.path.join(path_output, f"{output_filename}.csv")
+                    if export_format == "csv":
+                        output_path = os.path.join(output_folder, f"{output_filename}.csv")
                         df.to_csv(output_path, index=False)
                         logging.info(f"Table {table_index} saved as CSV: {output_filename}.csv")
-                    elif args.export_format == "excel":
-                        output_path = os.path.join(path_output, f"{output_filename}.xlsx")
+                    elif export_format == "excel":
+                        output_path = os.path.join(output_folder, f"{output_filename}.xlsx")
                         df.to_excel(output_path, index=False)
                         logging.info(f"Table {table_index} saved as Excel: {output_filename}.xlsx")
+                    output_paths.append(output_path)
                 except Exception as e:
                     logging.error(f"Failed to save table {table_index} - {e}")
-        else:
-            logging.info(f"No tables found in {pdf_file}.")
-
-    except Exception as e:
-        logging.error(f"Failed to process {pdf_file} - {e}")
-
-logging.info("PDF Table Extraction Process Completed Successfully")
-logging.info(f"Total PDF files processed: {input_num_pdfs}")
+    else:
+        logging.info(f"No tables found in {pdf_file}.")
+
+    return output_paths
+
+
+if __name__ == "__main__":
+    # Argument parser setup
+    parser = argparse.ArgumentParser(description="Extract tables from PDF files and save in CSV or Excel format.")
+    parser.add_argument("--export-format", type=str, choices=["csv", "excel"], default="csv",
+                        help="Output format for the extracted tables: 'csv' or 'excel' (default: csv)")
+    parser.add_argument("--flavor", type=str, choices=["stream", "lattice"], default="lattice",
+                        help="Table detection strategy: 'lattice' (tables with borders) or 'stream' (borderless). Default: lattice.")
+    add_discovery_arguments(parser, ["*.pdf"])
+    add_batch_arguments(parser)
+    args = parser.parse_args()
+
+    # Set up queued console and rotating file logging with program name as prefix in each log entry
+    setup_logging(f"{PROGRAM_NAME}: %(message)s", path_log, args)
+
+    logging.info("Starting PDF Table Extraction Process")
+    logging.info(f"Timestamp: {timestamp}")
+    logging.info(f"Input folder: {path_input}")
+    logging.info(f"Output folder: {path_output}")
+    logging.info(f"Output format: {args.export_format}")
+    logging.info("Searching for PDF files in the input folder...")
+
+    # Stream the matching files, processing starts while the input folder is still being scanned
+    input_filter = input_filter_from_args(args)
+    input_pdf_files = discover_files(path_input, input_filter, recursive=args.recursive)
+
+    # Process each PDF file
+    summary = run_batch(partial(extract_tables_from_file, timestamp=timestamp, export_format=args.export_format,
+                                flavor=args.flavor),
+                        input_pdf_files, args, path_input, path_output,
+                        path_metrics=path_metrics, file_filter=input_filter)
+
+    # Check if there were any PDF files to process
+    if not summary.results and not args.watch:
+        logging.warning("No PDF files found in the input folder. Exiting.")
+        sys.exit()
+
+    logging.info("PDF Table Extraction Process Completed Successfully")
+    logging.info(f"Total PDF files processed: {len(summary.results)}")
@@ -8,10 +8,13 @@
 
 import os
 import sys
+import shutil
 import logging
 import argparse
+import pymupdf
 import lazypdf as lz
 from datetime import datetime
+from functools import partial
 
 # Program name for log prefix
 PROGRAM_NAME = "PDF Flattener"
@@ -24,6 +27,7 @@ input_foldername = 'input'
 output_foldername = 'output'
 log_foldername = 'logs'
 log_filename = f"{timestamp}_log.log"
+metrics_filename = f"{timestamp}_metrics.jsonl"
 
 # Define paths
 path_script = os.path.realpath(__file__)
@@ -32,55 +36,138 @@ path_input = os.path.join(path_project, input_foldername)
 path_output = os.path.join(path_project, output_foldername)
 path_log_folder = os.path.join(path_project, log_foldername)
 path_log = os.path.join(path_log_folder, log_filename)
-
-# Set up logging with program name as prefix in each log entry
-os.makedirs(path_log_folder, exist_ok=True)
-log_format = f"{PROGRAM_NAME}: %(message)s"
-
-# Configure root logger for console output
-logging.basicConfig(level=logging.DEBUG, format=log_format)
-
-# Configure file handler with the same format
-file_handler = logging.FileHandler(path_log)
-file_handler.setFormatter(logging.Formatter(log_format))
-logging.getLogger().addHandler(file_handler)
-
-# Argument parser setup
-parser = argparse.ArgumentParser(description="Flatten PDF files by rasterizing pages.")
-parser.add_argument("--dpi", type=int, default=72,
-                    help="Resolution in DPI for rasterization. Lower = smaller file, higher = better quality. Default: 72.")
-args = parser.parse_args()
-
-logging.info("Starting PDF Flattening Process")
-logging.info(f"Timestamp: {timestamp}")
-logging.info(f"Input folder: {path_input}")
-logging.info(f"Output folder: {path_output}")
-logging.info("Searching for PDF files in the input folder...")
-
-# List and count PDF files
-input_pdf_files = [f for f in os.listdir(path_input) if f.endswith(".pdf")]
-input_num_pdfs = len(input_pdf_files)
-logging.info(f"Found {input_num_pdfs} PDF file(s) to process.")
-
-# Check if there are any PDF files to process
-if not input_pdf_files:
-    logging.warning("No PDF files found in the input folder. Exiting the program.")
-    sys.exit()
-
-# Process each PDF file
-for pdf_file in input_pdf_files:
+path_metrics = os.path.join(path_log_folder, metrics_filename)
+
+# Make the shared modules in the repository root importable
+sys.path.insert(0, os.path.dirname(path_project))
+from common import metrics
+from common.batch_runner import add_batch_arguments, run_batch
+from common.discovery import add_discovery_arguments, discover_files, input_filter_from_args, output_folder_for
+from common.logging_setup import setup_logging
+from common.page_raster import MAX_IN_FLIGHT_PAGES, annotated_pages, flatten_parallel
+from common.page_windows import add_window_arguments, process_in_windows
+
+
+# Pages of the window starting at first_page to flatten, renumbered from 1 within the window
+def _window_pages(pages, first_page, page_count):
+    if pages is None:
+        return None
+    return [page_num - first_page + 1 for page_num in pages if first_page <= page_num < first_page + page_count]
+
+
+# Flatten a single PDF file (runs inside a worker process when --workers > 1).
+# With page_workers > 1, its pages are rasterized by that many processes (see flatten_parallel()).
+# only_annotated rasterizes only the pages with annotations or form fields (see annotated_pages())
+# and copies the other pages as vector content. bake writes the annotations and form fields of
+# those pages into their content as vectors instead, nothing is rasterized.
+def flatten_pdf_file(pdf_file, timestamp, dpi, window_pages, page_workers=1, max_in_flight_pages=MAX_IN_FLIGHT_PAGES,
+                     only_annotated=False, bake=False):
     pdf_path = os.path.join(path_input, pdf_file)
     logging.info(f"Processing file: {pdf_file}")
 
-    try:
-        os.makedirs(path_output, exist_ok=True)
-        output_pdf_path = os.path.join(path_output, f"{timestamp}_flattened_{pdf_file}")
-
-        lz.read(pdf_path).flatten(dpi=args.dpi).to_pdf(output_pdf_path)
-        logging.info(f"Flattened PDF saved as {output_pdf_path}")
-
-    except Exception as e:
-        logging.error(f"Failed to flatten {pdf_file} - {e}")
-
-logging.info("PDF Flattening Process Completed Successfully")
-logging.info(f"Total PDF files processed: {input_num_pdfs}")
+    output_folder = output_folder_for(path_output, pdf_file)
+    output_pdf_path = os.path.join(output_folder, f"{timestamp}_flattened_{os.path.basename(pdf_file)}")
+
+    pages = None
+    if only_annotated or bake:
+        with metrics.stage("scan"):
+            document = pymupdf.open(pdf_path)
+            try:
+                page_count = document.page_count
+                pages = annotated_pages(document)
+            finally:
+                document.close()
+        metrics.record(pages=page_count)
+        metrics.count(pages_flattened=len(pages))
+        logging.info(f"{len(pages)} of {page_count} page(s) have annotations or form fields to flatten")
+
+    if bake:
+        document = pymupdf.open(pdf_path)
+        try:
+            with metrics.stage("operation"):
+                document.bake(annots=True, widgets=True)
+            with metrics.stage("write"):
+                document.save(output_pdf_path)
+        finally:
+            document.close()
+    elif pages == []:
+        # Nothing to flatten, the file is copied through as it is
+        with metrics.stage("write"):
+            shutil.copyfile(pdf_path, output_pdf_path)
+    elif page_workers > 1:
+        flatten_parallel(pdf_path, output_pdf_path, dpi, page_workers, max_in_flight_pages, pages)
+    elif window_pages:
+        # Page-independent operation applied to one window of pages at a time
+        def flatten_window(pdf, first_page):
+            window = _window_pages(pages, first_page, pdf.page_count)
+            return pdf.flatten(dpi=dpi, pages=window) if window != [] else pdf
+
+        process_in_windows(pdf_path, output_pdf_path, flatten_window, window_pages)
+    else:
+        with metrics.stage("read"):
+            pdf = lz.read(pdf_path)
+        metrics.record(pages=pdf.page_count)
+        with metrics.stage("operation"):
+            pdf = pdf.flatten(dpi=dpi, pages=pages)
+        with metrics.stage("write"):
+            pdf.to_pdf(output_pdf_path)
+    logging.info(f"Flattened PDF saved as {output_pdf_path}")
+    return output_pdf_path
+
+
+if __name__ == "__main__":
+    # Argument parser setup
+    parser = argparse.ArgumentParser(description="Flatten PDF files by rasterizing pages.")
+    parser.add_argument("--dpi", type=int, default=72,
+                        help="Resolution in DPI for rasterization. Lower = smaller file, higher = better quality. Default: 72.")
+    parser.add_argument("--page-workers", type=int, default=1, metavar="N",
+                        help="Rasterize the pages of each file in N processes, for large files at high DPI. "
+                             "Default: 1 (serial).")
+    parser.add_argument("--max-in-flight-pages", type=int, default=MAX_IN_FLIGHT_PAGES, metavar="N",
+                        help="With --page-workers, pages rendered or waiting to be written at any time, which "
+                             f"bounds memory. Default: {MAX_IN_FLIGHT_PAGES}.")
+    parser.add_argument("--only-annotated", action="store_true",
+                        help="Rasterize only the pages with annotations or form fields, and copy the other "
+                             "pages as they are (vector text stays text).")
+    parser.add_argument("--bake", action="store_true",
+                        help="Write the annotations and form fields into the page content as vectors instead of "
+                             "rasterizing the pages. Only the pages that have them change.")
+    add_window_arguments(parser)
+    add_discovery_arguments(parser, ["*.pdf"])
+    add_batch_arguments(parser)
+    args = parser.parse_args()
+    if args.page_workers < 1 or args.max_in_flight_pages < 1:
+        parser.error("--page-workers and --max-in-flight-pages must be at least 1")
+    if args.page_workers > 1 and args.window_pages:
+        parser.error("--page-workers cannot be used with --window-pages, it already bounds memory")
+    if args.bake and (args.page_workers > 1 or args.window_pages):
+        parser.error("--bake does not rasterize, --page-workers and --window-pages do not apply to it")
+
+    # Set up queued console and rotating file logging with program name as prefix in each log entry
+    setup_logging(f"{PROGRAM_NAME}: %(message)s", path_log, args)
+
+    logging.info("Starting PDF Flattening Process")
+    logging.info(f"Timestamp: {timestamp}")
+    logging.info(f"Input folder: {path_input}")
+    logging.info(f"Output folder: {path_output}")
+    logging.info("Searching for PDF files in the input folder...")
+
+    # Stream the matching files, processing starts while the input folder is still being scanned
+    input_filter = input_filter_from_args(args)
+    input_pdf_files = discover_files(path_input, input_filter, recursive=args.recursive)
+
+    # Process each PDF file
+    summary = run_batch(partial(flatten_pdf_file, timestamp=timestamp, dpi=args.dpi,
+                                window_pages=args.window_pages, page_workers=args.page_workers,
+                                max_in_flight_pages=args.max_in_flight_pages,
+                                only_annotated=args.only_annotated, bake=args.bake),
+                        input_pdf_files, args, path_input, path_output,
+                        path_metrics=path_metrics, file_filter=input_filter)
+
+    # Check if there were any PDF files to process
+    if not summary.results and not args.watch:
+        logging.warning("No PDF files found in the input folder. Exiting.")
+        sys.exit()
+
+    logging.info("PDF Flattening Process Completed Successfully")
+    logging.info(f"Total PDF files processed: {len(summary.results)}")
@@ -10,7 +10,6 @@ import os
 import sys
 import argparse
 import logging
-import lazypdf as lz
 from datetime import datetime
 
 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -20,6 +19,7 @@ input_foldername = 'input'
 output_foldername = 'output'
 log_foldername = 'logs'
 log_filename = f"{timestamp}_log.log"
+metrics_filename = f"{timestamp}_metrics.jsonl"
 
 # Define paths
 path_script = os.path.realpath(__file__)
@@ -28,54 +28,135 @@ path_input = os.path.join(path_project, input_foldername)
 path_output = os.path.join(path_project, output_foldername)
 path_log_folder = os.path.join(path_project, log_foldername)
 path_log = os.path.join(path_log_folder, log_filename)
-
-# Set up logging
-os.makedirs(path_log_folder, exist_ok=True)
-logging.basicConfig(level=logging.DEBUG, format='%(message)s')
-file_handler = logging.FileHandler(path_log)
-logging.getLogger().addHandler(file_handler)
-
-# Argument parser setup
-parser = argparse.ArgumentParser(description="Merge PDF files by filename or creation date.")
-parser.add_argument("--sort", choices=["filename", "date"], default="filename",
-                    help="Sort order for merging: 'filename' or 'date'")
-args = parser.parse_args()
-
-logging.info("PDF Merger: Starting")
-logging.info("PDF Merger: Searching for PDF files to merge in the input folder...")
-
-# List and sort PDF files based on the argument
-input_pdf_files = [f for f in os.listdir(path_input) if f.endswith(".pdf")]
-input_num_pdfs = len(input_pdf_files)
-logging.info(f"PDF Merger: {input_num_pdfs} PDF(s) found")
-
-# Check if there are any PDF files to process
-if not input_pdf_files:
-    logging.info("PDF Merger: No PDF files found. Exiting the program.")
-    sys.exit()
-
-#sorting merge order
-if args.sort == "filename":
-    input_pdf_files.sort()  # Sort by filename
-    logging.info("PDF Merger: Sorting by filename")
-elif args.sort == "date":
-    input_pdf_files.sort(key=lambda f: os.path.getctime(os.path.join(path_input, f)))  # Sort by creation date
-    logging.info("PDF Merger: Sorting by creation date")
-
-# Build full paths for merging
-pdf_paths = [os.path.join(path_input, f) for f in input_pdf_files]
-
-logging.info("PDF Merger: Merging files...")
-for pdf_file in input_pdf_files:
-    logging.info(f"PDF Merger: Merging {pdf_file}")
-
-# Generate a timestamped filename for the output PDF
-output_filename = f"{timestamp}_merged_pdf.pdf"
-output_path = os.path.join(path_output, output_filename)
-
-# Ensure the output folder exists and save the merged file
-os.makedirs(path_output, exist_ok=True)
-logging.info(f"PDF Merger: Exporting merged PDF to {output_path}")
-lz.merge(*pdf_paths).to_pdf(output_path)
-
-logging.info("PDF Merger: Process completed successfully.")
+path_metrics = os.path.join(path_log_folder, metrics_filename)
+
+# Make the shared modules in the repository root importable
+sys.path.insert(0, os.path.dirname(path_project))
+from common import metrics
+from common.batch_runner import log_metrics_summary, metrics_record
+from common.discovery import add_discovery_arguments, discover_files, input_filter_from_args
+from common.logging_setup import add_logging_arguments, setup_logging
+from common.merge_writer import DEDUP_MEMORY_ENTRIES, FLUSH_MB, StreamingMerger, merge_input, merge_parallel
+
+
+# Merge the PDF files, in order, into output_path. Inputs are streamed one at a time, so memory
+# and open files stay bounded. Progress and the time spent on each input are logged and written
+# to the metrics file; inputs that cannot be read are reported and left out of the merge.
+# With dedup=True, streams repeated across inputs (fonts, logos, ICC profiles) are stored once.
+# With append=True, output_path is an existing PDF and the pages are added to it as incremental
+# updates, without rewriting what it already holds. With workers > 1, chunks of inputs are merged
+# by worker processes and appended in order (see merge_parallel()).
+def merge_pdf_files(input_pdf_files, output_path, flush_mb, dedup=False, dedup_memory_entries=DEDUP_MEMORY_ENTRIES,
+                    append=False, workers=1):
+    metrics_writer = metrics.MetricsWriter(path_metrics)
+    failed = []
+    processed = 0
+    deduplicated_objects = saved_bytes = 0
+
+    def on_result(result):
+        nonlocal processed
+        processed += 1
+        progress = f"[{processed}/{len(input_pdf_files)}]"
+        if result.success:
+            logging.info(f"PDF Merger: {progress} Merged {result.name} "
+                         f"({result.metrics['pages']} page(s), {result.elapsed:.2f}s)")
+        else:
+            failed.append(result)
+            logging.error(f"PDF Merger: {progress} Failed to merge {result.name} - {result.error}")
+        metrics_writer.write(metrics_record(result, path_input))
+
+    try:
+        with StreamingMerger(output_path, flush_mb=flush_mb, deduplicate=dedup,
+                             dedup_memory_entries=dedup_memory_entries, append=append) as merger:
+            if workers > 1:
+                deduplicated_objects, saved_bytes = merge_parallel(merger, path_input, input_pdf_files, workers,
+                                                                   flush_mb, dedup, on_result)
+            else:
+                for pdf_file in input_pdf_files:
+                    on_result(merge_input(merger, path_input, pdf_file))
+    finally:
+        metrics_summary = metrics_writer.close()
+
+    logging.info(f"PDF Merger: {merger.page_count} page(s) from {len(input_pdf_files) - len(failed)} file(s) "
+                 f"merged, {len(failed)} failed")
+    if dedup:
+        logging.info(f"PDF Merger: Deduplicated {merger.deduplicated_objects + deduplicated_objects} stream "
+                     f"object(s), {(merger.saved_bytes + saved_bytes) / (1024 * 1024):.1f} MB saved")
+    for result in failed:
+        logging.info(f"PDF Merger:   - Failed: {result.name} ({result.error})")
+    if metrics_summary["files"]:
+        log_metrics_summary(metrics_summary)
+    return output_path
+
+
+if __name__ == "__main__":
+    # Argument parser setup
+    parser = argparse.ArgumentParser(description="Merge PDF files by filename or creation date.")
+    parser.add_argument("--sort", choices=["filename", "date"], default="filename",
+                        help="Sort order for merging: 'filename' or 'date'")
+    parser.add_argument("--flush-mb", type=float, default=FLUSH_MB,
+                        help=f"Input data (in MB) kept in memory before it is appended to the merged file. "
+                             f"Lower values use less memory. Default: {FLUSH_MB}.")
+    parser.add_argument("--append-to", metavar="PDF",
+                        help="Append the pages to this existing PDF as an incremental update instead of writing a "
+                             "new merged file. Only the new pages are written, however large the PDF is.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of worker processes that parse and merge chunks of the inputs in parallel; "
+                             "the chunks are then appended in order. Default: 1.")
+    parser.add_argument("--dedup", action="store_true",
+                        help="Store streams repeated across the inputs (embedded fonts, logos, ICC profiles) "
+                             "only once in the merged file.")
+    parser.add_argument("--dedup-memory-entries", type=int, default=DEDUP_MEMORY_ENTRIES,
+                        help=f"Entries of the --dedup index kept in memory before it moves to an SQLite file "
+                             f"next to the output. Default: {DEDUP_MEMORY_ENTRIES}.")
+    add_discovery_arguments(parser, ["*.pdf"])
+    add_logging_arguments(parser)
+    args = parser.parse_args()
+    if args.append_to and not os.path.isfile(args.append_to):
+        parser.error(f"--append-to: {args.append_to} does not exist")
+
+    # Set up queued console and rotating file logging
+    setup_logging('%(message)s', path_log, args)
+
+    logging.info("PDF Merger: Starting")
+    logging.info("PDF Merger: Searching for PDF files to merge in the input folder...")
+
+    # List and sort PDF files based on the argument
+    input_pdf_files = list(discover_files(path_input, input_filter_from_args(args), recursive=args.recursive))
+    input_num_pdfs = len(input_pdf_files)
+    logging.info(f"PDF Merger: {input_num_pdfs} PDF(s) found")
+
+    # Check if there are any PDF files to process
+    if not input_pdf_files:
+        logging.info("PDF Merger: No PDF files found. Exiting the program.")
+        sys.exit()
+
+    #sorting merge order
+    if args.sort == "filename":
+        input_pdf_files.sort()  # Sort by filename
+        logging.info("PDF Merger: Sorting by filename")
+    elif args.sort == "date":
+        input_pdf_files.sort(key=lambda f: os.path.getctime(os.path.join(path_input, f)))  # Sort by creation date
+        logging.info("PDF Merger: Sorting by creation date")
+
+    if args.append_to:
+        # The existing PDF is never merged into itself, even when it sits in the input folder
+        output_path = os.path.abspath(args.append_to)
+        input_pdf_files = [f for f in input_pdf_files if os.path.abspath(os.path.join(path_input, f)) != output_path]
+        logging.info(f"PDF Merger: Appending files to {output_path}")
+    else:
+        # Generate a timestamped filename for the output PDF
+        output_filename = f"{timestamp}_merged_pdf.pdf"
+        output_path = os.path.join(path_output, output_filename)
+
+        # Ensure the output folder exists and stream the inputs into the merged file
+        os.makedirs(path_output, exist_ok=True)
+        logging.info(f"PDF Merger: Merging files into {output_path}")
+    try:
+        merge_pdf_files(input_pdf_files, output_path, args.flush_mb, args.dedup, args.dedup_memory_entries,
+                        append=bool(args.append_to), workers=args.workers)
+    except ValueError as e:
+        logging.error(f"PDF Merger: {e}")
+        sys.exit(1)
+
+    logging.info("PDF Merger: Process completed successfully.")
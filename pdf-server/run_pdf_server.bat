@@ -0,0 +1,10 @@
+call activate sandbox
+python scripts/pdf_server.py --workers 2 --path-root ..
+:: Use the options below to listen on a Unix socket (Linux/macOS) or to limit the job queue:
+::python scripts/pdf_server.py --socket /tmp/pdf-server.sock
+::python scripts/pdf_server.py --workers 4 --queue-size 8
+:: Test client examples (run in another terminal while the server is running):
+::python scripts/pdf_client.py --health
+::python scripts/pdf_client.py compress ../compress-pdf/input/sample1.pdf --param compression_level=9 --output compressed.pdf
+::python scripts/pdf_client.py merge ../merge-pdf/input/sample1.pdf ../merge-pdf/input/sample2.pdf --by-path --output merged.pdf
+PAUSE
\ No newline at end of file
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+# ==============================================================================
+#   Author: João Manoel Feck
+#   Email: joaomfeck@gmail.com
+#   GitHub: https://github.com/jmfeck
+# ==============================================================================
+
+import os
+import sys
+import json
+import time
+import socket
+import logging
+import argparse
+import http.client
+from urllib.parse import urlencode
+from concurrent.futures import ThreadPoolExecutor
+
+# Program name for log prefix
+PROGRAM_NAME = "PDF Client"
+
+CHUNK_SIZE = 1024 * 1024
+
+
+# HTTP connection over a Unix domain socket
+class UnixHTTPConnection(http.client.HTTPConnection):
+
+    def __init__(self, socket_path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def open_connection(args):
+    if args.socket:
+        return UnixHTTPConnection(args.socket, timeout=args.timeout)
+    return http.client.HTTPConnection(args.host, args.port, timeout=args.timeout)
+
+
+# Send one job and save the response; busy answers (503) are retried after Retry-After
+def send_job(args, input_path, output_path):
+    query = dict(param.split("=", 1) for param in args.param)
+    if args.by_path:
+        query_items = list(query.items()) + [("path", os.path.abspath(path)) for path in input_path]
+    else:
+        query_items = list(query.items()) + [("filename", os.path.basename(input_path[0]))]
+    url = f"/jobs/{args.operation}?{urlencode(query_items)}"
+    # The server refuses jobs without a non-simple content type, and without its token if it has one
+    headers = {"Content-Type": "application/pdf"}
+    if args.token:
+        headers["X-PDF-Server-Token"] = args.token
+
+    for attempt in range(args.retries + 1):
+        start_time = time.perf_counter()
+        connection = open_connection(args)
+        try:
+            if args.by_path:
+                connection.request("POST", url, body=b"", headers=dict(headers, **{"Content-Length": "0"}))
+            else:
+                # The file object is streamed by http.client, it is never read into memory at once
+                with open(input_path[0], "rb") as file:
+                    connection.request("POST", url, body=file,
+                                       headers=dict(headers, **{"Content-Length": str(os.path.getsize(input_path[0]))}))
+            response = connection.getresponse()
+        except (BrokenPipeError, ConnectionResetError):
+            # The server refused the job (503) and closed the connection while the file was uploading
+            response = None
+        try:
+            busy = response is None or response.status == 503
+            if busy and attempt < args.retries:
+                delay = float(response.getheader("Retry-After", "1")) if response is not None else 1.0
+                logging.info(f"Server busy, retrying in {delay}s ({attempt + 1}/{args.retries})")
+                time.sleep(delay)
+                continue
+            if response is None:
+                break
+
+            content_type = response.getheader("Content-Type", "")
+            if response.status != 200 or content_type.startswith("application/json"):
+                body = json.loads(response.read() or b"{}")
+                return response.status, body, time.perf_counter() - start_time
+
+            with open(output_path, "wb") as file:
+                while True:
+                    chunk = response.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    file.write(chunk)
+            return response.status, {"saved": output_path}, time.perf_counter() - start_time
+        finally:
+            connection.close()
+    return 503, {"error": "Server busy"}, 0.0
+
+
+def _default_output(args, input_path, index):
+    extension = ".txt" if args.operation.startswith("extract-text") else ".pdf"
+    if args.operation in ("split", "extract-images"):
+        extension = ".zip"
+    stem = os.path.splitext(os.path.basename(input_path[0]))[0]
+    suffix = f"_{index}" if args.repeat > 1 else ""
+    return f"{stem}_{args.operation}{suffix}{extension}"
+
+
+if __name__ == "__main__":
+    # Set up logging with program name as prefix in each log entry
+    log_format = f"{PROGRAM_NAME}: %(message)s"
+    logging.basicConfig(level=logging.INFO, format=log_format)
+
+    # Argument parser setup
+    parser = argparse.ArgumentParser(description="Test client for pdf_server.py.")
+    parser.add_argument("operation", type=str, nargs="?", default=None,
+                        help="Operation to run, e.g. compress, split, merge, extract-text. Omit with --health.")
+    parser.add_argument("inputs", type=str, nargs="*", help="Input file(s). merge takes several files with --by-path.")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Server address. Default: 127.0.0.1.")
+    parser.add_argument("--port", type=int, default=8765, help="Server port. Default: 8765.")
+    parser.add_argument("--socket", type=str, default=None, help="Connect to this Unix socket instead of TCP.")
+    parser.add_argument("--param", type=str, action="append", default=[],
+                        help="Job option as key=value, e.g. --param compression_level=9 --param pages=1-3.")
+    parser.add_argument("--by-path", action="store_true",
+                        help="Send the input file paths instead of streaming the file content "
+                             "(the server needs --path-root).")
+    parser.add_argument("--output", type=str, default=None, help="Where to save the result.")
+    parser.add_argument("--token", type=str, default=os.environ.get("PDF_SERVER_TOKEN"),
+                        help="Shared token of a server started with --token. Default: the PDF_SERVER_TOKEN "
+                             "environment variable, if set.")
+    parser.add_argument("--repeat", type=int, default=1, help="Send the job this many times. Default: 1.")
+    parser.add_argument("--concurrency", type=int, default=1, help="Number of jobs sent at the same time. Default: 1.")
+    parser.add_argument("--retries", type=int, default=5, help="Retries when the server is busy. Default: 5.")
+    parser.add_argument("--timeout", type=float, default=600, help="Request timeout in seconds. Default: 600.")
+    parser.add_argument("--health", action="store_true", help="Print the server status and exit.")
+    args = parser.parse_args()
+
+    if args.health or not args.operation:
+        connection = open_connection(args)
+        connection.request("GET", "/health")
+        print(json.dumps(json.loads(connection.getresponse().read()), indent=2))
+        connection.request("GET", "/operations")
+        print(json.dumps(json.loads(connection.getresponse().read()), indent=2))
+        sys.exit()
+
+    if not args.inputs:
+        parser.error("at least one input file is required")
+    if len(args.inputs) > 1 and not args.by_path:
+        parser.error("several inputs (merge) require --by-path")
+    if any("=" not in param for param in args.param):
+        parser.error("--param values must look like key=value")
+
+    jobs = [(args.inputs, args.output or _default_output(args, args.inputs, index)) for index in range(args.repeat)]
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(lambda job: send_job(args, *job), jobs))
+    elapsed = time.perf_counter() - start_time
+
+    for status, body, seconds in results:
+        logging.info(f"HTTP {status} in {seconds:.3f}s - {body}")
+    succeeded = sum(1 for status, _, _ in results if status == 200)
+    logging.info(f"{succeeded}/{len(results)} job(s) succeeded in {elapsed:.3f}s")
+    sys.exit(0 if succeeded == len(results) else 1)
@@ -0,0 +1,631 @@
+# -*- coding: utf-8 -*-
+
+# ==============================================================================
+#   Author: João Manoel Feck
+#   Email: joaomfeck@gmail.com
+#   GitHub: https://github.com/jmfeck
+# ==============================================================================
+
+import os
+import sys
+import hmac
+import json
+import time
+import shutil
+import signal
+import socket
+import logging
+import zipfile
+import argparse
+import tempfile
+import threading
+import pymupdf
+import lazypdf as lz
+from datetime import datetime
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Program name for log prefix
+PROGRAM_NAME = "PDF Server"
+
+# Set up timestamp
+timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+# Folder and file paths
+log_foldername = 'logs'
+log_filename = f"{timestamp}_log.log"
+metrics_filename = f"{timestamp}_metrics.jsonl"
+
+# Define paths
+path_script = os.path.realpath(__file__)
+path_project = os.path.dirname(os.path.dirname(path_script))
+path_log_folder = os.path.join(path_project, log_foldername)
+path_log = os.path.join(path_log_folder, log_filename)
+path_metrics = os.path.join(path_log_folder, metrics_filename)
+
+# Make the shared modules in the repository root importable
+sys.path.insert(0, os.path.dirname(path_project))
+from common import metrics
+from common.logging_setup import add_logging_arguments, init_worker_logging, setup_logging, start_worker_log_listener
+from common.merge_writer import StreamingMerger
+from common.operations import OPERATIONS, parse_steps, run_steps
+from common.page_ranges import duplicate_ranges, format_ranges, iter_pages, parse_page_ranges
+from common.page_subset import split_parts, write_part
+
+# Size of the blocks used to stream request and response bodies
+CHUNK_SIZE = 1024 * 1024
+
+# Content types a web page can POST cross-site without a CORS preflight. Jobs sent with them (or
+# without a Content-Type) are refused, so a page open in a browser cannot submit jobs.
+SIMPLE_CONTENT_TYPES = {"", "text/plain", "application/x-www-form-urlencoded", "multipart/form-data"}
+
+# Header carrying the shared token set with --token
+TOKEN_HEADER = "X-PDF-Server-Token"
+
+# Query parameters accepted by the jobs and their types (the names match the tool options)
+PARAM_TYPES = {
+    "engine": str, "rotate": int, "size": str, "position": str, "watermark_path": str,
+    "watermark_transparency": float, "img_quality": int, "compression_level": int, "password": str,
+    "algorithm": str, "dpi": int, "pages": str, "steps": str, "groups": str, "every": int,
+    "max_bytes": int, "compress": int, "dedup": int,
+}
+
+
+def _parse_pages(pages, page_count):
+    if not pages or pages == "all":
+        return list(range(1, page_count + 1))
+    return list(iter_pages(parse_page_ranges(pages), page_count))
+
+
+def _output_path(output_dir, input_path, suffix, extension=".pdf"):
+    name = os.path.splitext(os.path.basename(input_path))[0]
+    return os.path.join(output_dir, f"{name}_{suffix}{extension}")
+
+
+# Run one of the pipeline operations (rotate, compress, encrypt...) on a single PDF
+def _single_operation(name):
+    def job(input_paths, output_dir, options):
+        with metrics.stage("read"):
+            pdf = lz.read(input_paths[0])
+        metrics.record(pages=pdf.page_count)
+        with metrics.stage("operation"):
+            pdf = OPERATIONS[name](pdf, options)
+        output_path = _output_path(output_dir, input_paths[0], name)
+        with metrics.stage("write"):
+            pdf.to_pdf(output_path)
+        return [output_path]
+    return job
+
+
+def job_pipeline(input_paths, output_dir, options):
+    with metrics.stage("read"):
+        pdf = lz.read(input_paths[0])
+    metrics.record(pages=pdf.page_count)
+    pdf = run_steps(pdf, parse_steps(options.get("steps", "")), options)
+    output_path = _output_path(output_dir, input_paths[0], "pipeline")
+    with metrics.stage("write"):
+        pdf.to_pdf(output_path)
+    return [output_path]
+
+
+def job_decrypt(input_paths, output_dir, options):
+    with metrics.stage("read"):
+        pdf = lz.read(input_paths[0])
+    with metrics.stage("operation"):
+        pdf = pdf.decrypt(options.get("password", ""))
+    metrics.record(pages=pdf.page_count)
+    output_path = _output_path(output_dir, input_paths[0], "decrypted")
+    with metrics.stage("write"):
+        pdf.to_pdf(output_path)
+    return [output_path]
+
+
+def job_flatten(input_paths, output_dir, options):
+    with metrics.stage("read"):
+        pdf = lz.read(input_paths[0])
+    metrics.record(pages=pdf.page_count)
+    with metrics.stage("operation"):
+        pdf = pdf.flatten(dpi=options.get("dpi", 72))
+    output_path = _output_path(output_dir, input_paths[0], "flattened")
+    with metrics.stage("write"):
+        pdf.to_pdf(output_path)
+    return [output_path]
+
+
+def job_select(input_paths, output_dir, options):
+    with metrics.stage("read"):
+        source = pymupdf.open(input_paths[0])
+    metrics.record(pages=source.page_count)
+    output_path = _output_path(output_dir, input_paths[0], "selected_pages")
+    try:
+        page_numbers = _parse_pages(options.get("pages"), source.page_count)
+        if not page_numbers:
+            raise ValueError("None of the selected pages exist in the document")
+        write_part(source, page_numbers, output_path, compress=bool(options.get("compress")))
+    finally:
+        source.close()
+    return [output_path]
+
+
+def job_split(input_paths, output_dir, options):
+    with metrics.stage("read"):
+        source = pymupdf.open(input_paths[0])
+    metrics.record(pages=source.page_count)
+    output_paths = []
+    try:
+        # Same modes as split-pdf: pages (one file per page, default), groups, every or max_bytes
+        if options.get("groups"):
+            groups = parse_page_ranges(options["groups"])
+            if duplicate_ranges(groups):
+                raise ValueError(f"groups lists {format_ranges(duplicate_ranges(groups))} more than once")
+            parts = split_parts(source, groups=groups)
+        elif options.get("every") or options.get("max_bytes"):
+            parts = split_parts(source, every=options.get("every"), max_bytes=options.get("max_bytes"))
+        else:
+            parts = ([page_num] for page_num in _parse_pages(options.get("pages"), source.page_count))
+        for part in parts:
+            suffix = f"page_{part[0]}" if len(part) == 1 else f"pages_{part[0]}-{part[-1]}"
+            output_path = _output_path(output_dir, input_paths[0], suffix)
+            output_paths.append(write_part(source, part, output_path))
+    finally:
+        source.close()
+    return output_paths
+
+
+def job_merge(input_paths, output_dir, options):
+    output_path = os.path.join(output_dir, "merged.pdf")
+    with StreamingMerger(output_path, deduplicate=bool(options.get("dedup"))) as merger:
+        for input_path in input_paths:
+            merger.add(input_path)
+    metrics.record(pages=merger.page_count)
+    return [output_path]
+
+
+def _extract_text(input_paths, output_dir, engine):
+    with metrics.stage("read"):
+        pdf = lz.read(input_paths[0])
+    metrics.record(pages=pdf.page_count)
+    with metrics.stage("operation"):
+        text = pdf.extract_text(engine=engine, page_separator="\n--- Page {n} ---\n")
+    output_path = _output_path(output_dir, input_paths[0], "text", ".txt")
+    with metrics.stage("write"), open(output_path, "w", encoding="utf-8") as text_file:
+        text_file.write(text)
+    return [output_path]
+
+
+def job_extract_text(input_paths, output_dir, options):
+    return _extract_text(input_paths, output_dir, options.get("engine", "text"))
+
+
+def job_extract_text_ocr(input_paths, output_dir, options):
+    return _extract_text(input_paths, output_dir, "ocr")
+
+
+def job_extract_images(input_paths, output_dir, options):
+    with metrics.stage("read"):
+        pdf = lz.read(input_paths[0])
+    metrics.record(pages=pdf.page_count)
+    with metrics.stage("write"):
+        return pdf.extract_images(output_dir)
+
+
+def job_to_pdfa(input_paths, output_dir, options):
+    with metrics.stage("read"):
+        pdf = lz.read(input_paths[0])
+    metrics.record(pages=pdf.page_count)
+    output_path = _output_path(output_dir, input_paths[0], "PDFA")
+    with metrics.stage("write"):
+        pdf.to_pdfa(output_path, engine=options.get("engine", "pymupdf"))
+    return [output_path]
+
+
+# Endpoint name -> job function. Every job takes the input file paths, a folder for its
+# outputs and the request options, and returns the paths of the files it wrote.
+JOBS = {name.replace("_", "-"): _single_operation(name) for name in OPERATIONS}
+JOBS.update({
+    "pipeline": job_pipeline,
+    "decrypt": job_decrypt,
+    "flatten": job_flatten,
+    "select": job_select,
+    "split": job_split,
+    "merge": job_merge,
+    "extract-text": job_extract_text,
+    "extract-text-ocr": job_extract_text_ocr,
+    "extract-images": job_extract_images,
+    "to-pdfa": job_to_pdfa,
+})
+
+
+# Runs inside a warm worker process
+def run_job(operation, input_paths, output_dir, options):
+    metrics.begin(operation)
+    try:
+        outputs = JOBS[operation](input_paths, output_dir, options)
+    finally:
+        data = metrics.finish()
+    return outputs, data
+
+
+# Load the heavy imports in every worker before the first request arrives
+def _warm_up():
+    time.sleep(0.1)
+    return os.getpid()
+
+
+# Raised by the request handler to answer with an error status
+class JobError(Exception):
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "PDFServer/1.0"
+
+    slot_acquired = False
+
+    # Unix socket clients have no address
+    def address_string(self):
+        return self.client_address[0] if self.client_address else "unix-socket"
+
+    def log_message(self, format, *args):
+        logging.debug(f"{self.address_string()} - {format % args}")
+
+    def _send_json(self, status, data, headers=None):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_file(self, path, content_type, filename):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(os.path.getsize(path)))
+        self.send_header("Content-Disposition", f'attachment; filename="{filename}"')
+        self.end_headers()
+        with open(path, "rb") as file:
+            shutil.copyfileobj(file, self.wfile, CHUNK_SIZE)
+
+    def _send_busy(self):
+        self.close_connection = True
+        self._send_json(503, {"error": "Server busy, retry later"}, {"Retry-After": "1"})
+
+    # Clients sending "Expect: 100-continue" (e.g. curl with large files) are refused before they upload
+    def handle_expect_100(self):
+        if self.command == "POST":
+            self.slot_acquired = self.server.slots.acquire(blocking=False)
+            if not self.slot_acquired:
+                self._send_busy()
+                return False
+        return super().handle_expect_100()
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == "/health":
+            self._send_json(200, self.server.status())
+        elif path == "/operations":
+            self._send_json(200, {"operations": sorted(JOBS)})
+        else:
+            self._send_json(404, {"error": f"Unknown path: {path}"})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        operation = url.path.rstrip("/").split("/")[-1]
+        if not url.path.startswith("/jobs/") or operation not in JOBS:
+            if self.slot_acquired:
+                self.slot_acquired = False
+                self.server.slots.release()
+            # Read the upload anyway so the client gets the 404 instead of a broken connection
+            try:
+                self._read_body(os.devnull)
+            except JobError:
+                pass
+            self.close_connection = True
+            self._send_json(404, {"error": f"Unknown operation. Options: {', '.join(sorted(JOBS))}"})
+            return
+
+        refused = self._refuse_reason()
+        if refused:
+            if self.slot_acquired:
+                self.slot_acquired = False
+                self.server.slots.release()
+            self.close_connection = True
+            self._send_json(*refused)
+            return
+
+        # Back-pressure: refuse work beyond the queue capacity before reading the upload
+        if not self.slot_acquired and not self.server.slots.acquire(blocking=False):
+            self._send_busy()
+            return
+
+        work_dir = tempfile.mkdtemp(prefix="pdf_server_")
+        try:
+            self._handle_job(operation, parse_qs(url.query), work_dir)
+        except JobError as e:
+            self.close_connection = True
+            self._send_json(e.status, {"error": str(e)})
+        except Exception as e:
+            logging.error(f"Job {operation} failed - {e}")
+            # The request body may be partly unread, the connection cannot be reused
+            self.close_connection = True
+            self._send_json(500, {"error": str(e)})
+        finally:
+            self.slot_acquired = False
+            self.server.slots.release()
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    # Status and error of a job request that is not allowed, or None. Requests must carry a content
+    # type other than the simple ones (see SIMPLE_CONTENT_TYPES) and the --token, if one is set.
+    def _refuse_reason(self):
+        token = self.server.token
+        if token and not hmac.compare_digest(self.headers.get(TOKEN_HEADER, "").encode(), token.encode()):
+            return 401, {"error": f"Missing or wrong {TOKEN_HEADER} header"}
+        content_type = self.headers.get("Content-Type", "").split(";")[0].strip().lower()
+        if content_type in SIMPLE_CONTENT_TYPES:
+            return 415, {"error": "Send the job with Content-Type: application/pdf"}
+        return None
+
+    # Resolved server-side file paths (?path=..., ?watermark_path=...), which must be files inside --path-root
+    def _server_paths(self, paths):
+        root = self.server.path_root
+        if root is None:
+            raise JobError(403, "Server-side paths are disabled, start the server with --path-root")
+        resolved = [os.path.realpath(path) for path in paths]
+        for path, real_path in zip(paths, resolved):
+            try:
+                inside = os.path.commonpath([root, real_path]) == root
+            except ValueError:
+                # Paths on another drive (Windows)
+                inside = False
+            if not inside:
+                raise JobError(403, f"Path outside of the server's --path-root: {path}")
+            if not os.path.isfile(real_path):
+                raise JobError(400, f"File not found: {path}")
+        return resolved
+
+    def _read_body(self, target_path):
+        max_bytes = self.server.max_upload_bytes
+        written = 0
+        with open(target_path, "wb") as file:
+            if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+                while True:
+                    try:
+                        size = int(self.rfile.readline().split(b";")[0], 16)
+                    except ValueError:
+                        size = -1
+                    if size < 0:
+                        raise JobError(400, "Malformed chunked request body")
+                    if size == 0:
+                        self.rfile.readline()
+                        break
+                    written += size
+                    if written > max_bytes:
+                        raise JobError(413, "Upload too large")
+                    chunk = self.rfile.read(size)
+                    if len(chunk) < size or self.rfile.readline().strip():
+                        raise JobError(400, "Malformed chunked request body")
+                    file.write(chunk)
+            else:
+                remaining = int(self.headers.get("Content-Length", 0))
+                if remaining > max_bytes:
+                    raise JobError(413, "Upload too large")
+                while remaining > 0:
+                    chunk = self.rfile.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise JobError(400, "Incomplete request body")
+                    file.write(chunk)
+                    remaining -= len(chunk)
+                    written += len(chunk)
+        return written
+
+    def _handle_job(self, operation, query, work_dir):
+        options = {}
+        for key, values in query.items():
+            if key in PARAM_TYPES:
+                try:
+                    options[key] = PARAM_TYPES[key](values[-1])
+                except ValueError:
+                    raise JobError(400, f"Invalid value for {key}: {values[-1]}")
+        # The watermark image is read by the worker, so it is confined like the inputs
+        if "watermark_path" in options:
+            options["watermark_path"] = self._server_paths([options["watermark_path"]])[0]
+
+        # Inputs are either server-side file paths (?path=..., inside --path-root) or the streamed request body
+        input_paths = query.get("path", [])
+        if input_paths:
+            input_paths = self._server_paths(input_paths)
+            input_bytes = sum(os.path.getsize(path) for path in input_paths)
+        else:
+            filename = os.path.basename(query.get("filename", ["input.pdf"])[-1]) or "input.pdf"
+            upload_path = os.path.join(work_dir, filename)
+            input_bytes = self._read_body(upload_path)
+            if input_bytes == 0:
+                raise JobError(400, "Send the PDF as the request body or pass ?path=")
+            input_paths = [upload_path]
+
+        output_dir = os.path.join(work_dir, "output")
+        os.makedirs(output_dir)
+        queued_at = time.perf_counter()
+        executor = None
+        try:
+            executor, future = self.server.submit(run_job, operation, input_paths, output_dir, options)
+            outputs, data = future.result()
+            status = "ok"
+        except BrokenProcessPool:
+            outputs, data, status = [], {}, "failed"
+            self.server.pool_crashed(executor)
+            raise JobError(500, f"{operation} failed: a worker process crashed, retry the job")
+        except Exception as e:
+            outputs, data, status = [], {}, "failed"
+            raise JobError(422, f"{operation} failed: {e}")
+        finally:
+            self.server.job_finished({
+                "type": "job", "operation": operation, "status": status,
+                "elapsed": round(time.perf_counter() - queued_at, 4),
+                "stages": {name: round(seconds, 4) for name, seconds in (data or {}).get("stages", {}).items()},
+                "pages": (data or {}).get("pages"), "input_bytes": input_bytes,
+                "output_bytes": metrics.size_of(outputs), "peak_rss_mb": (data or {}).get("peak_rss_mb"),
+                "process_peak_rss_mb": (data or {}).get("process_peak_rss_mb"),
+            })
+
+        # Stream the results back
+        if len(outputs) == 1:
+            content_type = "text/plain; charset=utf-8" if outputs[0].endswith(".txt") else "application/pdf"
+            self._send_file(outputs[0], content_type, os.path.basename(outputs[0]))
+        else:
+            zip_path = os.path.join(work_dir, f"{operation}.zip")
+            with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_STORED) as archive:
+                for output in outputs:
+                    archive.write(output, os.path.basename(output))
+            self._send_file(zip_path, "application/zip", os.path.basename(zip_path))
+
+
+class JobServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, new_executor, workers, queue_size, max_upload_mb, metrics_writer, path_root=None,
+                 token=None):
+        super().__init__(address, JobRequestHandler)
+        self.path_root = os.path.realpath(path_root) if path_root else None
+        self.token = token
+        self.new_executor = new_executor
+        self.executor = new_executor()
+        self.workers = workers
+        self.queue_size = queue_size
+        self.slots = threading.BoundedSemaphore(queue_size)
+        self.max_upload_bytes = max_upload_mb * 1024 * 1024
+        self.metrics_writer = metrics_writer
+        self._lock = threading.Lock()
+        self.active_jobs = 0
+        self.completed_jobs = 0
+
+    # Submit a job to the worker pool, returns the pool and the future of the job
+    def submit(self, *job):
+        with self._lock:
+            self.active_jobs += 1
+            try:
+                return self.executor, self.executor.submit(*job)
+            except BrokenProcessPool:
+                self._replace_executor(self.executor)
+                return self.executor, self.executor.submit(*job)
+
+    # A worker died (e.g. killed by the OS) while a job was running on the pool `broken`
+    def pool_crashed(self, broken):
+        with self._lock:
+            self._replace_executor(broken)
+
+    # A dead worker breaks the whole pool, which is replaced once for all the jobs that were on it
+    def _replace_executor(self, broken):
+        if broken is not None and broken is not self.executor:
+            return
+        logging.error("The worker pool crashed, starting a new one")
+        self.executor = self.new_executor()
+        if broken is not None:
+            broken.shutdown(wait=False)
+
+    def job_finished(self, record):
+        with self._lock:
+            self.active_jobs -= 1
+            self.completed_jobs += 1
+            record["backlog"] = self.active_jobs
+            self.metrics_writer.write(record)
+        logging.info(f"{record['operation']}: {record['status']} in {record['elapsed']}s "
+                     f"({record['input_bytes']} bytes in, {record['output_bytes']} bytes out)")
+
+    def status(self):
+        with self._lock:
+            return {"status": "ok", "workers": self.workers, "queue_size": self.queue_size,
+                    "active_jobs": self.active_jobs, "completed_jobs": self.completed_jobs}
+
+
+# Same server over a Unix domain socket (Linux/macOS)
+class UnixJobServer(JobServer):
+    address_family = getattr(socket, "AF_UNIX", None)
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        self.socket.bind(self.server_address)
+        self.server_name = "localhost"
+        self.server_port = 0
+
+
+if __name__ == "__main__":
+    # Argument parser setup
+    parser = argparse.ArgumentParser(description="Serve the PDF tools as HTTP endpoints on localhost or a Unix socket.")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Address to listen on. Default: 127.0.0.1.")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on. Default: 8765.")
+    parser.add_argument("--socket", type=str, default=None,
+                        help="Listen on this Unix socket path instead of TCP (Linux/macOS).")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                        help="Number of warm worker processes. Default: CPU count - 1.")
+    parser.add_argument("--queue-size", type=int, default=None,
+                        help="Maximum number of jobs running or waiting; further requests get 503. "
+                             "Default: 4 x workers.")
+    parser.add_argument("--max-upload-mb", type=int, default=512, help="Maximum upload size in MB. Default: 512.")
+    parser.add_argument("--path-root", type=str, default=None,
+                        help="Accept server-side input paths (?path=...) that resolve inside this folder. "
+                             "Default: disabled, inputs must be sent as the request body.")
+    parser.add_argument("--token", type=str, default=os.environ.get("PDF_SERVER_TOKEN"),
+                        help=f"Require this shared token in the {TOKEN_HEADER} header of every job. "
+                             "Default: the PDF_SERVER_TOKEN environment variable, if set.")
+    add_logging_arguments(parser)
+    args = parser.parse_args()
+
+    # Set up queued console and rotating file logging with program name as prefix in each log entry
+    setup_logging(f"{PROGRAM_NAME}: %(message)s", path_log, args)
+
+    if args.path_root and not os.path.isdir(args.path_root):
+        parser.error(f"--path-root is not a folder: {args.path_root}")
+    if args.socket and UnixJobServer.address_family is None:
+        parser.error("Unix sockets are not supported on this platform, use --host/--port")
+    queue_size = args.queue_size or 4 * args.workers
+
+    logging.info("Starting PDF Server")
+    logging.info(f"Timestamp: {timestamp}")
+    logging.info(f"Operations: {', '.join(sorted(JOBS))}")
+
+    # Warm worker pool whose logs are merged into this process's handlers
+    log_queue, listener = start_worker_log_listener()
+
+    def new_executor():
+        executor = ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker_logging,
+                                       initargs=(log_queue, logging.getLogger().level))
+        worker_pids = {future.result() for future in [executor.submit(_warm_up) for _ in range(args.workers)]}
+        logging.info(f"{len(worker_pids)} warm worker process(es) ready, queue size {queue_size}")
+        return executor
+
+    metrics_writer = metrics.MetricsWriter(path_metrics)
+    if args.socket:
+        server = UnixJobServer(args.socket, new_executor, args.workers, queue_size, args.max_upload_mb,
+                               metrics_writer, args.path_root, args.token)
+        logging.info(f"Listening on unix socket {args.socket}")
+    else:
+        server = JobServer((args.host, args.port), new_executor, args.workers, queue_size, args.max_upload_mb,
+                           metrics_writer, args.path_root, args.token)
+        logging.info(f"Listening on http://{args.host}:{server.server_port}")
+
+    # SIGTERM stops accepting requests; running jobs are finished before exiting
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        logging.info("Shutting down, finishing running jobs")
+        server.server_close()
+        server.executor.shutdown(wait=True)
+        listener.stop()
+        summary = metrics_writer.close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+    logging.info(f"PDF Server stopped after {summary['files']} successful job(s)")
@@ -0,0 +1,9 @@
+call activate sandbox
+:: Sample inputs: a text-heavy and a scanned PDF generated by the benchmark corpus generator
+python ../benchmarks/scripts/generate_corpus.py --corpus text-heavy,scanned
+if not exist input mkdir input
+copy /Y ..\benchmarks\corpus\text-heavy\text-heavy_00001.pdf input\
+copy /Y ..\benchmarks\corpus\scanned\scanned_00001.pdf input\
+python scripts/pipeline_pdf.py --steps "repair,rotate,add_page_numbers,compress" --rotate 90 --img-quality 80
+::python scripts/pipeline_pdf.py --steps "add_image_watermark,compress,encrypt" --watermark-path ../add-watermark-to-pdf/input/watermark-sample1.png --password samplepassword
+PAUSE
\ No newline at end of file
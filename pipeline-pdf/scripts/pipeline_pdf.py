@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+
+# ==============================================================================
+#   Author: João Manoel Feck
+#   Email: joaomfeck@gmail.com
+#   GitHub: https://github.com/jmfeck
+# ==============================================================================
+
+import os
+import sys
+import logging
+import argparse
+import lazypdf as lz
+from datetime import datetime
+from functools import partial
+
+# Program name for log prefix
+PROGRAM_NAME = "PDF Pipeline"
+
+# Set up timestamp
+timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+# Folder and file paths
+input_foldername = 'input'
+output_foldername = 'output'
+log_foldername = 'logs'
+log_filename = f"{timestamp}_log.log"
+metrics_filename = f"{timestamp}_metrics.jsonl"
+
+# Define paths
+path_script = os.path.realpath(__file__)
+path_project = os.path.dirname(os.path.dirname(path_script))
+path_input = os.path.join(path_project, input_foldername)
+path_output = os.path.join(path_project, output_foldername)
+path_log_folder = os.path.join(path_project, log_foldername)
+path_log = os.path.join(path_log_folder, log_filename)
+path_metrics = os.path.join(path_log_folder, metrics_filename)
+
+# Make the shared modules in the repository root importable
+sys.path.insert(0, os.path.dirname(path_project))
+from common import metrics
+from common.batch_runner import add_batch_arguments, run_batch
+from common.discovery import add_discovery_arguments, discover_files, input_filter_from_args, output_folder_for
+from common.logging_setup import setup_logging
+from common.operations import OPERATIONS, parse_steps, run_steps
+
+
+# Run every step on a single in-memory document and write it once (runs inside a worker process when --workers > 1)
+def run_pipeline_on_file(pdf_file, timestamp, steps, options):
+    pdf_path = os.path.join(path_input, pdf_file)
+    logging.info(f"Processing file: {pdf_file}")
+
+    output_folder = output_folder_for(path_output, pdf_file)
+    output_filename = f"{timestamp}_{os.path.basename(pdf_file).split('.')[0]}_pipeline.pdf"
+    output_path = os.path.join(output_folder, output_filename)
+
+    with metrics.stage("read"):
+        pdf = lz.read(pdf_path)
+    metrics.record(pages=pdf.page_count)
+
+    pdf = run_steps(pdf, steps, options)
+
+    with metrics.stage("write"):
+        pdf.to_pdf(output_path)
+
+    stages = [f"{name} {seconds:.3f}s" for name, seconds in metrics.stage_times().items()]
+    logging.info(f"  - Stage times: {', '.join(stages)}")
+    logging.info(f"Pipeline output saved to {output_filename}")
+    return output_path
+
+
+if __name__ == "__main__":
+    # Argument parser setup, reusing the option names of the individual tools
+    parser = argparse.ArgumentParser(description="Apply several operations to PDF files in a single pass.")
+    parser.add_argument("--steps", type=str, required=True,
+                        help=f"Comma-separated operations applied in order, e.g. 'repair,rotate,add_page_numbers,compress'. "
+                             f"Options: {', '.join(OPERATIONS)}")
+    parser.add_argument("--engine", type=str, choices=["pymupdf", "pikepdf", "auto"], default="auto",
+                        help="repair: repair engine (default: auto)")
+    parser.add_argument("--rotate", type=int, choices=[90, 180, 270], default=90,
+                        help="rotate: rotation in degrees (default: 90)")
+    parser.add_argument("--size", type=str, choices=["a4", "a3", "letter", "legal"], default="a4",
+                        help="resize: target page size (default: a4)")
+    parser.add_argument("--position", type=str, choices=["top-left", "top-right", "bottom-left", "bottom-right"],
+                        default="bottom-right", help="add_page_numbers: position of the page numbers (default: bottom-right)")
+    parser.add_argument("--watermark-path", type=str, default=None,
+                        help="add_image_watermark: path to the image watermark file")
+    parser.add_argument("--watermark-transparency", type=float, default=0.5,
+                        help="add_image_watermark: transparency level of the watermark (0.0 to 1.0, default: 0.5)")
+    parser.add_argument("--img-quality", type=int, default=None,
+                        help="compress: quality level for image recompression (1-100). Omit to skip image compression.")
+    parser.add_argument("--compression-level", type=int, default=5, choices=range(1, 10),
+                        help="compress: deflate compression level for content streams (1-9, default: 5)")
+    parser.add_argument("--password", type=str, default=None,
+                        help="encrypt: password for the output PDF files")
+    parser.add_argument("--algorithm", type=str, default="AES-256-R5",
+                        choices=["AES-256-R5", "AES-256", "AES-128", "RC4-128", "RC4-40"],
+                        help="encrypt: encryption algorithm (default: AES-256-R5)")
+    add_discovery_arguments(parser, ["*.pdf"])
+    add_batch_arguments(parser)
+    args = parser.parse_args()
+
+    # Set up queued console and rotating file logging with program name as prefix in each log entry
+    setup_logging(f"{PROGRAM_NAME}: %(message)s", path_log, args)
+
+    try:
+        steps = parse_steps(args.steps)
+    except ValueError as e:
+        parser.error(str(e))
+
+    options = {
+        "engine": args.engine,
+        "rotate": args.rotate,
+        "size": args.size,
+        "position": args.position,
+        "watermark_path": os.path.abspath(args.watermark_path) if args.watermark_path else None,
+        "watermark_transparency": args.watermark_transparency,
+        "img_quality": args.img_quality,
+        "compression_level": args.compression_level,
+        "password": args.password,
+        "algorithm": args.algorithm,
+    }
+    if "add_image_watermark" in steps and not args.watermark_path:
+        parser.error("the add_image_watermark step requires --watermark-path")
+    if "encrypt" in steps and not args.password:
+        parser.error("the encrypt step requires --password")
+
+    logging.info("Starting PDF Pipeline Process")
+    logging.info(f"Timestamp: {timestamp}")
+    logging.info(f"Input folder: {path_input}")
+    logging.info(f"Output folder: {path_output}")
+    logging.info(f"Steps: {' -> '.join(steps)}")
+    logging.info("Searching for PDF files in the input folder...")
+
+    # Stream the matching files, processing starts while the input folder is still being scanned
+    input_filter = input_filter_from_args(args)
+    input_pdf_files = discover_files(path_input, input_filter, recursive=args.recursive)
+
+    # Process each PDF file
+    summary = run_batch(partial(run_pipeline_on_file, timestamp=timestamp, steps=steps, options=options),
+                        input_pdf_files, args, path_input, path_output,
+                        path_metrics=path_metrics, file_filter=input_filter)
+
+    # Check if there were any PDF files to process
+    if not summary.results and not args.watch:
+        logging.warning("No PDF files found in the input folder. Exiting.")
+        sys.exit()
+
+    logging.info("PDF Pipeline Process Completed Successfully")
+    logging.info(f"Total PDF files processed: {len(summary.results)}")
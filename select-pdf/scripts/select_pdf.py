@@ -7,11 +7,14 @@
 # ==============================================================================
 
 import os
+import csv
 import sys
+import hashlib
 import logging
 import argparse
-import lazypdf as lz
+import pymupdf
 from datetime import datetime
+from functools import partial
 
 # Program name for log prefix
 PROGRAM_NAME = "PDF Page Selector"
@@ -24,6 +27,7 @@ input_foldername = 'input'
 output_foldername = 'output'
 log_foldername = 'logs'
 log_filename = f"{timestamp}_log.log"
+metrics_filename = f"{timestamp}_metrics.jsonl"
 
 # Define paths
 path_script = os.path.realpath(__file__)
@@ -32,68 +36,147 @@ path_input = os.path.join(path_project, input_foldername)
 path_output = os.path.join(path_project, output_foldername)
 path_log_folder = os.path.join(path_project, log_foldername)
 path_log = os.path.join(path_log_folder, log_filename)
-
-# Set up logging with program name as prefix in each log entry
-os.makedirs(path_log_folder, exist_ok=True)
-log_format = f"{PROGRAM_NAME}: %(message)s"
-logging.basicConfig(level=logging.DEBUG, format=log_format)
-
-# Configure file handler with the same format
-file_handler = logging.FileHandler(path_log)
-file_handler.setFormatter(logging.Formatter(log_format))
-logging.getLogger().addHandler(file_handler)
-
-# Argument parser setup
-parser = argparse.ArgumentParser(description="Select specific pages from PDF files and save them individually.")
-parser.add_argument("--pages", type=str, required=True,
-                    help="Page ranges to select, e.g., '1-3,5,7-9'.")
-args = parser.parse_args()
-
-logging.info("Starting PDF Page Selection Process")
-logging.info(f"Timestamp: {timestamp}")
-logging.info(f"Input folder: {path_input}")
-logging.info(f"Output folder: {path_output}")
-logging.info(f"Page ranges: {args.pages}")
-logging.info("Searching for PDF files in the input folder...")
-
-# Parse page ranges (1-indexed, matching lazypdf convention)
-def parse_page_ranges(page_ranges):
-    pages = []
-    for part in page_ranges.split(','):
-        if '-' in part:
-            start, end = map(int, part.split('-'))
-            pages.extend(range(start, end + 1))
-        else:
-            pages.append(int(part))
-    return sorted(set(pages))
-
-page_numbers = parse_page_ranges(args.pages)
-
-# List and count PDF files
-input_pdf_files = [f for f in os.listdir(path_input) if f.endswith(".pdf")]
-input_num_pdfs = len(input_pdf_files)
-logging.info(f"Found {input_num_pdfs} PDF file(s) to process.")
-
-# Check if there are any PDF files to process
-if not input_pdf_files:
-    logging.warning("No PDF files found in the input folder. Exiting.")
-    sys.exit()
-
-# Process each PDF file individually
-for pdf_file in input_pdf_files:
+path_metrics = os.path.join(path_log_folder, metrics_filename)
+
+# Make the shared modules in the repository root importable
+sys.path.insert(0, os.path.dirname(path_project))
+from common import metrics
+from common.batch_runner import add_batch_arguments, run_batch
+from common.discovery import add_discovery_arguments, discover_files, input_filter_from_args, output_folder_for
+from common.logging_setup import setup_logging
+from common.page_ranges import format_ranges, iter_pages, parse_page_ranges, ranges_out_of_range
+from common.page_subset import write_part
+
+# Manifests already read by this process, by path
+_manifests = {}
+
+
+# Read a page-selection manifest: a CSV file with a "filename" and a "pages" column, e.g.
+# report.pdf,"1-3,5". Filenames are relative to the input folder; a bare filename also matches
+# that file in any subfolder. Returns {filename: page ranges}; read once per process.
+def load_manifest(manifest_path):
+    selections = _manifests.get(manifest_path)
+    if selections is None:
+        selections = {}
+        with open(manifest_path, newline="", encoding="utf-8-sig") as manifest_file:
+            reader = csv.DictReader(manifest_file)
+            missing_columns = {"filename", "pages"} - set(reader.fieldnames or [])
+            if missing_columns:
+                raise ValueError(f"{manifest_path} has no {', '.join(sorted(missing_columns))} column")
+            for row in reader:
+                filename = (row["filename"] or "").strip().replace("\\", "/")
+                if not filename:
+                    continue
+                try:
+                    selections[filename] = parse_page_ranges(row["pages"] or "")
+                except ValueError as e:
+                    raise ValueError(f"{manifest_path}, line {reader.line_num}: {e}") from None
+        _manifests[manifest_path] = selections
+    return selections
+
+
+# Page ranges to select from a file: its manifest entry, else the --pages ranges (None if neither)
+def selection_for(pdf_file, page_ranges, manifest_path):
+    if manifest_path:
+        selections = load_manifest(manifest_path)
+        relative_name = pdf_file.replace(os.sep, "/")
+        selection = selections.get(relative_name, selections.get(os.path.basename(relative_name)))
+        if selection is not None:
+            return selection
+    return page_ranges
+
+
+# Select the pages of a single PDF file (runs inside a worker process when --workers > 1)
+def select_pages_from_file(pdf_file, timestamp, page_ranges, manifest_path, compress):
     pdf_path = os.path.join(path_input, pdf_file)
     logging.info(f"Processing file: {pdf_file}")
 
-    try:
-        os.makedirs(path_output, exist_ok=True)
-        output_filename = f"{timestamp}_{pdf_file.split('.')[0]}_selected_pages.pdf"
-        output_path = os.path.join(path_output, output_filename)
-
-        lz.read(pdf_path).extract_pages(page_numbers).compress().to_pdf(output_path)
-        logging.info(f"Selected pages saved to {output_filename}")
+    selection = selection_for(pdf_file, page_ranges, manifest_path)
+    if selection is None:
+        raise ValueError("The file is not in the manifest and no --pages were given")
 
-    except Exception as e:
-        logging.error(f"Failed to process {pdf_file} - {e}")
+    output_folder = output_folder_for(path_output, pdf_file)
+    output_filename = f"{timestamp}_{os.path.basename(pdf_file).split('.')[0]}_selected_pages.pdf"
+    output_path = os.path.join(output_folder, output_filename)
 
-logging.info("PDF Page Selection Process Completed Successfully")
-logging.info(f"Total PDF files processed: {input_num_pdfs}")
+    # Only the objects reachable from the selected pages are copied; the rest of the source is
+    # never written, so no compress pass is needed to shed it
+    with metrics.stage("read"):
+        source = pymupdf.open(pdf_path)
+    metrics.record(pages=source.page_count)
+    try:
+        for missing_range in ranges_out_of_range(selection, source.page_count):
+            logging.warning(f"  - Pages {format_ranges([missing_range])} are out of range for {pdf_file}")
+        page_numbers = list(iter_pages(selection, source.page_count))
+        if not page_numbers:
+            raise ValueError(f"None of the pages {format_ranges(selection)} exist in the document")
+        write_part(source, page_numbers, output_path, compress=compress)
+    finally:
+        source.close()
+    logging.info(f"Selected pages saved to {output_filename}")
+    return output_path
+
+
+if __name__ == "__main__":
+    # Argument parser setup
+    parser = argparse.ArgumentParser(description="Select specific pages from PDF files and save them individually.")
+    parser.add_argument("--pages", type=str,
+                        help="Page ranges to select, e.g., '1-3,5,7-9'. Used for the files not listed in --manifest.")
+    parser.add_argument("--manifest", type=str,
+                        help="CSV file with a 'filename' and a 'pages' column giving the pages to select from each "
+                             "file, e.g., report.pdf,\"1-3,5\". With no --pages, only the listed files are processed.")
+    parser.add_argument("--compress", action="store_true",
+                        help="Also compress the output files (slower). By default, the selected pages are copied "
+                             "as they are, without the objects only the other pages used.")
+    add_discovery_arguments(parser, ["*.pdf"])
+    add_batch_arguments(parser)
+    args = parser.parse_args()
+
+    # The selections are validated before any file is processed
+    if not args.pages and not args.manifest:
+        parser.error("one of the arguments --pages --manifest is required")
+    try:
+        page_ranges = parse_page_ranges(args.pages) if args.pages else None
+        manifest_path = os.path.abspath(args.manifest) if args.manifest else None
+        selections = load_manifest(manifest_path) if manifest_path else {}
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    if manifest_path:
+        # Editing the manifest changes the outputs, so its content is part of the --incremental key
+        with open(manifest_path, "rb") as manifest_file:
+            args.manifest_sha256 = hashlib.sha256(manifest_file.read()).hexdigest()
+
+    # Set up queued console and rotating file logging with program name as prefix in each log entry
+    setup_logging(f"{PROGRAM_NAME}: %(message)s", path_log, args)
+
+    logging.info("Starting PDF Page Selection Process")
+    logging.info(f"Timestamp: {timestamp}")
+    logging.info(f"Input folder: {path_input}")
+    logging.info(f"Output folder: {path_output}")
+    if args.pages:
+        logging.info(f"Page ranges: {args.pages}")
+    if manifest_path:
+        logging.info(f"Manifest: {manifest_path} ({len(selections)} file(s))")
+    logging.info("Searching for PDF files in the input folder...")
+
+    # Stream the matching files, processing starts while the input folder is still being scanned
+    input_filter = input_filter_from_args(args)
+    input_pdf_files = discover_files(path_input, input_filter, recursive=args.recursive)
+    if page_ranges is None:
+        # Without --pages, the files missing from the manifest have nothing to select
+        input_pdf_files = (pdf_file for pdf_file in input_pdf_files
+                           if selection_for(pdf_file, None, manifest_path) is not None)
+
+    # Process each PDF file individually
+    summary = run_batch(partial(select_pages_from_file, timestamp=timestamp, page_ranges=page_ranges,
+                                manifest_path=manifest_path, compress=args.compress),
+                        input_pdf_files, args, path_input, path_output,
+                        path_metrics=path_metrics, file_filter=input_filter)
+
+    # Check if there were any PDF files to process
+    if not summary.results and not args.watch:
+        logging.warning("No PDF files found in the input folder. Exiting.")
+        sys.exit()
+
+    logging.info("PDF Page Selection Process Completed Successfully")
+    logging.info(f"Total PDF files processed: {len(summary.results)}")
@@ -10,8 +10,9 @@ import os
 import sys
 import logging
 import argparse
-import lazypdf as lz
+import pymupdf
 from datetime import datetime
+from functools import partial
 
 # Program name for log prefix
 PROGRAM_NAME = "PDF Splitter"
@@ -24,6 +25,7 @@ input_foldername = 'input'
 output_foldername = 'output'
 log_foldername = 'logs'
 log_filename = f"{timestamp}_log.log"
+metrics_filename = f"{timestamp}_metrics.jsonl"
 
 # Define paths
 path_script = os.path.realpath(__file__)
@@ -32,73 +34,118 @@ path_input = os.path.join(path_project, input_foldername)
 path_output = os.path.join(path_project, output_foldername)
 path_log_folder = os.path.join(path_project, log_foldername)
 path_log = os.path.join(path_log_folder, log_filename)
+path_metrics = os.path.join(path_log_folder, metrics_filename)
 
-# Set up logging with program name as prefix in each log entry
-os.makedirs(path_log_folder, exist_ok=True)
-log_format = f"{PROGRAM_NAME}: %(message)s"
-logging.basicConfig(level=logging.DEBUG, format=log_format)
-
-# Configure file handler with the same format
-file_handler = logging.FileHandler(path_log)
-file_handler.setFormatter(logging.Formatter(log_format))
-logging.getLogger().addHandler(file_handler)
-
-# Argument parser setup
-parser = argparse.ArgumentParser(description="Split PDF files into separate files based on specified page ranges.")
-parser.add_argument("--pages", type=str, required=True,
-                    help="Page ranges to split, e.g., '1-3,5,7-9'. Each page becomes a separate file.")
-args = parser.parse_args()
-
-logging.info("Starting PDF Splitting Process")
-logging.info(f"Timestamp: {timestamp}")
-logging.info(f"Input folder: {path_input}")
-logging.info(f"Output folder: {path_output}")
-logging.info(f"Page ranges: {args.pages}")
-logging.info("Searching for PDF files in the input folder...")
-
-# Parse page ranges (1-indexed, matching lazypdf convention)
-def parse_page_ranges(page_ranges):
-    pages = []
-    for part in page_ranges.split(','):
-        if '-' in part:
-            start, end = map(int, part.split('-'))
-            pages.extend(range(start, end + 1))
-        else:
-            pages.append(int(part))
-    return sorted(set(pages))
-
-page_numbers = parse_page_ranges(args.pages)
-
-# List and count PDF files
-input_pdf_files = [f for f in os.listdir(path_input) if f.endswith(".pdf")]
-input_num_pdfs = len(input_pdf_files)
-logging.info(f"Found {input_num_pdfs} PDF file(s) to process.")
-
-# Check if there are any PDF files to process
-if not input_pdf_files:
-    logging.warning("No PDF files found in the input folder. Exiting.")
-    sys.exit()
-
-# Process each PDF file
-for pdf_file in input_pdf_files:
+# Make the shared modules in the repository root importable
+sys.path.insert(0, os.path.dirname(path_project))
+from common import metrics
+from common.batch_runner import add_batch_arguments, run_batch
+from common.discovery import add_discovery_arguments, discover_files, input_filter_from_args, output_folder_for
+from common.logging_setup import setup_logging
+from common.metrics import parse_byte_size
+from common.page_ranges import duplicate_ranges, format_ranges, parse_page_ranges, ranges_out_of_range
+from common.page_subset import split_parts, write_part
+
+
+# Label of a part of consecutive pages: "page 5" for a single page, "pages 1-50" for several
+def part_label(part):
+    return f"page {part[0]}" if len(part) == 1 else f"pages {part[0]}-{part[-1]}"
+
+
+# Split a single PDF file into parts (runs inside a worker process when --workers > 1)
+def split_pdf_file(pdf_file, timestamp, split_mode):
     pdf_path = os.path.join(path_input, pdf_file)
     logging.info(f"Processing file: {pdf_file}")
 
+    output_folder = output_folder_for(path_output, pdf_file)
+    # The source is opened once and every part is copied from it with only the objects it uses
+    with metrics.stage("read"):
+        source = pymupdf.open(pdf_path)
+    metrics.record(pages=source.page_count)
+    output_paths = []
+
+    try:
+        requested_ranges = split_mode.get("pages") or split_mode.get("groups") or []
+        for missing_range in ranges_out_of_range(requested_ranges, source.page_count):
+            logging.warning(f"  - Pages {format_ranges([missing_range])} are out of range for {pdf_file}")
+
+        # Parts are generated one at a time, so huge ranges are never expanded up front
+        for part in split_parts(source, **split_mode):
+            part_name = part_label(part).replace(' ', '_')
+            output_filename = f"{timestamp}_{os.path.basename(pdf_file).split('.')[0]}_{part_name}.pdf"
+            output_path = os.path.join(output_folder, output_filename)
+            write_part(source, part, output_path)
+            logging.info(f"  - Saved {part_label(part)} as {output_filename}")
+            output_paths.append(output_path)
+    finally:
+        source.close()
+
+    return output_paths
+
+
+if __name__ == "__main__":
+    # Argument parser setup
+    parser = argparse.ArgumentParser(description="Split PDF files into separate files by page ranges, number of pages or file size.")
+    split_modes = parser.add_mutually_exclusive_group(required=True)
+    split_modes.add_argument("--pages", type=str,
+                             help="Page ranges to split, e.g., '1-3,5,7-9'. Each page becomes a separate file.")
+    split_modes.add_argument("--groups", type=str,
+                             help="Page ranges, e.g., '1-10,11-20'. Each range becomes a separate file.")
+    split_modes.add_argument("--every", type=int, metavar="N",
+                             help="Split every PDF into files of N pages.")
+    split_modes.add_argument("--max-bytes", type=parse_byte_size, metavar="SIZE",
+                             help="Split every PDF into files of consecutive pages of at most about SIZE bytes, "
+                                  "e.g., 25M. Sizes are estimated from the objects the pages use; a single page "
+                                  "larger than SIZE gets its own file.")
+    add_discovery_arguments(parser, ["*.pdf"])
+    add_batch_arguments(parser)
+    args = parser.parse_args()
+
+    # Only the range bounds are parsed here; the pages are generated per file while splitting
     try:
-        os.makedirs(path_output, exist_ok=True)
-        pdf = lz.read(pdf_path)
-
-        for page_num in page_numbers:
-            if page_num <= pdf.page_count:
-                output_filename = f"{timestamp}_{pdf_file.split('.')[0]}_page_{page_num}.pdf"
-                output_path = os.path.join(path_output, output_filename)
-                pdf.copy().extract_pages([page_num]).compress().to_pdf(output_path)
-                logging.info(f"  - Saved page {page_num} as {output_filename}")
-            else:
-                logging.warning(f"  - Page {page_num} is out of range for {pdf_file}")
-
-    except Exception as e:
-        logging.error(f"Failed to process {pdf_file} - {e}")
-
-logging.info("PDF Splitting Process Completed Successfully")
-logging.info(f"Total PDF files processed: {input_num_pdfs}")
+        page_ranges = parse_page_ranges(args.pages or args.groups) if args.pages or args.groups else None
+    except ValueError as error:
+        parser.error(str(error))
+    # Each group is saved under its page range, so a repeated group would overwrite its own file
+    if args.groups and duplicate_ranges(page_ranges):
+        parser.error(f"--groups lists {format_ranges(duplicate_ranges(page_ranges))} more than once")
+    if (args.every is not None and args.every < 1) or (args.max_bytes is not None and args.max_bytes < 1):
+        parser.error("--every and --max-bytes must be positive")
+
+    # Set up queued console and rotating file logging with program name as prefix in each log entry
+    setup_logging(f"{PROGRAM_NAME}: %(message)s", path_log, args)
+
+    logging.info("Starting PDF Splitting Process")
+    logging.info(f"Timestamp: {timestamp}")
+    logging.info(f"Input folder: {path_input}")
+    logging.info(f"Output folder: {path_output}")
+    if args.pages:
+        logging.info(f"Page ranges: {args.pages}")
+        split_mode = {"pages": page_ranges}
+    elif args.groups:
+        logging.info(f"Page groups: {args.groups}")
+        split_mode = {"groups": page_ranges}
+    elif args.every:
+        logging.info(f"Pages per file: {args.every}")
+        split_mode = {"every": args.every}
+    else:
+        logging.info(f"Maximum file size: {args.max_bytes} bytes")
+        split_mode = {"max_bytes": args.max_bytes}
+    logging.info("Searching for PDF files in the input folder...")
+
+    # Stream the matching files, processing starts while the input folder is still being scanned
+    input_filter = input_filter_from_args(args)
+    input_pdf_files = discover_files(path_input, input_filter, recursive=args.recursive)
+
+    # Process each PDF file
+    summary = run_batch(partial(split_pdf_file, timestamp=timestamp, split_mode=split_mode),
+                        input_pdf_files, args, path_input, path_output,
+                        path_metrics=path_metrics, file_filter=input_filter)
+
+    # Check if there were any PDF files to process
+    if not summary.results and not args.watch:
+        logging.warning("No PDF files found in the input folder. Exiting.")
+        sys.exit()
+
+    logging.info("PDF Splitting Process Completed Successfully")
+    logging.info(f"Total PDF files processed: {len(summary.results)}")